@@ -0,0 +1,240 @@
+# Opt-in SPI/I2C traffic counters for the display drivers
+#
+# BusTrace stands in for the machine.SPI or machine.I2C object a driver
+# talks through. Every transfer is forwarded unchanged and counted:
+# transactions, bytes, time on the call (ticks_us) and a histogram of
+# transfer sizes in power-of-two buckets. attach() swaps a trace in for a
+# driver's bus and CS pin after the fact and times the named driver
+# methods, filing both their total time and the bus time spent inside
+# them:
+#
+#   import bus_trace
+#   bus_trace.attach(display, "ILI9341", ("_tx_window", "show"))
+#   ...
+#   >>> bus_trace.report()       # from the REPL
+#   >>> bus_trace.reset()
+#
+# Tracing off means attach() is never called: the driver keeps the bare
+# bus and pays nothing. The sketches guard it with BUS_TRACE.
+import utime
+
+# Transfer size buckets: 1, 2-3, 4-7, ... and everything from 16384 up.
+SIZE_BUCKETS = 16
+
+_traces = []
+
+
+def _bucket(n):
+    b = 0
+    while n > 1 and b < SIZE_BUCKETS - 1:
+        n >>= 1
+        b += 1
+    return b
+
+
+def _bucket_label(b):
+    lo = 1 << b
+    if b == SIZE_BUCKETS - 1:
+        return "%d+" % lo
+    if b == 0:
+        return "1"
+    return "%d-%d" % (lo, 2 * lo - 1)
+
+
+class BusTrace:
+    # Wraps an SPI or I2C bus object. Transfers go through the methods
+    # below; anything else (init, scan, deinit...) falls through to the
+    # real bus uncounted.
+    def __init__(self, bus, name="bus"):
+        self._bus = bus
+        self.name = name
+        self.sizes = [0] * SIZE_BUCKETS
+        # Driver method name -> [calls, us, us on the bus].
+        self.methods = {}
+        self.reset()
+        _traces.append(self)
+
+    def reset(self):
+        self.transactions = 0
+        self.bytes = 0
+        self.us = 0
+        self.errors = 0
+        self.cs_toggles = 0
+        for b in range(SIZE_BUCKETS):
+            self.sizes[b] = 0
+        # Zeroed in place: the method wrappers hold these lists.
+        for stats in self.methods.values():
+            stats[0] = stats[1] = stats[2] = 0
+
+    def __getattr__(self, name):
+        return getattr(self._bus, name)
+
+    def _count(self, n, t0):
+        self.us += utime.ticks_diff(utime.ticks_us(), t0)
+        self.transactions += 1
+        self.bytes += n
+        self.sizes[_bucket(n)] += 1
+
+    def _call(self, n, fn, *args):
+        t0 = utime.ticks_us()
+        try:
+            result = fn(*args)
+        except OSError:
+            self.errors += 1
+            raise
+        self._count(n, t0)
+        return result
+
+    # SPI
+    def write(self, buf):
+        return self._call(len(buf), self._bus.write, buf)
+
+    def read(self, nbytes, write=0x00):
+        return self._call(nbytes, self._bus.read, nbytes, write)
+
+    def readinto(self, buf, write=0x00):
+        return self._call(len(buf), self._bus.readinto, buf, write)
+
+    def write_readinto(self, write_buf, read_buf):
+        return self._call(len(write_buf), self._bus.write_readinto, write_buf, read_buf)
+
+    # I2C
+    def writeto(self, addr, buf, stop=True):
+        return self._call(len(buf), self._bus.writeto, addr, buf, stop)
+
+    def writevto(self, addr, vector, stop=True):
+        n = 0
+        for buf in vector:
+            n += len(buf)
+        return self._call(n, self._bus.writevto, addr, vector, stop)
+
+    def readfrom(self, addr, nbytes, stop=True):
+        return self._call(nbytes, self._bus.readfrom, addr, nbytes, stop)
+
+    def readfrom_into(self, addr, buf, stop=True):
+        return self._call(len(buf), self._bus.readfrom_into, addr, buf, stop)
+
+    def writeto_mem(self, addr, memaddr, buf, addrsize=8):
+        return self._call(len(buf), self._bus.writeto_mem, addr, memaddr, buf, addrsize)
+
+    def readfrom_mem(self, addr, memaddr, nbytes, addrsize=8):
+        return self._call(
+            nbytes, self._bus.readfrom_mem, addr, memaddr, nbytes, addrsize
+        )
+
+    def readfrom_mem_into(self, addr, memaddr, buf, addrsize=8):
+        return self._call(
+            len(buf), self._bus.readfrom_mem_into, addr, memaddr, buf, addrsize
+        )
+
+    def pin(self, pin):
+        # A chip-select pin whose level changes count as CS toggles here.
+        return TracePin(pin, self)
+
+    def watch(self, obj, *names):
+        # Rebinds each named method on obj (the instance, not its class)
+        # to a timed wrapper.
+        for name in names:
+            setattr(obj, name, self._timed(name, getattr(obj, name)))
+
+    def _timed(self, name, fn):
+        stats = self.methods.get(name)
+        if stats is None:
+            stats = self.methods[name] = [0, 0, 0]
+
+        def timed(*args):
+            t0 = utime.ticks_us()
+            bus0 = self.us
+            result = fn(*args)
+            stats[0] += 1
+            stats[1] += utime.ticks_diff(utime.ticks_us(), t0)
+            stats[2] += self.us - bus0
+            return result
+
+        return timed
+
+    def dump(self):
+        print(
+            "%s: %d transactions, %d bytes, %d us on the bus, %d CS toggles, %d errors"
+            % (
+                self.name,
+                self.transactions,
+                self.bytes,
+                self.us,
+                self.cs_toggles,
+                self.errors,
+            )
+        )
+        if self.transactions:
+            print(
+                "  sizes:",
+                " ".join(
+                    "%s:%d" % (_bucket_label(b), n)
+                    for b, n in enumerate(self.sizes)
+                    if n
+                ),
+            )
+        for name in sorted(self.methods):
+            calls, us, bus_us = self.methods[name]
+            if calls:
+                print(
+                    "  %s: %d calls, %d us (%d us/call), %d us on the bus"
+                    % (name, calls, us, us // calls, bus_us)
+                )
+
+
+class TracePin:
+    # Wraps a CS pin; every change of level counts as a toggle.
+    def __init__(self, pin, trace):
+        self._pin = pin
+        self._trace = trace
+        self._level = None
+
+    def __getattr__(self, name):
+        return getattr(self._pin, name)
+
+    def _set(self, v):
+        v = 1 if v else 0
+        if v != self._level:
+            self._level = v
+            self._trace.cs_toggles += 1
+        self._pin(v)
+
+    def __call__(self, v=None):
+        if v is None:
+            return self._pin()
+        self._set(v)
+
+    def value(self, v=None):
+        return self.__call__(v)
+
+    def on(self):
+        self._set(1)
+
+    def off(self):
+        self._set(0)
+
+
+def attach(driver, name, methods=()):
+    # Puts a trace on driver's spi or i2c (and its cs pin, if any) and
+    # times the named methods. Returns the trace.
+    if getattr(driver, "spi", None) is not None:
+        trace = BusTrace(driver.spi, name)
+        driver.spi = trace
+    else:
+        trace = BusTrace(driver.i2c, name)
+        driver.i2c = trace
+    if getattr(driver, "cs", None) is not None:
+        driver.cs = trace.pin(driver.cs)
+    trace.watch(driver, *methods)
+    return trace
+
+
+def report():
+    for trace in _traces:
+        trace.dump()
+
+
+def reset():
+    for trace in _traces:
+        trace.reset()
@@ -0,0 +1,284 @@
+# 2-bit chain code for cursor strokes
+#
+# Every drawn point is one unit step from the one before, so a stroke is a
+# start point followed by turns. Each step costs one 2-bit symbol, relative
+# to the current heading:
+#
+#   0  ahead      1  turn to dir + 1      2  turn to dir - 1      3  escape
+#
+# Headings are 0 +x, 1 +y, 2 -x, 3 -y, starting at +x. An escape is
+# followed by one more symbol:
+#
+#   0  reverse (one step back the way it came)
+#   1  run: RUN_MIN + n steps ahead, n as a varint
+#   2  time: the following steps are n ms later, n as a varint
+#   3  end of block
+#
+# A varint is 3-bit groups, low group first, each sent as two symbols with
+# bit 3 set when another group follows. Symbols are packed four to a byte,
+# first symbol in the low bits.
+#
+# A stroke file is MAGIC, width and height (<HH), then blocks, each a
+# length (<H) followed by BLOCK_HEAD and codes.
+#
+# Draw times are kept to time_ms: a time escape is only written once the
+# clock has moved that far, so a knob turned steadily costs about one
+# escape per time_ms instead of one per step.
+import struct
+
+MAGIC = b"PSK1"
+BLOCK_HEAD = "<HHI"  # start x, y and draw time of a block
+BLOCK_HEAD_BYTES = 8
+RUN_MIN = 6
+TIME_MS = 250
+
+_AHEAD = 0
+_TURN_UP = 1
+_TURN_DOWN = 2
+_ESC = 3
+_REVERSE = 0
+_RUN = 1
+_TIME = 2
+_END = 3
+
+# Symbols a single step() may need in the worst case: a pending run, a
+# time escape, the step itself and the end marker.
+_RESERVE = 2 + 22 + 2 + 22 + 2 + 2
+
+_DX = (1, 0, -1, 0)
+_DY = (0, 1, 0, -1)
+
+
+def heading(dx, dy):
+    # Heading of a unit step, or -1 when (dx, dy) is not one.
+    if dy == 0:
+        if dx == 1:
+            return 0
+        if dx == -1:
+            return 2
+    elif dx == 0:
+        if dy == 1:
+            return 1
+        if dy == -1:
+            return 3
+    return -1
+
+
+class ChainEncoder:
+    # Encodes one block at a time into a caller's buffer. begin() takes the
+    # start point (stored by the caller, e.g. as BLOCK_HEAD), step() adds
+    # the next point and finish() closes the block. step() returns False,
+    # writing nothing, when the point is not a unit step, time went
+    # backwards or the block is full; the caller then finishes this block
+    # and begins the next one at that point.
+    def __init__(self, time_ms=TIME_MS):
+        self.time_ms = time_ms
+        self._buf = None
+        self._at = 0
+        self._limit = 0
+        self._n = 0
+        self.x = 0
+        self.y = 0
+        self.t = 0
+        self._sent_t = 0
+        self._dir = 0
+        self._run = 0
+        self.steps = 0
+
+    def begin(self, buf, offset, size, x, y, t=0):
+        self._buf = buf
+        self._at = offset
+        self._limit = 4 * size - _RESERVE
+        self._n = 0
+        self.x = x
+        self.y = y
+        self.t = t
+        self._sent_t = t
+        self._dir = 0
+        self._run = 0
+        self.steps = 0
+
+    def _put(self, sym):
+        n = self._n
+        i = self._at + (n >> 2)
+        if n & 3:
+            self._buf[i] |= sym << ((n & 3) << 1)
+        else:
+            self._buf[i] = sym
+        self._n = n + 1
+
+    def _varint(self, v):
+        while True:
+            g = v & 7
+            v >>= 3
+            if v:
+                g |= 8
+            self._put(g & 3)
+            self._put(g >> 2)
+            if not v:
+                return
+
+    def _flush_run(self):
+        r = self._run
+        if r >= RUN_MIN:
+            self._put(_ESC)
+            self._put(_RUN)
+            self._varint(r - RUN_MIN)
+        else:
+            for _ in range(r):
+                self._put(_AHEAD)
+        self._run = 0
+
+    def step(self, x, y, t=0):
+        d = heading(x - self.x, y - self.y)
+        if d < 0 or t < self.t or self._n > self._limit:
+            return False
+        if t - self._sent_t >= self.time_ms:
+            self._flush_run()
+            self._put(_ESC)
+            self._put(_TIME)
+            self._varint(t - self._sent_t)
+            self._sent_t = t
+        turn = (d - self._dir) & 3
+        if turn == 0:
+            self._run += 1
+        else:
+            self._flush_run()
+            if turn == 1:
+                self._put(_TURN_UP)
+            elif turn == 3:
+                self._put(_TURN_DOWN)
+            else:
+                self._put(_ESC)
+                self._put(_REVERSE)
+            self._dir = d
+        self.x = x
+        self.y = y
+        self.t = t
+        self.steps += 1
+        return True
+
+    def finish(self):
+        # Ends the block; returns its length in bytes.
+        self._flush_run()
+        self._put(_ESC)
+        self._put(_END)
+        return (self._n + 3) >> 2
+
+
+def decode(codes, x, y, t=0):
+    # Yields (x, y, t) for each step after the start point, stopping at the
+    # end marker or the end of codes.
+    n = 4 * len(codes)
+    i = 0
+    d = 0
+
+    def sym(i):
+        return (codes[i >> 2] >> ((i & 3) << 1)) & 3
+
+    while i < n:
+        s = sym(i)
+        i += 1
+        count = 1
+        if s == _TURN_UP:
+            d = (d + 1) & 3
+        elif s == _TURN_DOWN:
+            d = (d - 1) & 3
+        elif s == _ESC:
+            if i >= n:
+                return
+            e = sym(i)
+            i += 1
+            if e == _END:
+                return
+            if e == _REVERSE:
+                d = (d + 2) & 3
+            else:
+                v = 0
+                shift = 0
+                while i + 1 < n:
+                    g = sym(i) | (sym(i + 1) << 2)
+                    i += 2
+                    v |= (g & 7) << shift
+                    shift += 3
+                    if not g & 8:
+                        break
+                if e == _TIME:
+                    t += v
+                    continue
+                count = RUN_MIN + v
+        dx = _DX[d]
+        dy = _DY[d]
+        for _ in range(count):
+            x += dx
+            y += dy
+            yield x, y, t
+
+
+def block_points(block):
+    # Yields every point of a block laid out as BLOCK_HEAD then codes.
+    x, y, t = struct.unpack_from(BLOCK_HEAD, block)
+    yield x, y, t
+    for p in decode(memoryview(block)[BLOCK_HEAD_BYTES:], x, y, t):
+        yield p
+
+
+class StrokeWriter:
+    # Streams points to a stroke file one block at a time.
+    def __init__(self, f, width, height, block_bytes=256, time_ms=TIME_MS):
+        self._f = f
+        self._buf = bytearray(2 + block_bytes)
+        self._mv = memoryview(self._buf)
+        self._enc = ChainEncoder(time_ms)
+        self._open = False
+        self.points = 0
+        f.write(MAGIC + struct.pack("<HH", width, height))
+
+    def point(self, x, y, t=0):
+        self.points += 1
+        if self._open and self._enc.step(x, y, t):
+            return
+        self._flush()
+        buf = self._buf
+        struct.pack_into(BLOCK_HEAD, buf, 2, x, y, t)
+        self._enc.begin(
+            buf, 2 + BLOCK_HEAD_BYTES, len(buf) - 2 - BLOCK_HEAD_BYTES, x, y, t
+        )
+        self._open = True
+
+    def _flush(self):
+        if not self._open:
+            return
+        n = BLOCK_HEAD_BYTES + self._enc.finish()
+        struct.pack_into("<H", self._buf, 0, n)
+        self._f.write(self._mv[: 2 + n])
+        self._open = False
+
+    def close(self):
+        # Writes the last block; the file itself stays open.
+        self._flush()
+
+
+def read_header(f):
+    # Returns (width, height) of a stroke file positioned at its start.
+    head = f.read(8)
+    if len(head) != 8 or head[:4] != MAGIC:
+        raise ValueError("not a stroke file")
+    return struct.unpack_from("<HH", head, 4)
+
+
+def stroke_points(f, block_bytes=256):
+    # Yields every point of a stroke file after read_header(), reading one
+    # block at a time. Stops at a truncated block.
+    buf = bytearray(block_bytes)
+    mv = memoryview(buf)
+    size = bytearray(2)
+    while f.readinto(size) == 2:
+        n = size[0] | (size[1] << 8)
+        if n > len(buf):
+            buf = bytearray(n)
+            mv = memoryview(buf)
+        if (f.readinto(mv[:n]) or 0) != n:
+            return
+        for p in block_points(mv[:n]):
+            yield p
@@ -0,0 +1,124 @@
+# Per-pixel count of how many history points cover each pixel
+
+
+class CoverageGrid:
+    # Counts are packed two per byte (4 bits each). The rare pixel drawn
+    # over more than 15 times keeps the excess in a small overflow dict, so
+    # counts stay exact without spending a full byte on every pixel.
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self._counts = bytearray((width * height + 1) // 2)
+        self._overflow = {}
+        # Called with a packed byte index just before that byte changes (-1
+        # before clear()); journal.py sets it while a checkpoint is open.
+        self.on_change = None
+
+    def clear(self):
+        if self.on_change is not None:
+            self.on_change(-1)
+        counts = self._counts
+        for i in range(len(counts)):
+            counts[i] = 0
+        self._overflow = {}
+
+    def packed(self):
+        # The packed counts themselves, for saving and restoring the grid.
+        return self._counts
+
+    def overflow(self):
+        # Excess counts above 15 as {pixel index: extra}; not a copy.
+        return self._overflow
+
+    def count(self, x, y):
+        i = y * self.width + x
+        shift = (i & 1) << 2
+        n = (self._counts[i >> 1] >> shift) & 0x0F
+        if n == 0x0F:
+            n += self._overflow.get(i, 0)
+        return n
+
+    def covered(self, x, y):
+        i = y * self.width + x
+        return (self._counts[i >> 1] >> ((i & 1) << 2)) & 0x0F != 0
+
+    def spans(self, fn):
+        # Calls fn(x, y, n) for every horizontal run of n covered pixels, in
+        # row order. One pass over the packed bytes: a byte whose two pixels
+        # are both covered or both clear is stepped over whole, so a full
+        # redraw costs one test per pixel pair plus one call per run.
+        w = self.width
+        h = self.height
+        x = 0
+        y = 0
+        start = -1
+        for c in self._counts:
+            if x + 1 < w and (not c or (c & 0x0F and c & 0xF0)):
+                if c:
+                    if start < 0:
+                        start = x
+                elif start >= 0:
+                    fn(start, y, x - start)
+                    start = -1
+                x += 2
+                if x < w:
+                    continue
+            else:
+                # Mixed pair, or a pair split across two rows.
+                for shift in (0, 4):
+                    if y == h:
+                        break
+                    if (c >> shift) & 0x0F:
+                        if start < 0:
+                            start = x
+                    elif start >= 0:
+                        fn(start, y, x - start)
+                        start = -1
+                    x += 1
+                    if x == w:
+                        if start >= 0:
+                            fn(start, y, w - start)
+                            start = -1
+                        x = 0
+                        y += 1
+                continue
+            if start >= 0:
+                fn(start, y, w - start)
+                start = -1
+            x = 0
+            y += 1
+
+    def add(self, x, y):
+        # Returns True when the pixel goes from uncovered to covered.
+        i = y * self.width + x
+        b = i >> 1
+        shift = (i & 1) << 2
+        n = (self._counts[b] >> shift) & 0x0F
+        if n == 0x0F:
+            self._overflow[i] = self._overflow.get(i, 0) + 1
+            return False
+        if self.on_change is not None:
+            self.on_change(b)
+        self._counts[b] += 1 << shift
+        return n == 0
+
+    def remove(self, x, y):
+        # Returns True when the last point covering the pixel goes away.
+        i = y * self.width + x
+        b = i >> 1
+        shift = (i & 1) << 2
+        n = (self._counts[b] >> shift) & 0x0F
+        if n == 0:
+            return False
+        if n == 0x0F:
+            extra = self._overflow.get(i, 0)
+            if extra:
+                if extra == 1:
+                    del self._overflow[i]
+                else:
+                    self._overflow[i] = extra - 1
+                return False
+        if self.on_change is not None:
+            self.on_change(b)
+        self._counts[b] -= 1 << shift
+        return n == 1
@@ -0,0 +1,172 @@
+# Quadrature decoding for the drawing knobs
+#
+# On the RP2040 each knob gets its own PIO state machine that decodes every
+# CLK/DT transition in hardware, so nothing is missed while the main loop is
+# busy drawing. Elsewhere (or when DT is not wired to CLK + 1) the same
+# decoder runs in Python and is polled from the loop.
+from machine import Pin
+
+try:
+    import rp2
+except ImportError:
+    rp2 = None
+
+# KY-040 knobs go through one full quadrature cycle per detent.
+COUNTS_PER_DETENT = 4
+
+# State is (DT << 1) | CLK. Indexed by (previous << 2) | current; +1 is the
+# direction in which CLK falls while DT is high.
+_STEPS = (0, 1, -1, 0, -1, 0, 0, 1, 1, 0, 0, -1, 0, -1, 1, 0)
+# Transitions where both lines changed at once, i.e. a lost state.
+_INVALID = (1 << 3) | (1 << 6) | (1 << 9) | (1 << 12)
+
+# The PIO count starts here so it stays a positive small int both ways.
+_PIO_ZERO = 1 << 29
+
+
+class QuadratureDecoder:
+    # Pure-Python x4 decoder. Feed it every (clk, dt) sample or the levels
+    # from a recorded edge trace; position follows the PIO counter exactly.
+    def __init__(self, clk=1, dt=1):
+        self._state = (dt << 1) | clk
+        self.position = 0
+        self.errors = 0
+
+    def feed(self, clk, dt):
+        state = (dt << 1) | clk
+        idx = (self._state << 2) | state
+        self._state = state
+        step = _STEPS[idx]
+        if step:
+            self.position += step
+        elif (_INVALID >> idx) & 1:
+            self.errors += 1
+        return step
+
+    def poll(self):
+        pass
+
+    def count(self):
+        return self.position
+
+
+class SoftQuadrature(QuadratureDecoder):
+    # Polled fallback: samples the pins whenever poll() is called.
+    def __init__(self, clk, dt):
+        self.clk = clk
+        self.dt = dt
+        super().__init__(clk.value(), dt.value())
+
+    def poll(self):
+        self.feed(self.clk.value(), self.dt.value())
+
+
+if rp2 is not None:
+
+    @rp2.asm_pio(in_shiftdir=rp2.PIO.SHIFT_LEFT, fifo_join=rp2.PIO.JOIN_RX)
+    def _quadrature_pio():
+        # X holds the count, the low two bits of OSR the previous state.
+        # The first 16 instructions are a jump table indexed by
+        # (previous << 2) | current, so the program must sit at offset 0:
+        # it is padded to the full 32 instructions of a PIO block.
+        jmp("update")  # 00 -> 00
+        jmp("increment")  # 00 -> 01
+        jmp("decrement")  # 00 -> 10
+        jmp("update")  # 00 -> 11 invalid
+        jmp("decrement")  # 01 -> 00
+        jmp("update")  # 01 -> 01
+        jmp("update")  # 01 -> 10 invalid
+        jmp("increment")  # 01 -> 11
+        jmp("increment")  # 10 -> 00
+        jmp("update")  # 10 -> 01 invalid
+        jmp("update")  # 10 -> 10
+        jmp("decrement")  # 10 -> 11
+        jmp("update")  # 11 -> 00 invalid
+        jmp("decrement")  # 11 -> 01
+        jmp("increment")  # 11 -> 10
+        jmp("update")  # 11 -> 11
+
+        label("decrement")
+        jmp(x_dec, "update")
+        label("update")
+        # Publish the count on every sample; the reader keeps the newest.
+        mov(isr, x)
+        push(noblock)
+        mov(isr, null)
+        in_(osr, 2)
+        in_(pins, 2)
+        mov(osr, isr)
+        mov(pc, isr)
+
+        label("increment")
+        # PIO can only decrement: x + 1 == ~(~x - 1).
+        mov(x, invert(x))
+        jmp(x_dec, "increment_done")
+        label("increment_done")
+        mov(x, invert(x))
+        jmp("update")
+
+        nop()
+        nop()
+        nop()
+        nop()
+
+
+class PIOQuadrature:
+    # Hardware counter on one PIO state machine. CLK and DT must be
+    # consecutive GPIOs. Use state machines 4-7 so the program has PIO1 to
+    # itself.
+    def __init__(self, sm_id, clk, freq=1_000_000):
+        self._sm = rp2.StateMachine(sm_id, _quadrature_pio, freq=freq, in_base=clk)
+        self._sm.put(_PIO_ZERO)
+        self._sm.exec("pull()")
+        self._sm.exec("mov(x, osr)")
+        self._sm.exec("mov(osr, null)")
+        self._sm.active(1)
+
+    def poll(self):
+        pass
+
+    def count(self):
+        sm = self._sm
+        # The FIFO holds older samples; drop them and wait for a fresh one.
+        for _ in range(sm.rx_fifo()):
+            sm.get()
+        return sm.get() - _PIO_ZERO
+
+
+class Knob:
+    # Turns a raw quadrature count into whole detent steps. A step registers
+    # only when the count reaches the next rest position (a multiple of
+    # counts_per_detent), and going back takes a full detent, so contact
+    # bounce partway through a click never emits a +1/-1 pair.
+    def __init__(self, counter, counts_per_detent=COUNTS_PER_DETENT):
+        self.counter = counter
+        self.counts_per_detent = counts_per_detent
+        self._detent = counter.count() // counts_per_detent
+
+    def _detents(self, count):
+        cpd = self.counts_per_detent
+        detent = self._detent
+        if count >= (detent + 1) * cpd:
+            return count // cpd
+        if count <= (detent - 1) * cpd:
+            return -(-count // cpd)
+        return detent
+
+    def delta(self):
+        self.counter.poll()
+        detent = self._detents(self.counter.count())
+        d = detent - self._detent
+        self._detent = detent
+        return d
+
+
+def open_knob(sm_id, clk_pin, dt_pin, counts_per_detent=COUNTS_PER_DETENT):
+    clk = Pin(clk_pin, Pin.IN, Pin.PULL_UP)
+    dt = Pin(dt_pin, Pin.IN, Pin.PULL_UP)
+    if rp2 is not None and dt_pin == clk_pin + 1:
+        counter = PIOQuadrature(sm_id, clk)
+    else:
+        counter = SoftQuadrature(clk, dt)
+    return Knob(counter, counts_per_detent)
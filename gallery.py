@@ -0,0 +1,298 @@
+# Saved sketches and a thumbnail index for browsing them
+#
+# save() traces the picture into a stroke file (see chaincode.py) and
+# appends one entry to the index file: sketch id, point count, bounding
+# box, draw time and a 1bpp thumbnail already in the display's framebuf
+# format. load() reads the index once, front to back. The newest
+# thumbnails stay in a small cache; an older one costs a single seek and
+# read when the view scrolls to it.
+#
+# Sketch ids follow the highest one in use, in the index or among the
+# sketch files, so a save never overwrites a sketch. An index with another
+# header (another display, or another thumbnail size) is never rewritten.
+from array import array
+import os
+import struct
+
+import framebuf
+
+from chaincode import StrokeWriter
+
+_MAGIC = b"PSGI"
+_HEAD = "<4sHHB"  # magic, thumbnail width and height, framebuf format
+_HEAD_BYTES = 9
+_ENTRY = "<HIHHHHI"  # id, points, bounding box x0 y0 x1 y1, draw time ms
+_ENTRY_BYTES = 18
+
+_DX = (1, 0, -1, 0)
+_DY = (0, 1, 0, -1)
+
+
+def thumb_bytes(w, h, fmt):
+    if fmt == framebuf.MONO_VLSB:
+        return w * ((h + 7) // 8)
+    return ((w + 7) // 8) * h
+
+
+def _trace(cov, writer, thumb, tw, th):
+    # Walks every covered pixel once, chaining 4-neighbours into strokes,
+    # and draws the thumbnail on the way. Returns the bounding box, which
+    # is (width, height, 0, 0) for an empty picture.
+    w = cov.width
+    h = cov.height
+    counts = cov.packed()
+    seen = bytearray((w * h + 7) // 8)
+    x0 = w
+    y0 = h
+    x1 = 0
+    y1 = 0
+    for b in range(len(counts)):
+        if not counts[b]:
+            continue
+        for i in (2 * b, 2 * b + 1):
+            if not (counts[i >> 1] >> ((i & 1) << 2)) & 0x0F:
+                continue
+            if seen[i >> 3] & (1 << (i & 7)):
+                continue
+            x = i % w
+            y = i // w
+            d = 0
+            while True:
+                j = y * w + x
+                seen[j >> 3] |= 1 << (j & 7)
+                writer.point(x, y)
+                thumb.pixel(x * tw // w, y * th // h, 1)
+                if x < x0:
+                    x0 = x
+                if x > x1:
+                    x1 = x
+                if y < y0:
+                    y0 = y
+                if y > y1:
+                    y1 = y
+                # Keep going straight when possible, then turn.
+                for turn in (0, 1, 3, 2):
+                    nd = (d + turn) & 3
+                    nx = x + _DX[nd]
+                    ny = y + _DY[nd]
+                    if nx < 0 or nx >= w or ny < 0 or ny >= h:
+                        continue
+                    j = ny * w + nx
+                    if seen[j >> 3] & (1 << (j & 7)):
+                        continue
+                    if (counts[j >> 1] >> ((j & 1) << 2)) & 0x0F:
+                        break
+                else:
+                    break
+                x = nx
+                y = ny
+                d = nd
+    return x0, y0, x1, y1
+
+
+class Gallery:
+    def __init__(self, path, thumb_w, thumb_h, fmt, slots=8, prefix="sk"):
+        self.path = path
+        self.thumb_w = thumb_w
+        self.thumb_h = thumb_h
+        self.fmt = fmt
+        self.slots = slots
+        self.prefix = prefix
+        self._thumb_bytes = thumb_bytes(thumb_w, thumb_h, fmt)
+        self._entry_bytes = _ENTRY_BYTES + self._thumb_bytes
+        self._meta = bytearray()
+        self._loaded = False
+        self._index_ok = False
+        self._foreign = False
+        self.count = 0
+        # Thumbnail cache: buffer and framebuffer per slot, the entry each
+        # holds (-1 when free) and when it was last used.
+        self._slot_buf = [bytearray(self._thumb_bytes) for _ in range(slots)]
+        self._slot_fb = [
+            framebuf.FrameBuffer(b, thumb_w, thumb_h, fmt) for b in self._slot_buf
+        ]
+        self._slot_of = array("i", (-1 for _ in range(slots)))
+        self._slot_used = array("I", (0 for _ in range(slots)))
+        self._tick = 0
+        self.reads = 0
+
+    def _header(self):
+        return struct.pack(_HEAD, _MAGIC, self.thumb_w, self.thumb_h, self.fmt)
+
+    def sketch_path(self, sketch_id):
+        return "%s%04d.psk" % (self.prefix, sketch_id)
+
+    def _next_id(self):
+        top = self.info(self.count - 1)[0] if self.count else 0
+        n = len(self.prefix)
+        for name in os.listdir():
+            if name.startswith(self.prefix) and name.endswith(".psk"):
+                digits = name[n:-4]
+                if digits.isdigit() and int(digits) > top:
+                    top = int(digits)
+        return top + 1
+
+    def load(self):
+        # Reads the whole index once and returns the number of sketches. An
+        # index with another header counts as empty and is left as it is.
+        self._meta = bytearray()
+        self.count = 0
+        self._loaded = True
+        self._index_ok = False
+        self._foreign = False
+        for s in range(self.slots):
+            self._slot_of[s] = -1
+            self._slot_used[s] = 0
+        try:
+            f = open(self.path, "rb")
+        except OSError:
+            return 0
+        with f:
+            head = f.read(_HEAD_BYTES)
+            if head != self._header():
+                # An empty file is an index whose creation was cut short.
+                self._foreign = bool(head)
+                return 0
+            self._index_ok = True
+            entry = bytearray(_ENTRY_BYTES)
+            while f.readinto(entry) == _ENTRY_BYTES:
+                # Thumbnails land in slot count % slots, so the newest ones
+                # are cached when the read ends.
+                s = self.count % self.slots
+                if f.readinto(self._slot_buf[s]) != self._thumb_bytes:
+                    self._slot_of[s] = -1
+                    break
+                self._slot_of[s] = self.count
+                self._slot_used[s] = self.count
+                self._meta += entry
+                self.count += 1
+        self._tick = self.count
+        return self.count
+
+    def info(self, i):
+        # (id, points, x0, y0, x1, y1, draw_ms) of entry i.
+        return struct.unpack_from(_ENTRY, self._meta, i * _ENTRY_BYTES)
+
+    def _slot(self, i):
+        self._tick += 1
+        victim = 0
+        for s in range(self.slots):
+            if self._slot_of[s] == i:
+                self._slot_used[s] = self._tick
+                return s, True
+            if self._slot_used[s] < self._slot_used[victim]:
+                victim = s
+        self._slot_of[victim] = i
+        self._slot_used[victim] = self._tick
+        return victim, False
+
+    def thumbnail(self, i):
+        s, hit = self._slot(i)
+        if not hit:
+            with open(self.path, "rb") as f:
+                f.seek(_HEAD_BYTES + i * self._entry_bytes + _ENTRY_BYTES)
+                f.readinto(self._slot_buf[s])
+            self.reads += 1
+        return self._slot_fb[s]
+
+    def save(self, coverage, points, draw_ms):
+        # Writes the picture in coverage as a new sketch and adds it to the
+        # index. points and draw_ms are stored as metadata. Returns the id.
+        if not self._loaded:
+            self.load()
+        sketch_id = self._next_id()
+        s, _ = self._slot(self.count)
+        thumb = self._slot_fb[s]
+        thumb.fill(0)
+        with open(self.sketch_path(sketch_id), "wb") as f:
+            writer = StrokeWriter(f, coverage.width, coverage.height)
+            box = _trace(coverage, writer, thumb, self.thumb_w, self.thumb_h)
+            writer.close()
+        if self._foreign:
+            # Not our index: the sketch is saved but not listed.
+            return sketch_id
+        entry = struct.pack(_ENTRY, sketch_id, points, *box, draw_ms)
+        if self._index_ok:
+            f = open(self.path, "r+b")
+            f.seek(_HEAD_BYTES + self.count * self._entry_bytes)
+        else:
+            f = open(self.path, "wb")
+            f.write(self._header())
+            self._index_ok = True
+        with f:
+            f.write(entry)
+            f.write(self._slot_buf[s])
+        self._meta += entry
+        self.count += 1
+        return sketch_id
+
+
+class GalleryView:
+    # Pages of thumbnails in a cols x rows grid of cell_w x cell_h cells,
+    # with a frame around the selected one. The display needs fill_rect()
+    # and blit(); ink and paper are its colours.
+    def __init__(self, gallery, display, cols, rows, cell_w, cell_h, ink, paper):
+        self.gallery = gallery
+        self.display = display
+        self.cols = cols
+        self.rows = rows
+        self.cell_w = cell_w
+        self.cell_h = cell_h
+        self.ink = ink
+        self.paper = paper
+        self._ox = (cell_w - gallery.thumb_w) // 2
+        self._oy = (cell_h - gallery.thumb_h) // 2
+        self._first = -1
+        self.selected = -1
+
+    def open(self):
+        # Loads the index and shows the newest sketch.
+        self._first = -1
+        self.selected = -1
+        self.select(self.gallery.load() - 1)
+
+    def move(self, step):
+        i = self.selected + step
+        if i < 0:
+            i = 0
+        if i >= self.gallery.count:
+            i = self.gallery.count - 1
+        if i != self.selected:
+            self.select(i)
+
+    def select(self, i):
+        per_page = self.cols * self.rows
+        first = i - i % per_page if i >= 0 else 0
+        if first != self._first:
+            self._first = first
+            self._draw_page()
+        elif self.selected >= 0:
+            self._frame(self.selected, self.paper)
+        self.selected = i
+        if i >= 0:
+            self._frame(i, self.ink)
+
+    def _cell(self, i):
+        k = i - self._first
+        return (
+            (k % self.cols) * self.cell_w + self._ox,
+            (k // self.cols) * self.cell_h + self._oy,
+        )
+
+    def _draw_page(self):
+        d = self.display
+        d.fill_rect(0, 0, self.cols * self.cell_w, self.rows * self.cell_h, self.paper)
+        last = min(self._first + self.cols * self.rows, self.gallery.count)
+        for i in range(self._first, last):
+            x, y = self._cell(i)
+            d.blit(self.gallery.thumbnail(i), x, y)
+
+    def _frame(self, i, c):
+        x, y = self._cell(i)
+        w = self.gallery.thumb_w + 2
+        h = self.gallery.thumb_h + 2
+        d = self.display
+        d.fill_rect(x - 1, y - 1, w, 1, c)
+        d.fill_rect(x - 1, y + h - 2, w, 1, c)
+        d.fill_rect(x - 1, y - 1, 1, h, c)
+        d.fill_rect(x + w - 2, y - 1, 1, h, c)
@@ -0,0 +1,109 @@
+# CGRAM glyph slots for drawing 5x8 bitmaps on a character LCD
+#
+# A cell pattern is passed as two 20-bit halves: a holds dot rows 0-3 and
+# b rows 4-7, five bits per row with the leftmost dot in bit 4. Both stay
+# small ints, so looking up a pattern allocates nothing.
+from array import array
+
+# Character codes that need no CGRAM slot: a blank cell and the ROM's
+# solid 5x8 block.
+BLANK_CODE = 0x20
+SOLID_CODE = 0xFF
+_SOLID_HALF = 0xFFFFF
+
+
+def _bits(v):
+    n = 0
+    while v:
+        v &= v - 1
+        n += 1
+    return n
+
+
+class GlyphCache:
+    # The HD44780 holds 8 custom glyphs. Each frame starts with begin();
+    # find() then maps patterns already in CGRAM to their slot and pins it
+    # for the frame, and assign() places new patterns, evicting the least
+    # recently used slot that the frame is not showing. Once all slots are
+    # pinned, a pattern falls back to the nearest glyph by dot count.
+    def __init__(self, upload, slots=8):
+        self._upload = upload
+        self.slots = slots
+        self._a = array("I", (0 for _ in range(slots)))
+        self._b = array("I", (0 for _ in range(slots)))
+        self._valid = bytearray(slots)
+        self._used = array("I", (0 for _ in range(slots)))
+        self._frame_of = array("I", (0 for _ in range(slots)))
+        self._rows = bytearray(8)
+        self._frame = 0
+        self._tick = 0
+        self.uploads = 0
+        self.fallbacks = 0
+
+    def reset(self):
+        # Forget every slot, e.g. after the LCD was re-initialised.
+        for s in range(self.slots):
+            self._valid[s] = 0
+            self._used[s] = 0
+            self._frame_of[s] = 0
+
+    def begin(self):
+        self._frame += 1
+
+    def _pin(self, s):
+        self._tick += 1
+        self._used[s] = self._tick
+        self._frame_of[s] = self._frame
+
+    def find(self, a, b):
+        # Returns the character code already showing this pattern, or -1.
+        if a == 0 and b == 0:
+            return BLANK_CODE
+        if a == _SOLID_HALF and b == _SOLID_HALF:
+            return SOLID_CODE
+        for s in range(self.slots):
+            if self._valid[s] and self._a[s] == a and self._b[s] == b:
+                self._pin(s)
+                return s
+        return -1
+
+    def assign(self, a, b):
+        code = self.find(a, b)
+        if code >= 0:
+            return code
+        victim = -1
+        for s in range(self.slots):
+            if self._frame_of[s] == self._frame:
+                continue
+            if victim < 0 or self._used[s] < self._used[victim]:
+                victim = s
+        if victim < 0:
+            self.fallbacks += 1
+            return self._nearest(a, b)
+        self._a[victim] = a
+        self._b[victim] = b
+        self._valid[victim] = 1
+        self._pin(victim)
+        rows = self._rows
+        for r in range(4):
+            shift = 15 - 5 * r
+            rows[r] = (a >> shift) & 0x1F
+            rows[r + 4] = (b >> shift) & 0x1F
+        self._upload(victim, rows)
+        self.uploads += 1
+        return victim
+
+    def _nearest(self, a, b):
+        # Closest pinned glyph, blank or solid by number of differing dots.
+        best = BLANK_CODE
+        best_d = _bits(a) + _bits(b)
+        d = _bits(a ^ _SOLID_HALF) + _bits(b ^ _SOLID_HALF)
+        if d < best_d:
+            best = SOLID_CODE
+            best_d = d
+        for s in range(self.slots):
+            d = _bits(a ^ self._a[s]) + _bits(b ^ self._b[s])
+            if d < best_d:
+                best = s
+                best_d = d
+        return best
@@ -0,0 +1,133 @@
+# Compact point history for the sketch front ends
+from array import array
+
+
+class History:
+    # One preallocated circular journal for the whole session, stored as
+    # struct-of-arrays columns: x/y as array('H') and draw time as
+    # array('I'), so a point costs 8 bytes (4 without timestamps).
+    #
+    # Indices are absolute and only grow. Live history is [base, cursor);
+    # points from cursor up to the high-water mark are the redo tail.
+    # Undo and redo just move the cursor, and a new point overwrites the
+    # redo tail in place. When the byte budget is used up, the oldest point
+    # is evicted and can no longer be undone; callers keep it drawn (e.g. in
+    # their coverage grid), which folds it into the base picture.
+    def __init__(self, budget_bytes, timestamps=True):
+        point_bytes = 8 if timestamps else 4
+        self.capacity = budget_bytes // point_bytes
+        if self.capacity < 2:
+            raise ValueError("history budget too small")
+        cap = self.capacity
+        self._xs = array("H", (0 for _ in range(cap)))
+        self._ys = array("H", (0 for _ in range(cap)))
+        self._ts = array("I", (0 for _ in range(cap))) if timestamps else None
+        self._base = 0
+        self._n = 0
+        self._hw = 0
+
+    def clear(self):
+        # Forgets every point, keeping the preallocated columns.
+        self._base = 0
+        self._n = 0
+        self._hw = 0
+
+    def __len__(self):
+        # Absolute cursor position, so len() - 1 indexes the newest point.
+        return self._n
+
+    @property
+    def base(self):
+        # Oldest point still held; everything before it was evicted.
+        return self._base
+
+    @property
+    def redo_end(self):
+        return self._hw
+
+    def _slot(self, i):
+        if i < 0:
+            i += self._n
+        if i < self._base or i >= self._n:
+            raise IndexError("history index out of range")
+        return i % self.capacity
+
+    def __getitem__(self, i):
+        s = self._slot(i)
+        if self._ts is None:
+            return self._xs[s], self._ys[s]
+        return self._xs[s], self._ys[s], self._ts[s]
+
+    def __iter__(self):
+        return self.iter(self._base, self._n)
+
+    def iter(self, start, stop=None):
+        # Range view over [start, stop), which may reach into the redo tail;
+        # yields points without materialising a list.
+        if start < self._base:
+            start = self._base
+        if stop is None or stop > self._hw:
+            stop = self._hw
+        cap = self.capacity
+        xs = self._xs
+        ys = self._ys
+        ts = self._ts
+        s = start % cap
+        for _ in range(start, stop):
+            if ts is None:
+                yield xs[s], ys[s]
+            else:
+                yield xs[s], ys[s], ts[s]
+            s += 1
+            if s == cap:
+                s = 0
+
+    def x(self, i):
+        return self._xs[self._slot(i)]
+
+    def y(self, i):
+        return self._ys[self._slot(i)]
+
+    def t(self, i):
+        return self._ts[self._slot(i)]
+
+    def append(self, x, y, t=0):
+        n = self._n
+        if n - self._base >= self.capacity:
+            self._base += 1
+        s = n % self.capacity
+        self._xs[s] = x
+        self._ys[s] = y
+        if self._ts is not None:
+            self._ts[s] = t
+        self._n = n + 1
+        self._hw = n + 1
+
+    def truncate(self, n):
+        # Undo: moves the cursor back, keeping at least the oldest point.
+        if n <= self._base:
+            n = self._base + 1
+        if n < self._n:
+            self._n = n
+
+    def restore(self, n):
+        # Redo: moves the cursor forward, up to the high-water mark.
+        if n > self._hw:
+            n = self._hw
+        if n > self._n:
+            self._n = n
+
+    def find_time(self, t):
+        # Index of the first live point drawn at or after t. Draw times never
+        # decrease, so this is a binary search over the t column.
+        ts = self._ts
+        cap = self.capacity
+        lo = self._base
+        hi = self._n
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            if ts[mid % cap] < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
@@ -0,0 +1,159 @@
+# Knob and button input delivered from IRQs through a fixed-size event ring
+#
+# Pin IRQ handlers are the producer and the main loop is the consumer. The
+# handlers are scheduled callbacks, which never preempt each other, so
+# together they act as a single producer. Nothing is allocated once the ring
+# exists: events are a small code plus a ticks_ms() stamp stored in
+# preallocated arrays.
+from array import array
+
+import utime
+from machine import Pin
+
+from encoder import COUNTS_PER_DETENT, open_knob
+
+# Event kinds; a code is (source << 2) | kind.
+STEP_UP = 0
+STEP_DOWN = 1
+PRESS = 2
+RELEASE = 3
+
+
+def event_source(code):
+    return code >> 2
+
+
+def event_kind(code):
+    return code & 3
+
+
+class EventRing:
+    # Single-producer/single-consumer ring. Head and tail run modulo twice
+    # the size, so full and empty differ without a spare slot; only push()
+    # writes the head and only pop() writes the tail.
+    #
+    # When the ring is full new events are dropped and counted. overflows
+    # counts full episodes, dropped counts lost events and high_water is the
+    # deepest the ring has been, so a run with dropped == 0 lost nothing.
+    def __init__(self, size=64):
+        if size & (size - 1):
+            raise ValueError("ring size must be a power of two")
+        self.size = size
+        self._mask = size - 1
+        self._wrap = 2 * size - 1
+        self._codes = bytearray(size)
+        self._times = array("I", (0 for _ in range(size)))
+        self._head = 0
+        self._tail = 0
+        self._full = False
+        self.time = 0
+        self.dropped = 0
+        self.overflows = 0
+        self.high_water = 0
+
+    def __len__(self):
+        return (self._head - self._tail) & self._wrap
+
+    def push(self, code, t):
+        head = self._head
+        used = (head - self._tail) & self._wrap
+        if used >= self.size:
+            if not self._full:
+                self._full = True
+                self.overflows += 1
+            self.dropped += 1
+            return False
+        self._full = False
+        i = head & self._mask
+        self._codes[i] = code
+        self._times[i] = t
+        self._head = (head + 1) & self._wrap
+        if used >= self.high_water:
+            self.high_water = used + 1
+        return True
+
+    def pop(self):
+        # Returns the next event code and sets .time, or -1 when empty.
+        tail = self._tail
+        if tail == self._head:
+            return -1
+        i = tail & self._mask
+        code = self._codes[i]
+        self.time = self._times[i]
+        self._tail = (tail + 1) & self._wrap
+        return code
+
+    def clear_stats(self):
+        self.dropped = 0
+        self.overflows = 0
+        self.high_water = len(self)
+
+
+class IrqKnob:
+    # Pushes one STEP_UP/STEP_DOWN event per detent. Every CLK or DT edge
+    # runs the knob's decoder (PIO counter or Python fallback, see
+    # encoder.py), so the IRQ only has to turn counts into detents.
+    def __init__(self, ring, source, knob, clk, dt):
+        self.ring = ring
+        self.knob = knob
+        self._up = (source << 2) | STEP_UP
+        self._down = (source << 2) | STEP_DOWN
+        trigger = Pin.IRQ_RISING | Pin.IRQ_FALLING
+        clk.irq(handler=self._edge, trigger=trigger)
+        dt.irq(handler=self._edge, trigger=trigger)
+
+    @property
+    def errors(self):
+        # Invalid transitions seen by the Python decoder (edges it missed).
+        # The PIO counter sees every edge, so there this stays 0.
+        return getattr(self.knob.counter, "errors", 0)
+
+    def _edge(self, pin):
+        d = self.knob.delta()
+        if not d:
+            return
+        t = utime.ticks_ms()
+        code = self._up
+        if d < 0:
+            code = self._down
+            d = -d
+        for _ in range(d):
+            self.ring.push(code, t)
+
+
+class IrqButton:
+    # Active-low push button. Pushes PRESS and RELEASE events; edges within
+    # debounce_ms of the last accepted one are contact bounce and ignored.
+    def __init__(self, ring, source, pin, debounce_ms=20):
+        self.ring = ring
+        self.pin = pin
+        self.debounce_ms = debounce_ms
+        self._press = (source << 2) | PRESS
+        self._release = (source << 2) | RELEASE
+        self._level = pin.value()
+        self._last_ms = utime.ticks_ms()
+        pin.irq(handler=self._edge, trigger=Pin.IRQ_RISING | Pin.IRQ_FALLING)
+
+    def _edge(self, pin):
+        level = pin.value()
+        if level == self._level:
+            return
+        t = utime.ticks_ms()
+        if utime.ticks_diff(t, self._last_ms) < self.debounce_ms:
+            return
+        self._level = level
+        self._last_ms = t
+        self.ring.push(self._release if level else self._press, t)
+
+
+def attach_knob(
+    ring, source, sm_id, clk_pin, dt_pin, counts_per_detent=COUNTS_PER_DETENT
+):
+    knob = open_knob(sm_id, clk_pin, dt_pin, counts_per_detent)
+    clk = Pin(clk_pin, Pin.IN, Pin.PULL_UP)
+    dt = Pin(dt_pin, Pin.IN, Pin.PULL_UP)
+    return IrqKnob(ring, source, knob, clk, dt)
+
+
+def attach_button(ring, source, pin_id, debounce_ms=20):
+    return IrqButton(ring, source, Pin(pin_id, Pin.IN, Pin.PULL_UP), debounce_ms)
@@ -0,0 +1,603 @@
+# Append-only drawing journal on flash, with periodic checkpoints
+#
+# Every record is type (1 byte), payload length (1 byte), payload and a
+# CRC32 over all three, so a torn write at the tail after a power loss is
+# detected and ignored. Points are buffered in RAM and written out one
+# block per service() call, from idle loop passes, so flash I/O never
+# holds up the loop for more than one block write.
+#
+# A checkpoint is the coverage grid as it stood at one instant. It is
+# written as a header record, data chunks and an end record carrying the
+# CRC of the whole grid; only then does it count. Live records keep
+# flowing between the chunks and follow the header, so recovery loads the
+# newest complete checkpoint (found through a small index file) and
+# replays just the records after it.
+#
+# Chunks are read from the live grid, not from a copy of it. While a
+# checkpoint is open the grid reports each byte about to change, and a
+# chunk not yet written is saved to a small slot pool the first time it
+# changes. Once the pool is full, such a chunk is queued right away
+# instead, out of order; recovery places chunks by number.
+#
+# Undo history from before a checkpoint is part of its picture, so an
+# undo that reaches into it writes out the points it erases and restarts
+# the replayed history at the new cursor. A redo past the end of the
+# journal writes the redone points out again. Recovery then rebuilds what
+# was on screen whichever checkpoint it starts from. A rotation that never
+# committed leaves its records in the ".new" file; recovery replays them
+# after the old file's.
+import os
+import struct
+from array import array
+from binascii import crc32
+
+import utime
+
+from chaincode import BLOCK_HEAD, BLOCK_HEAD_BYTES, ChainEncoder, block_points
+
+_POINTS = 0x50  # "P": a chain-code block of points (see chaincode.py)
+_TRUNCATE = 0x55  # "U": history length (I) after an undo
+_RESTORE = 0x52  # "R": history length (I) after a redo
+_ERASE = 0x58  # "X": a chain-code block of points erased from the picture
+_REBASE = 0x42  # "B": history length, cursor; the history restarts there
+_CHECKPOINT = 0x43  # "C": id, history length, cursor, grid size, overflows
+_DATA = 0x44  # "D": id, chunk number, then a slice of the grid
+_OVERFLOW = 0x4F  # "O": id, then (pixel index I, extra count H) pairs
+_END = 0x45  # "E": id, chunk count and CRC32 of the grid; commits it
+
+_CHECKPOINT_FMT = "<HIHHIH"
+_END_FMT = "<HHI"
+_REBASE_FMT = "<IHH"
+_CHAIN_BYTES = 255 - BLOCK_HEAD_BYTES
+_CHUNK_BYTES = 248
+_OVERFLOW_PER_RECORD = 40
+# Largest record: header, payload and CRC.
+_MAX_RECORD = 2 + 255 + 4
+# Slot map entry for a chunk already queued out of order.
+_WRITTEN = -2
+
+
+class Journal:
+    def __init__(
+        self,
+        path,
+        coverage,
+        history,
+        block_size=256,
+        checkpoint_points=4096,
+        max_bytes=256 * 1024,
+        flush_after_ms=1000,
+        snapshot_chunks=16,
+    ):
+        self.path = path
+        self.coverage = coverage
+        self.history = history
+        self.block_size = block_size
+        self.checkpoint_points = checkpoint_points
+        self.max_bytes = max_bytes
+        self.flush_after_ms = flush_after_ms
+        self._buf = bytearray(4 * block_size + _MAX_RECORD)
+        self._mv = memoryview(self._buf)
+        self._len = 0
+        self._open = -1
+        self._chain = ChainEncoder()
+        self._dirty_ms = 0
+        self._file = None
+        self._file_pos = 0
+        # Checkpoint being written: next chunk, overflow entries and the
+        # CRC so far. Chunks changed before they are written keep their old
+        # bytes in a slot; _slot_of maps chunk number to slot, -1 or
+        # _WRITTEN.
+        self._size = len(coverage.packed())
+        self._packed_mv = memoryview(coverage.packed())
+        self._slots = bytearray(snapshot_chunks * _CHUNK_BYTES)
+        self._slots_mv = memoryview(self._slots)
+        chunks = (self._size + _CHUNK_BYTES - 1) // _CHUNK_BYTES
+        self._slot_of = array("h", [-1] * chunks)
+        self._slots_used = 0
+        self._snap_overflow = None
+        self._snap_crc = 0
+        self._chunk = -1
+        self._on_change = self._grid_changing
+        self._ckpt_id = 0
+        self._ckpt_offset = 0
+        self._rotating = False
+        # File offset of a committed checkpoint and the end of its "E"
+        # record; the index file is updated once that much is on flash.
+        self._index_offset = -1
+        self._index_end = 0
+        # Mirror of the caller's history cursor, to spot an undo or redo
+        # that reaches past what replay can rebuild: the history length at
+        # the newest checkpoint or rebase, and the journal's redo end.
+        self._ckpt_index = 0
+        self._cursor = 0
+        self._known_end = 0
+        self._since_ckpt = 0
+        self.writes = 0
+        self.bytes_written = 0
+        self.max_write_us = 0
+
+    # -- recording -------------------------------------------------------
+
+    def point(self, x, y, t=0):
+        # Draw times are stored to chaincode.TIME_MS.
+        self._chain_point(_POINTS, x, y, t)
+        self._cursor += 1
+        self._known_end = self._cursor
+        self._since_ckpt += 1
+
+    def truncate(self, n):
+        # Records an undo that left the history n points long. Called after
+        # the history is cut, while the undone points are still its redo
+        # tail.
+        k = self._ckpt_index
+        if n >= k:
+            self._record(_TRUNCATE, "<I", n)
+            self._cursor = n
+            return
+        # The undo reaches into the picture replay starts from: back to
+        # that picture, erase the points before it that went, and restart
+        # from the new cursor.
+        if self._cursor > k:
+            self._record(_TRUNCATE, "<I", k)
+        h = self.history
+        for p in h.iter(n, k):
+            self._chain_point(_ERASE, p[0], p[1], 0)
+        p = h[n - 1]
+        self._record(_REBASE, _REBASE_FMT, n, p[0], p[1])
+        self._ckpt_index = n
+        self._cursor = n
+        self._known_end = n
+
+    def restore(self, n):
+        # Records a redo. Called after the history moves forward. Points
+        # redone from a tail older than the journal's are written again.
+        end = self._known_end
+        if n <= end:
+            self._record(_RESTORE, "<I", n)
+            self._cursor = n
+            return
+        if self._cursor < end:
+            self._record(_RESTORE, "<I", end)
+            self._cursor = end
+        for p in self.history.iter(end, n):
+            self.point(p[0], p[1], p[2] if len(p) > 2 else 0)
+
+    @property
+    def checkpoint_due(self):
+        if self._index_offset >= 0:
+            return False
+        return self._chunk < 0 and self._since_ckpt >= self.checkpoint_points
+
+    def checkpoint(self, x, y, index):
+        # Captures the grid now; service() writes it out in chunks. index
+        # is the history length, whose last point is the cursor (x, y).
+        cov = self.coverage
+        for c in range(len(self._slot_of)):
+            self._slot_of[c] = -1
+        self._slots_used = 0
+        self._snap_crc = 0
+        self._snap_overflow = list(cov.overflow().items())
+        cov.on_change = self._on_change
+        self._ckpt_id = (self._ckpt_id + 1) & 0xFFFF
+        if self._file_pos + self._len > self.max_bytes and not self._rotating:
+            # Start a fresh file; it replaces the old one once committed.
+            # Records written in between are lost if power fails first.
+            self._sync_buffer()
+            self._file.close()
+            self._file = open(self.path + ".new", "wb")
+            self._file_pos = 0
+            self._rotating = True
+        self._ckpt_offset = self._file_pos + self._record_offset()
+        self._record(
+            _CHECKPOINT,
+            _CHECKPOINT_FMT,
+            self._ckpt_id,
+            index,
+            x,
+            y,
+            self._size,
+            len(self._snap_overflow),
+        )
+        self._chunk = 0
+        self._ckpt_index = index
+        self._cursor = index
+        self._known_end = index
+        self._since_ckpt = 0
+
+    def start(self, x, y, index):
+        # Begins a new journal holding just a checkpoint of the current
+        # state. Called once at boot, so it writes everything straight away.
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self.path + ".new", "wb")
+        self._file_pos = 0
+        self._len = 0
+        self._open = -1
+        self._rotating = True
+        self.checkpoint(x, y, index)
+        while self._chunk >= 0:
+            self._queue_checkpoint()
+            self._sync_buffer()
+        self._sync_buffer()
+        self._commit_index()
+
+    def service(self, idle):
+        # Does at most one piece of flash I/O. Call once per loop pass with
+        # idle=True when no input arrived.
+        if self._index_offset >= 0 and self._file_pos >= self._index_end:
+            self._commit_index()
+            return
+        if idle and self._chunk >= 0:
+            self._queue_checkpoint()
+        n = self._len
+        if not n:
+            return
+        if idle:
+            if n < self.block_size:
+                age = utime.ticks_diff(utime.ticks_ms(), self._dirty_ms)
+                if age < self.flush_after_ms:
+                    return
+        elif n < len(self._buf) - _MAX_RECORD - self.block_size:
+            return
+        self._write_block()
+
+    # -- recovery --------------------------------------------------------
+
+    def recover(self, on_checkpoint, on_point, on_truncate, on_restore):
+        # Loads the newest complete checkpoint into the coverage grid and
+        # replays the records after it. Callbacks get history lengths
+        # relative to a history that restarts with the checkpoint's cursor
+        # as its only point; on_checkpoint is called again where the
+        # history restarts after an undo into the checkpoint. Returns False
+        # when there is nothing to load.
+        callbacks = (on_checkpoint, on_point, on_truncate, on_restore)
+        self._settle_files()
+        try:
+            f = open(self.path, "rb")
+        except OSError:
+            return False
+        try:
+            offset = self._read_index()
+            if offset < 0 or not self._load_checkpoint(f, offset):
+                offset = self._scan_checkpoints(f)
+                if offset < 0 or not self._load_checkpoint(f, offset):
+                    self.coverage.clear()
+                    return False
+            base = self._replay(f, offset, -1, callbacks)
+        finally:
+            f.close()
+        # A rotation that never committed: its records carry on from the
+        # end of the old file.
+        try:
+            f = open(self.path + ".new", "rb")
+        except OSError:
+            return True
+        try:
+            self._replay(f, 0, base, callbacks)
+        finally:
+            f.close()
+        return True
+
+    def _replay(self, f, offset, base, callbacks):
+        # Replays the records from offset on. base is the history index the
+        # callbacks' history starts at (-1 until a checkpoint sets it); the
+        # one reached is returned.
+        on_checkpoint, on_point, on_truncate, on_restore = callbacks
+        for _, kind, p, n in _records(f, offset):
+            if kind == _CHECKPOINT:
+                # Later checkpoints never committed; skip them.
+                if base < 0:
+                    _, index, x, y, _, _ = struct.unpack_from(_CHECKPOINT_FMT, p)
+                    base = index - 1
+                    on_checkpoint(x, y)
+            elif kind == _POINTS:
+                for x, y, t in block_points(p):
+                    on_point(x, y, t)
+            elif kind == _TRUNCATE:
+                on_truncate(struct.unpack_from("<I", p)[0] - base)
+            elif kind == _RESTORE:
+                on_restore(struct.unpack_from("<I", p)[0] - base)
+            elif kind == _ERASE:
+                for x, y, _ in block_points(p):
+                    self.coverage.remove(x, y)
+            elif kind == _REBASE:
+                index, x, y = struct.unpack_from(_REBASE_FMT, p)
+                base = index - 1
+                on_checkpoint(x, y)
+        return base
+
+    def _settle_files(self):
+        # A finished rotation may have been cut short between its steps. An
+        # unfinished one keeps its ".new" file for recover() to replay;
+        # start() replaces it.
+        new = self.path + ".new"
+        if not _exists(new):
+            return
+        if _exists(self.path) and _exists(self.path + ".idx"):
+            with open(self.path + ".idx", "rb") as f:
+                idx = f.read()
+            if len(idx) != 8 or idx[4:] != b"new!":
+                return
+            os.remove(self.path)
+        elif _exists(self.path):
+            return
+        os.rename(new, self.path)
+
+    def _read_index(self):
+        try:
+            with open(self.path + ".idx", "rb") as f:
+                idx = f.read()
+        except OSError:
+            return -1
+        if len(idx) != 8:
+            return -1
+        offset, check = struct.unpack("<II", idx)
+        if check != offset ^ 0xFFFFFFFF:
+            return -1
+        return offset
+
+    def _load_checkpoint(self, f, offset):
+        # Loads the checkpoint whose "C" record is at offset, returning
+        # False unless all of it is on flash and its CRC matches.
+        cov = self.coverage
+        cov.clear()
+        counts = memoryview(cov.packed())
+        overflow = cov.overflow()
+        ckpt_id = -1
+        crc = 0
+        for at, kind, p, n in _records(f, offset):
+            if ckpt_id < 0:
+                if at != offset or kind != _CHECKPOINT:
+                    return False
+                ckpt_id, _, _, _, size, _ = struct.unpack_from(_CHECKPOINT_FMT, p)
+                if size != len(counts):
+                    return False
+            elif kind == _DATA and struct.unpack_from("<H", p)[0] == ckpt_id:
+                chunk = struct.unpack_from("<H", p, 2)[0]
+                data = p[4:n]
+                counts[chunk * _CHUNK_BYTES : chunk * _CHUNK_BYTES + n - 4] = data
+                crc = crc32(data, crc)
+            elif kind == _OVERFLOW and struct.unpack_from("<H", p)[0] == ckpt_id:
+                for i in range(2, n, 6):
+                    pixel, extra = struct.unpack_from("<IH", p, i)
+                    overflow[pixel] = extra
+            elif kind == _END and struct.unpack_from("<H", p)[0] == ckpt_id:
+                return struct.unpack_from(_END_FMT, p)[2] == crc
+        return False
+
+    def _scan_checkpoints(self, f):
+        # Without a usable index, finds the last committed checkpoint by
+        # reading the whole file.
+        best = -1
+        started = {}
+        for at, kind, p, n in _records(f, 0):
+            if kind == _CHECKPOINT:
+                started[struct.unpack_from("<H", p)[0]] = at
+            elif kind == _END:
+                at = started.get(struct.unpack_from("<H", p)[0], -1)
+                if at >= 0:
+                    best = at
+        return best
+
+    # -- buffer and file ---------------------------------------------------
+
+    def _record_offset(self):
+        # Offset in the buffer where the next record will start.
+        self._close()
+        return self._len
+
+    def _reserve(self, n):
+        if not self._len:
+            self._dirty_ms = utime.ticks_ms()
+        while self._len + n > len(self._buf):
+            self._write_block()
+
+    def _chain_point(self, kind, x, y, t):
+        # Adds a point to the open chain-code block of this kind, or starts
+        # a new block.
+        o = self._open
+        if o < 0 or self._buf[o] != kind or not self._chain.step(x, y, t):
+            self._close()
+            self._reserve(_MAX_RECORD)
+            o = self._len
+            buf = self._buf
+            buf[o] = kind
+            struct.pack_into(BLOCK_HEAD, buf, o + 2, x, y, t)
+            self._chain.begin(buf, o + 2 + BLOCK_HEAD_BYTES, _CHAIN_BYTES, x, y, t)
+            self._open = o
+            self._len = o + 2 + BLOCK_HEAD_BYTES
+
+    def _close(self):
+        o = self._open
+        if o < 0:
+            return
+        if self._buf[o] == _POINTS or self._buf[o] == _ERASE:
+            n = BLOCK_HEAD_BYTES + self._chain.finish()
+            self._buf[o + 1] = n
+            self._len = o + 2 + n
+        struct.pack_into("<I", self._buf, self._len, crc32(self._mv[o : self._len]))
+        self._len += 4
+        self._open = -1
+
+    def _record(self, kind, fmt, *args):
+        self._close()
+        size = struct.calcsize(fmt)
+        self._reserve(2 + size + 4)
+        o = self._len
+        buf = self._buf
+        buf[o] = kind
+        buf[o + 1] = size
+        struct.pack_into(fmt, buf, o + 2, *args)
+        self._len = o + 2 + size
+        self._open = o
+        self._close()
+
+    def _grid_changing(self, b):
+        # Grid hook: byte b is about to change, or the grid is being
+        # cleared (b < 0).
+        if b < 0:
+            self._abort_checkpoint()
+            return
+        c = b // _CHUNK_BYTES
+        if c < self._chunk or self._slot_of[c] != -1:
+            return
+        start = c * _CHUNK_BYTES
+        n = min(_CHUNK_BYTES, self._size - start)
+        slot = self._slots_used
+        if (slot + 1) * _CHUNK_BYTES > len(self._slots):
+            self._queue_chunk(c, self._packed_mv[start : start + n])
+            self._slot_of[c] = _WRITTEN
+            return
+        at = slot * _CHUNK_BYTES
+        self._slots_mv[at : at + n] = self._packed_mv[start : start + n]
+        self._slot_of[c] = slot
+        self._slots_used = slot + 1
+
+    def _abort_checkpoint(self):
+        # Leaves the checkpoint without its "E" record, so recovery never
+        # uses it, and asks for a new one.
+        self.coverage.on_change = None
+        self._chunk = -1
+        self._snap_overflow = None
+        self._since_ckpt = self.checkpoint_points
+
+    def _queue_chunk(self, c, src):
+        # Adds the data record for chunk c, holding src.
+        self._close()
+        self._reserve(_MAX_RECORD)
+        o = self._len
+        n = len(src)
+        buf = self._buf
+        buf[o] = _DATA
+        buf[o + 1] = 4 + n
+        struct.pack_into("<HH", buf, o + 2, self._ckpt_id, c)
+        self._mv[o + 6 : o + 6 + n] = src
+        self._snap_crc = crc32(src, self._snap_crc)
+        self._len = o + 6 + n
+        self._open = o
+        self._close()
+
+    def _queue_checkpoint(self):
+        # Adds the next data, overflow or end record of the checkpoint.
+        slot_of = self._slot_of
+        chunks = len(slot_of)
+        while self._chunk < chunks and slot_of[self._chunk] == _WRITTEN:
+            self._chunk += 1
+        c = self._chunk
+        if c < chunks:
+            start = c * _CHUNK_BYTES
+            n = min(_CHUNK_BYTES, self._size - start)
+            slot = slot_of[c]
+            if slot >= 0:
+                at = slot * _CHUNK_BYTES
+                self._queue_chunk(c, self._slots_mv[at : at + n])
+            else:
+                self._queue_chunk(c, self._packed_mv[start : start + n])
+            self._chunk = c + 1
+            return
+        buf = self._buf
+        self._close()
+        self._reserve(_MAX_RECORD)
+        o = self._len
+        entries = self._snap_overflow
+        if entries:
+            take = entries[:_OVERFLOW_PER_RECORD]
+            del entries[:_OVERFLOW_PER_RECORD]
+            buf[o] = _OVERFLOW
+            buf[o + 1] = 2 + 6 * len(take)
+            struct.pack_into("<H", buf, o + 2, self._ckpt_id)
+            at = o + 4
+            for pixel, extra in take:
+                struct.pack_into("<IH", buf, at, pixel, extra)
+                at += 6
+            self._len = at
+            self._open = o
+            self._close()
+            return
+        self.coverage.on_change = None
+        self._record(_END, _END_FMT, self._ckpt_id, self._chunk, self._snap_crc)
+        self._index_offset = self._ckpt_offset
+        self._index_end = self._file_pos + self._len
+        self._chunk = -1
+        self._snap_overflow = None
+
+    def _write_block(self):
+        self._close()
+        n = min(self._len, self.block_size)
+        if not n:
+            return
+        if self._file is None:
+            self._file = open(self.path, "ab")
+            self._file_pos = self._file.seek(0, 2)
+        t0 = utime.ticks_us()
+        self._file.write(self._mv[:n])
+        self._file.flush()
+        us = utime.ticks_diff(utime.ticks_us(), t0)
+        rest = self._len - n
+        self._mv[:rest] = self._mv[n : self._len]
+        self._len = rest
+        self._dirty_ms = utime.ticks_ms()
+        self._file_pos += n
+        self.writes += 1
+        self.bytes_written += n
+        if us > self.max_write_us:
+            self.max_write_us = us
+
+    def _sync_buffer(self):
+        while self._len or self._open >= 0:
+            self._write_block()
+
+    def _commit_index(self):
+        offset = self._index_offset
+        self._index_offset = -1
+        if self._rotating:
+            # Mark the index as belonging to the new file, then swap files.
+            with open(self.path + ".idx", "wb") as f:
+                f.write(struct.pack("<I", offset) + b"new!")
+            self._file.close()
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            os.rename(self.path + ".new", self.path)
+            self._file = open(self.path, "ab")
+            self._rotating = False
+        with open(self.path + ".idx", "wb") as f:
+            f.write(struct.pack("<II", offset, offset ^ 0xFFFFFFFF))
+
+
+def _exists(path):
+    try:
+        os.stat(path)
+        return True
+    except OSError:
+        return False
+
+
+def _records(f, offset):
+    # Yields (offset, type, payload, length) for each intact record from
+    # offset on, stopping at the first torn or corrupt one. The payload is
+    # a memoryview that is only valid until the next record.
+    buf = bytearray(2 * _MAX_RECORD)
+    mv = memoryview(buf)
+    f.seek(offset)
+    have = f.readinto(buf) or 0
+    pos = 0
+    while True:
+        if have - pos < _MAX_RECORD:
+            rest = have - pos
+            mv[:rest] = mv[pos:have]
+            have = rest + (f.readinto(mv[rest:]) or 0)
+            pos = 0
+        if have - pos < 6:
+            return
+        n = buf[pos + 1]
+        end = pos + 2 + n
+        if end + 4 > have:
+            return
+        if struct.unpack_from("<I", buf, end)[0] != crc32(mv[pos:end]):
+            return
+        yield offset, buf[pos], mv[pos + 2 : end], n
+        offset += n + 6
+        pos = end + 4
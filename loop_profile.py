@@ -0,0 +1,121 @@
+# Main-loop latency profile and lost knob edges
+#
+# The loop calls begin() at the top of every pass and mark(phase) at the
+# end of each phase. Whole passes and every phase go into power-of-two
+# microsecond histograms in one preallocated array, so profiling allocates
+# nothing per pass. Every report_ms the profiler prints a summary over
+# serial: pass and phase times, knob edges the decoder lost (see
+# IrqKnob.errors) and events the ring dropped. Then it starts a new window.
+# Printing happens between passes and is left out of the times. With
+# report_ms=0 nothing is printed; call report() from the REPL instead.
+from array import array
+
+import utime
+
+# Phases of a main-loop pass, in loop order. Slot 0 is the whole pass.
+PH_INPUT = 1  # draining the event ring
+PH_UNDO = 2  # undo, redo, revert, save and gallery actions
+PH_MOVE = 3  # draining the queued cursor movement
+PH_DRAW = 4  # show() or the frame scheduler
+PH_SLEEP = 5  # journal service and the idle sleep
+_NAMES = ("pass", "input", "undo", "move", "draw", "sleep")
+
+# Bucket b holds times under 2**b us, from 2**(b-1) us; the last bucket
+# also holds everything longer (2**15 us is about 33 ms).
+BUCKETS = 16
+# Totals are 32-bit. Whole passes bound every phase, so a window ends once
+# the pass total reaches this (about 36 minutes), reported or not, which
+# leaves the same again for one last pass.
+_TOTAL_LIMIT = 1 << 31
+
+
+def _zeros(n):
+    return array("I", (0 for _ in range(n)))
+
+
+class LoopProfiler:
+    def __init__(self, knobs=(), ring=None, report_ms=10_000):
+        self.knobs = knobs
+        self.ring = ring
+        self.report_ms = report_ms
+        slots = len(_NAMES)
+        self._hist = _zeros(slots * BUCKETS)
+        self._count = _zeros(slots)
+        self._total = _zeros(slots)
+        self._max = _zeros(slots)
+        self._missed = _zeros(len(knobs))
+        self._dropped = 0
+        self._running = False
+        self._pass_us = 0
+        self._mark_us = 0
+        self._window_ms = utime.ticks_ms()
+
+    def _add(self, slot, us):
+        b = 0
+        v = us
+        while v and b < BUCKETS - 1:
+            v >>= 1
+            b += 1
+        self._hist[slot * BUCKETS + b] += 1
+        self._count[slot] += 1
+        self._total[slot] += us
+        if us > self._max[slot]:
+            self._max[slot] = us
+
+    def begin(self):
+        now = utime.ticks_us()
+        if self._running:
+            self._add(0, utime.ticks_diff(now, self._pass_us))
+        self._running = True
+        if self.report_ms:
+            due = utime.ticks_diff(utime.ticks_ms(), self._window_ms) >= self.report_ms
+        else:
+            due = False
+        if due or self._total[0] >= _TOTAL_LIMIT:
+            if self.report_ms:
+                self.report()
+            self.clear()
+            now = utime.ticks_us()
+        self._pass_us = now
+        self._mark_us = now
+
+    def mark(self, phase):
+        now = utime.ticks_us()
+        self._add(phase, utime.ticks_diff(now, self._mark_us))
+        self._mark_us = now
+
+    def clear(self):
+        # Starts a new window; the knob and ring counters are cumulative,
+        # so only their baselines move.
+        for i in range(len(self._hist)):
+            self._hist[i] = 0
+        for i in range(len(_NAMES)):
+            self._count[i] = 0
+            self._total[i] = 0
+            self._max[i] = 0
+        for i, knob in enumerate(self.knobs):
+            self._missed[i] = knob.errors
+        if self.ring is not None:
+            self._dropped = self.ring.dropped
+        self._window_ms = utime.ticks_ms()
+
+    def report(self):
+        secs = utime.ticks_diff(utime.ticks_ms(), self._window_ms) / 1000
+        print("loop: %d passes in %.1f s" % (self._count[0], secs))
+        for slot, name in enumerate(_NAMES):
+            n = self._count[slot]
+            if not n:
+                continue
+            base = slot * BUCKETS
+            buckets = " ".join(
+                "<%d:%d" % (1 << b, self._hist[base + b])
+                for b in range(BUCKETS)
+                if self._hist[base + b]
+            )
+            print(
+                "  %-5s mean %d us, max %d us | %s"
+                % (name, self._total[slot] // n, self._max[slot], buckets)
+            )
+        missed = [k.errors - self._missed[i] for i, k in enumerate(self.knobs)]
+        dropped = self.ring.dropped - self._dropped if self.ring is not None else 0
+        print("  lost knob edges %s, dropped events %d" % (missed, dropped))
@@ -1,5 +1,23 @@
 from machine import Pin, SPI
 import utime
+import framebuf
+
+from coverage import CoverageGrid
+from history import History
+from gallery import Gallery, GalleryView
+from input_events import (
+    PRESS,
+    RELEASE,
+    STEP_UP,
+    EventRing,
+    attach_button,
+    attach_knob,
+    event_kind,
+    event_source,
+)
+from journal import Journal
+from loop_profile import PH_DRAW, PH_INPUT, PH_MOVE, PH_SLEEP, PH_UNDO, LoopProfiler
+from raster import line_runs
 
 # 240x320 TFT (ILI9341) on SPI0
 # SCK=GP18, MOSI=GP19, MISO=GP16, D/C=GP20, CS=GP17
@@ -10,15 +28,46 @@ ILI9341_CASET = 0x2A
 ILI9341_PASET = 0x2B
 ILI9341_RAMWR = 0x2C
 
+# Rows of RGB565 expanded per SPI write when flushing the damage region.
+FLUSH_BAND_ROWS = 16
+# Distinct damage widths whose band views are kept between flushes.
+BAND_VIEW_CACHE = 8
+# Solid colour rows kept pre-expanded for fill_rect/hline/vline/fill.
+ROW_CACHE_SIZE = 4
+
 
 class ILI9341:
-    def __init__(self, width, height, spi, dc, cs, rst=None):
+    def __init__(self, width, height, spi, dc, cs, rst=None, deferred=False):
         self.width = width
         self.height = height
         self.spi = spi
         self.dc = dc
         self.cs = cs
         self.rst = rst
+        self.deferred = deferred
+
+        if self.deferred:
+            # Deferred mode keeps a 1bpp shadow of the two-colour canvas and
+            # sends the damaged rectangle as one RAMWR burst from show().
+            self._shadow = bytearray(((width + 7) // 8) * height)
+            self._canvas = framebuf.FrameBuffer(
+                self._shadow, width, height, framebuf.MONO_HLSB
+            )
+            self._palette = framebuf.FrameBuffer(bytearray(4), 2, 1, framebuf.RGB565)
+            self._band = bytearray(width * 2 * FLUSH_BAND_ROWS)
+            self._bg = 0x0000
+            self._ink = 0xFFFF
+            self._set_palette()
+            self._clear_damage()
+            self._band_views = {}
+
+        # Scratch buffers reused by every transaction so drawing never
+        # allocates on the hot path.
+        self._cmd_buf = bytearray(1)
+        self._win_buf = bytearray(4)
+        self._color_buf = bytearray(2)
+        # Most-recently-used first: [color, pre-expanded RGB565 row].
+        self._row_cache = [[-1, bytearray(width * 2)] for _ in range(ROW_CACHE_SIZE)]
 
         self.dc.init(self.dc.OUT, value=0)
         self.cs.init(self.cs.OUT, value=1)
@@ -27,22 +76,55 @@ class ILI9341:
 
         self._init_display()
 
-    def _write_cmd(self, cmd):
+    # Transactions: CS stays low from _begin() to _end(), so any number of
+    # _tx_cmd/_tx_data/_tx_window calls can be chained in between.
+    def _begin(self):
         self.cs(0)
-        self.dc(0)
-        self.spi.write(bytearray([cmd]))
+
+    def _end(self):
         self.cs(1)
 
-    def _write_data(self, data):
-        self.cs(0)
+    def _tx_cmd(self, cmd):
+        self._cmd_buf[0] = cmd
+        self.dc(0)
+        self.spi.write(self._cmd_buf)
+
+    def _tx_data(self, data):
         self.dc(1)
         self.spi.write(data)
-        self.cs(1)
+
+    def _tx_window(self, x0, y0, x1, y1):
+        buf = self._win_buf
+        self._tx_cmd(ILI9341_CASET)
+        buf[0] = x0 >> 8
+        buf[1] = x0 & 0xFF
+        buf[2] = x1 >> 8
+        buf[3] = x1 & 0xFF
+        self._tx_data(buf)
+        self._tx_cmd(ILI9341_PASET)
+        buf[0] = y0 >> 8
+        buf[1] = y0 & 0xFF
+        buf[2] = y1 >> 8
+        buf[3] = y1 & 0xFF
+        self._tx_data(buf)
+        self._tx_cmd(ILI9341_RAMWR)
+
+    def _write_cmd(self, cmd):
+        self._begin()
+        self._tx_cmd(cmd)
+        self._end()
+
+    def _write_data(self, data):
+        self._begin()
+        self._tx_data(data)
+        self._end()
 
     def _write_cmd_data(self, cmd, data):
-        self._write_cmd(cmd)
+        self._begin()
+        self._tx_cmd(cmd)
         if data:
-            self._write_data(data)
+            self._tx_data(data)
+        self._end()
 
     def _hard_reset(self):
         if self.rst is None:
@@ -54,13 +136,6 @@ class ILI9341:
         self.rst(1)
         utime.sleep_ms(120)
 
-    def _set_window(self, x0, y0, x1, y1):
-        self._write_cmd(ILI9341_CASET)
-        self._write_data(bytearray([x0 >> 8, x0 & 0xFF, x1 >> 8, x1 & 0xFF]))
-        self._write_cmd(ILI9341_PASET)
-        self._write_data(bytearray([y0 >> 8, y0 & 0xFF, y1 >> 8, y1 & 0xFF]))
-        self._write_cmd(ILI9341_RAMWR)
-
     def _init_display(self):
         self._hard_reset()
         self._write_cmd(ILI9341_SWRESET)
@@ -96,26 +171,180 @@ class ILI9341:
         self._write_cmd(ILI9341_DISPON)
         utime.sleep_ms(20)
 
+    def _set_palette(self):
+        # framebuf stores RGB565 little-endian; the panel wants big-endian.
+        self._palette.pixel(0, 0, ((self._bg & 0xFF) << 8) | (self._bg >> 8))
+        self._palette.pixel(1, 0, ((self._ink & 0xFF) << 8) | (self._ink >> 8))
+
+    def _clear_damage(self):
+        self._dmg_x0 = self.width
+        self._dmg_y0 = self.height
+        self._dmg_x1 = -1
+        self._dmg_y1 = -1
+
+    def _damage(self, x0, y0, x1, y1):
+        if x0 < self._dmg_x0:
+            self._dmg_x0 = x0
+        if y0 < self._dmg_y0:
+            self._dmg_y0 = y0
+        if x1 > self._dmg_x1:
+            self._dmg_x1 = x1
+        if y1 > self._dmg_y1:
+            self._dmg_y1 = y1
+
+    def _ink_index(self, color):
+        if color == self._bg:
+            return 0
+        if color != self._ink:
+            # Recolouring the ink changes every lit pixel on the panel.
+            self._ink = color
+            self._set_palette()
+            self._damage(0, 0, self.width - 1, self.height - 1)
+        return 1
+
     def pixel(self, x, y, color):
         if x < 0 or x >= self.width or y < 0 or y >= self.height:
             return
-        self._set_window(x, y, x, y)
-        self._write_data(bytearray([color >> 8, color & 0xFF]))
-
-    def fill(self, color):
-        self._set_window(0, 0, self.width - 1, self.height - 1)
-        row = bytearray(self.width * 2)
+        if self.deferred:
+            self._canvas.pixel(x, y, self._ink_index(color))
+            self._damage(x, y, x, y)
+            return
+        buf = self._color_buf
+        buf[0] = color >> 8
+        buf[1] = color & 0xFF
+        self._begin()
+        self._tx_window(x, y, x, y)
+        self._tx_data(buf)
+        self._end()
+
+    def _color_row(self, color):
+        cache = self._row_cache
+        for i in range(len(cache)):
+            entry = cache[i]
+            if entry[0] == color:
+                if i:
+                    cache.pop(i)
+                    cache.insert(0, entry)
+                return entry[1]
+
+        # Miss: recycle the least recently used row for the new colour.
+        entry = cache.pop()
+        row = entry[1]
         hi = (color >> 8) & 0xFF
         lo = color & 0xFF
         for i in range(0, len(row), 2):
             row[i] = hi
             row[i + 1] = lo
-        for _ in range(self.height):
-            self._write_data(row)
+        entry[0] = color
+        cache.insert(0, entry)
+        return row
+
+    def _stream_rect(self, x, y, w, h, color):
+        # A solid rectangle is w * h copies of one colour, so the cached row
+        # is streamed repeatedly inside a single RAMWR transaction.
+        row = self._color_row(color)
+        remaining = w * h * 2
+        self._begin()
+        self._tx_window(x, y, x + w - 1, y + h - 1)
+        self.dc(1)
+        while remaining >= len(row):
+            self.spi.write(row)
+            remaining -= len(row)
+        if remaining:
+            self.spi.write(memoryview(row)[:remaining])
+        self._end()
+
+    def fill_rect(self, x, y, w, h, color):
+        if x < 0:
+            w += x
+            x = 0
+        if y < 0:
+            h += y
+            y = 0
+        if x + w > self.width:
+            w = self.width - x
+        if y + h > self.height:
+            h = self.height - y
+        if w <= 0 or h <= 0:
+            return
+        if self.deferred:
+            self._canvas.fill_rect(x, y, w, h, self._ink_index(color))
+            self._damage(x, y, x + w - 1, y + h - 1)
+            return
+        self._stream_rect(x, y, w, h, color)
+
+    def hline(self, x, y, w, color):
+        self.fill_rect(x, y, w, 1, color)
+
+    def vline(self, x, y, h, color):
+        self.fill_rect(x, y, 1, h, color)
+
+    def blit(self, fbuf, x, y):
+        # Draws a 1bpp framebuffer in the ink colour; like the framebuf
+        # drivers it marks the whole screen. Deferred mode only.
+        if not self.deferred:
+            raise ValueError("blit needs deferred mode")
+        self._canvas.blit(fbuf, x, y)
+        self._damage(0, 0, self.width - 1, self.height - 1)
+
+    def fill(self, color):
+        if self.deferred:
+            # A clear is streamed straight away; whatever damage was pending
+            # is covered by it.
+            self._bg = color
+            self._set_palette()
+            self._canvas.fill(0)
+            self._clear_damage()
+        self._stream_rect(0, 0, self.width, self.height, color)
 
     def show(self):
-        # Immediate mode driver writes directly.
-        pass
+        # Immediate mode driver writes directly; deferred mode flushes the
+        # damaged rectangle in one windowed RAMWR burst.
+        if not self.deferred or self._dmg_x1 < 0:
+            return
+        x0 = self._dmg_x0
+        y0 = self._dmg_y0
+        x1 = self._dmg_x1
+        y1 = self._dmg_y1
+        self._clear_damage()
+
+        w = x1 - x0 + 1
+        band, band_mv, row_mv, rows = self._band_view(w)
+
+        self._begin()
+        self._tx_window(x0, y0, x1, y1)
+        self.dc(1)
+        yy = y0
+        while y1 - yy + 1 >= rows:
+            band.blit(self._canvas, -x0, -yy, -1, self._palette)
+            self.spi.write(band_mv)
+            yy += rows
+        # The tail goes row by row so no partial-band view is sliced.
+        while yy <= y1:
+            band.blit(self._canvas, -x0, -yy, -1, self._palette)
+            self.spi.write(row_mv)
+            yy += 1
+        self._end()
+
+    def _band_view(self, w):
+        # RGB565 views over the band buffer for a damage rectangle w pixels
+        # wide, cached so a steady stream of similar flushes allocates nothing.
+        view = self._band_views.get(w)
+        if view is None:
+            if len(self._band_views) >= BAND_VIEW_CACHE:
+                self._band_views.clear()
+            rows = len(self._band) // (w * 2)
+            if rows > self.height:
+                rows = self.height
+            mv = memoryview(self._band)
+            view = (
+                framebuf.FrameBuffer(self._band, w, rows, framebuf.RGB565),
+                mv[: w * 2 * rows],
+                mv[: w * 2],
+                rows,
+            )
+            self._band_views[w] = view
+        return view
 
 
 spi = SPI(
@@ -134,8 +363,17 @@ display = ILI9341(
     dc=Pin(20, Pin.OUT),
     cs=Pin(17, Pin.OUT),
     rst=None,
+    deferred=True,
 )
 
+# Count the display's SPI traffic (see bus_trace.py); print it from the
+# REPL with bus_trace.report().
+BUS_TRACE = False
+if BUS_TRACE:
+    import bus_trace
+
+    bus_trace.attach(display, "ILI9341", ("_tx_window", "_stream_rect", "show"))
+
 # Encoder 1 controls Y
 E1_CLK_PIN = 2
 E1_DT_PIN = 3
@@ -146,13 +384,15 @@ E2_CLK_PIN = 5
 E2_DT_PIN = 6
 E2_SW_PIN = 7
 
-e1_clk = Pin(E1_CLK_PIN, Pin.IN, Pin.PULL_UP)
-e1_dt = Pin(E1_DT_PIN, Pin.IN, Pin.PULL_UP)
-e1_sw = Pin(E1_SW_PIN, Pin.IN, Pin.PULL_UP)
-
-e2_clk = Pin(E2_CLK_PIN, Pin.IN, Pin.PULL_UP)
-e2_dt = Pin(E2_DT_PIN, Pin.IN, Pin.PULL_UP)
-e2_sw = Pin(E2_SW_PIN, Pin.IN, Pin.PULL_UP)
+# Knob steps and button edges arrive from IRQs through an event ring
+# (see input_events.py); rotation itself is decoded by PIO state machines.
+ENC1 = 0
+ENC2 = 1
+events = EventRing(64)
+knob1 = attach_knob(events, ENC1, 4, E1_CLK_PIN, E1_DT_PIN)
+knob2 = attach_knob(events, ENC2, 5, E2_CLK_PIN, E2_DT_PIN)
+button1 = attach_button(events, ENC1, E1_SW_PIN)
+button2 = attach_button(events, ENC2, E2_SW_PIN)
 
 WHITE = 0xFFFF
 BLACK = 0x0000
@@ -160,27 +400,62 @@ BLACK = 0x0000
 DRAW_W = 240
 DRAW_H = 320
 
+# Undo journal size; older points are folded into the coverage grid.
+HISTORY_BUDGET_BYTES = 64 * 1024
+
+# Drawing saved on flash; see journal.py.
+JOURNAL_PATH = "sketch.jnl"
+
+# Holding both buttons for SAVE_HOLD_MS saves the drawing and opens the
+# gallery; the knobs scroll it and a button press goes back to drawing.
+GALLERY_PATH = "gallery_tft.idx"
+SAVE_HOLD_MS = 1000
+THUMB_W = 56
+THUMB_H = 75
+GALLERY_COLS = 4
+GALLERY_ROWS = 4
+
 display.fill(0xF800)
+display.show()
 utime.sleep_ms(200)
 display.fill(BLACK)
 
 x = DRAW_W // 2
 y = DRAW_H // 2
 display.pixel(x, y, WHITE)
-
-points = [(x, y, 0)]
-redo_stack = []
+display.show()
+
+points = History(HISTORY_BUDGET_BYTES)
+points.append(x, y, 0)
+coverage = CoverageGrid(DRAW_W, DRAW_H)
+coverage.add(x, y)
+journal = Journal(JOURNAL_PATH, coverage, points)
+gallery = Gallery(GALLERY_PATH, THUMB_W, THUMB_H, framebuf.MONO_HLSB)
+view = GalleryView(
+    gallery,
+    display,
+    GALLERY_COLS,
+    GALLERY_ROWS,
+    DRAW_W // GALLERY_COLS,
+    DRAW_H // GALLERY_ROWS,
+    WHITE,
+    BLACK,
+)
 
 draw_time_ms = 0
 last_move_real_ms = None
 MAX_MOVE_GAP_MS = 150
 
-last_clk1 = e1_clk.value()
-last_clk2 = e2_clk.value()
-last_sw1 = e1_sw.value()
-last_sw2 = e2_sw.value()
 last_btn1_ms = 0
 last_btn2_ms = 0
+btn1_down = False
+btn2_down = False
+both_down_ms = 0
+browsing = False
+pending_close = False
+pending_browse = 0
+pending_revert = False
+chord_base = 0
 
 dirty = False
 pending_dx = 0
@@ -208,14 +483,21 @@ def queue_move(dx, dy):
     pending_dy += dy
 
 
+def paint_span(sx, sy, n):
+    display.hline(sx, sy, n, WHITE)
+
+
 def rebuild_canvas_from_points():
+    # Full redraw from the coverage grid, which holds the live history as
+    # well as points already evicted from the journal. Covered pixels come
+    # back as horizontal runs, one hline each.
     display.fill(BLACK)
-    for px, py, _ in points:
-        display.pixel(px, py, WHITE)
+    coverage.spans(paint_span)
 
 
-def step_cursor(dx, dy):
-    global x, y, redo_stack, draw_time_ms, last_move_real_ms
+def step_cursor(dx, dy, n=1):
+    # Moves n unit steps along one axis and draws the run as one span.
+    global x, y, draw_time_ms, last_move_real_ms
     now = utime.ticks_ms()
     if last_move_real_ms is not None:
         dt = utime.ticks_diff(now, last_move_real_ms)
@@ -224,110 +506,221 @@ def step_cursor(dx, dy):
         draw_time_ms += dt if dt < MAX_MOVE_GAP_MS else MAX_MOVE_GAP_MS
     last_move_real_ms = now
 
-    nx = clamp(x + dx, 0, DRAW_W - 1)
-    ny = clamp(y + dy, 0, DRAW_H - 1)
+    nx = clamp(x + dx * n, 0, DRAW_W - 1)
+    ny = clamp(y + dy * n, 0, DRAW_H - 1)
     if nx != x or ny != y:
-        x = nx
-        y = ny
-        display.pixel(x, y, WHITE)
-        points.append((x, y, draw_time_ms))
-        redo_stack = []
+        if dx:
+            display.hline(min(x + dx, nx), y, abs(nx - x), WHITE)
+        else:
+            display.vline(x, min(y + dy, ny), abs(ny - y), WHITE)
+        while x != nx or y != ny:
+            x += dx
+            y += dy
+            points.append(x, y, draw_time_ms)
+            coverage.add(x, y)
+            journal.point(x, y, draw_time_ms)
         mark_dirty()
 
 
-def undo_last_two_seconds(now):
-    global x, y, points
-    del now
-    kept = []
-    removed = []
-    for px, py, pt in points:
-        if draw_time_ms - pt > 2000:
-            kept.append((px, py, pt))
-        else:
-            removed.append((px, py, pt))
+def undo_last_two_seconds():
+    # The oldest held point anchors the cursor and is never undone.
+    if undo_to(points.find_time(draw_time_ms - 2000)):
+        journal.truncate(len(points))
 
-    if not removed:
-        return
 
-    if not kept:
-        x = DRAW_W // 2
-        y = DRAW_H // 2
-        kept = [(x, y, draw_time_ms)]
+def redo_last_undo():
+    if redo_to(points.redo_end):
+        journal.restore(len(points))
 
-    redo_stack.append(removed)
-    x, y, _ = kept[-1]
 
-    points = kept
-    rebuild_canvas_from_points()
+def undo_to(cut):
+    # Cuts the history back to cut points; returns False if nothing changed.
+    global x, y
+    if cut <= points.base:
+        cut = points.base + 1
+    end = len(points)
+    if cut >= end:
+        return False
+
+    # Only pixels no longer covered by any remaining point are erased.
+    for px, py, _ in points.iter(cut, end):
+        if coverage.remove(px, py):
+            display.pixel(px, py, BLACK)
+
+    points.truncate(cut)
+
+    x, y, _ = points[-1]
     mark_dirty()
+    return True
 
 
-def redo_last_undo():
-    global x, y, points
-    if not redo_stack:
-        return
+def redo_to(end):
+    global x, y
+    start = len(points)
+    if end > points.redo_end:
+        end = points.redo_end
+    if start >= end:
+        return False
 
-    restored = redo_stack.pop()
-    points.extend(restored)
+    for px, py, _ in points.iter(start, end):
+        if coverage.add(px, py):
+            display.pixel(px, py, WHITE)
+    points.restore(end)
     x, y, _ = points[-1]
-    rebuild_canvas_from_points()
     mark_dirty()
+    return True
 
 
-print("Wokwi TFT drawing screen ready")
+def restore_checkpoint(px, py):
+    # The journal has loaded the saved picture into the coverage grid; the
+    # history restarts from its cursor.
+    global x, y
+    x = px
+    y = py
+    points.clear()
+    points.append(x, y, 0)
 
-while True:
-    current_clk1 = e1_clk.value()
-    if last_clk1 == 1 and current_clk1 == 0:
-        if e1_dt.value() == 1:
-            queue_move(0, -1)
-        else:
-            queue_move(0, 1)
-    last_clk1 = current_clk1
 
-    current_clk2 = e2_clk.value()
-    if last_clk2 == 1 and current_clk2 == 0:
-        if e2_dt.value() == 1:
-            queue_move(1, 0)
-        else:
-            queue_move(-1, 0)
-    last_clk2 = current_clk2
+def restore_point(px, py, t):
+    global x, y, draw_time_ms
+    x = px
+    y = py
+    draw_time_ms = t
+    points.append(x, y, t)
+    coverage.add(x, y)
 
-    current_sw1 = e1_sw.value()
-    now = utime.ticks_ms()
-    if last_sw1 == 1 and current_sw1 == 0 and utime.ticks_diff(now, last_btn1_ms) > 200:
-        pending_undo = True
-        last_btn1_ms = now
-    last_sw1 = current_sw1
 
-    current_sw2 = e2_sw.value()
-    if last_sw2 == 1 and current_sw2 == 0 and utime.ticks_diff(now, last_btn2_ms) > 200:
-        pending_redo = True
-        last_btn2_ms = now
-    last_sw2 = current_sw2
+def revert_to(n):
+    # Puts the history back to n points.
+    if n < len(points):
+        if undo_to(n):
+            journal.truncate(len(points))
+    elif redo_to(n):
+        journal.restore(len(points))
+
+
+def save_and_browse():
+    global browsing
+    gallery.save(coverage, len(points), draw_time_ms)
+    browsing = True
+    view.open()
+
+
+def close_gallery():
+    global browsing
+    browsing = False
+    rebuild_canvas_from_points()
+
+
+# Bring back the drawing saved before power-off, then start a fresh
+# journal from it.
+if journal.recover(restore_checkpoint, restore_point, undo_to, redo_to):
+    rebuild_canvas_from_points()
+journal.start(x, y, len(points))
+
+
+print("Wokwi TFT drawing screen ready")
+
+# Pass and phase times, lost knob edges and dropped events, printed every
+# LOOP_REPORT_MS (0: never); see loop_profile.py.
+LOOP_REPORT_MS = 0
+profile = LoopProfiler((knob1, knob2), events, LOOP_REPORT_MS)
+
+while True:
+    profile.begin()
+    # Drain everything queued since the last pass as one batch.
+    queued = len(events)
+    for _ in range(queued):
+        code = events.pop()
+        enc = event_source(code)
+        kind = event_kind(code)
+        if kind == PRESS:
+            t = events.time
+            chord = btn2_down if enc == ENC1 else btn1_down
+            if enc == ENC1:
+                btn1_down = True
+            else:
+                btn2_down = True
+            if browsing:
+                pending_close = True
+            elif chord:
+                # Second button of the save chord: take back whatever the
+                # first one undid or redid.
+                both_down_ms = t
+                pending_undo = False
+                pending_redo = False
+                pending_revert = True
+            else:
+                chord_base = len(points)
+                if enc == ENC1 and utime.ticks_diff(t, last_btn1_ms) > 200:
+                    pending_undo = True
+                    last_btn1_ms = t
+                elif enc == ENC2 and utime.ticks_diff(t, last_btn2_ms) > 200:
+                    pending_redo = True
+                    last_btn2_ms = t
+        elif kind == RELEASE:
+            if enc == ENC1:
+                btn1_down = False
+            else:
+                btn2_down = False
+        else:
+            step = 1 if kind == STEP_UP else -1
+            if browsing:
+                pending_browse += -step * GALLERY_COLS if enc == ENC1 else step
+            elif enc == ENC1:
+                queue_move(0, -step)
+            else:
+                queue_move(step, 0)
+
+    profile.mark(PH_INPUT)
+
+    if pending_close:
+        pending_close = False
+        close_gallery()
+
+    if pending_browse:
+        view.move(pending_browse)
+        pending_browse = 0
+
+    if pending_revert:
+        pending_revert = False
+        revert_to(chord_base)
+
+    if (
+        btn1_down
+        and btn2_down
+        and not browsing
+        and utime.ticks_diff(utime.ticks_ms(), both_down_ms) >= SAVE_HOLD_MS
+    ):
+        save_and_browse()
 
     if pending_undo:
         pending_undo = False
-        undo_last_two_seconds(utime.ticks_ms())
+        undo_last_two_seconds()
 
     if pending_redo:
         pending_redo = False
         redo_last_undo()
 
-    while pending_dx != 0:
-        if pending_dx > 0:
-            pending_dx -= 1
-            step_cursor(1, 0)
-        else:
-            pending_dx += 1
-            step_cursor(-1, 0)
+    profile.mark(PH_UNDO)
 
-    while pending_dy != 0:
-        if pending_dy > 0:
-            pending_dy -= 1
-            step_cursor(0, 1)
-        else:
-            pending_dy += 1
-            step_cursor(0, -1)
+    moved = False
+    if pending_dx != 0 or pending_dy != 0:
+        moved = True
+        move_dx = pending_dx
+        move_dy = pending_dy
+        pending_dx = 0
+        pending_dy = 0
+        for sx, sy, n in line_runs(move_dx, move_dy):
+            step_cursor(sx, sy, n)
+
+    profile.mark(PH_MOVE)
+
+    display.show()
+    profile.mark(PH_DRAW)
 
+    if journal.checkpoint_due:
+        journal.checkpoint(x, y, len(points))
+    journal.service(not queued and not moved)
     utime.sleep_ms(1)
+    profile.mark(PH_SLEEP)
@@ -1,6 +1,25 @@
+from array import array
+
 from machine import Pin, I2C
 import utime
 
+from coverage import CoverageGrid
+from glyph_cache import GlyphCache
+from history import History
+from input_events import (
+    PRESS,
+    RELEASE,
+    STEP_UP,
+    EventRing,
+    attach_button,
+    attach_knob,
+    event_kind,
+    event_source,
+)
+from journal import Journal
+from loop_profile import PH_INPUT, PH_MOVE, PH_SLEEP, PH_UNDO, LoopProfiler
+from raster import line_runs
+
 # 1602 I2C backpack (PCF8574) pin map
 LCD_RS = 0x01
 LCD_RW = 0x02
@@ -12,63 +31,187 @@ LCD_CMD_HOME = 0x02
 LCD_CMD_ENTRY_MODE = 0x04
 LCD_CMD_DISPLAY_CTRL = 0x08
 LCD_CMD_FUNCTION = 0x20
+LCD_CMD_SET_CGRAM = 0x40
 LCD_CMD_SET_DDRAM = 0x80
 
+LCD_ROW_OFFSETS = (0x00, 0x40, 0x14, 0x54)
+
+# Give up on the busy flag (and fall back to fixed delays) after this long.
+LCD_BUSY_TIMEOUT_US = 5000
+
 
 class LCD1602_I2C:
-    def __init__(self, i2c, addr, cols=16, rows=2):
+    def __init__(self, i2c, addr, cols=16, rows=2, busy_poll=False):
         self.i2c = i2c
         self.addr = addr
         self.cols = cols
         self.rows = rows
         self.backlight = LCD_BACKLIGHT
+        # Busy-flag mode reads BF through the expander instead of sleeping
+        # for the worst case; it switches itself off if reads fail.
+        self.busy_poll = busy_poll
+        self.busy_waits = 0
+        self.busy_wait_us = 0
+        self._bf_rx = bytearray(1)
+        # What display RAM holds (shadow) and what set_cell() asked for
+        # (frame), one byte per cell. flush() sends only the differences.
+        self._shadow = bytearray(b" " * (cols * rows))
+        self._frame = bytearray(b" " * (cols * rows))
+        # DDRAM address the LCD will write next, or -1 when unknown.
+        self._addr = -1
+        # Expander bytes for a batch of LCD writes, sent in one writeto().
+        # Room for a full-screen flush with a cursor move before every cell.
+        self._tx = bytearray(12 * cols * rows)
+        self._tx_mv = memoryview(self._tx)
+        self._tx_len = 0
         self._init_lcd()
 
-    def _write_byte(self, data):
-        self.i2c.writeto(self.addr, bytes([data]))
-
-    def _pulse_enable(self, data):
-        self._write_byte(data | LCD_E)
-        utime.sleep_us(1)
-        self._write_byte(data & ~LCD_E)
-        utime.sleep_us(50)
-
-    def _write4(self, value, mode=0):
+    def _pack4(self, value, mode):
+        # The PCF8574 latches every byte it receives, so a nibble is the
+        # three bytes data, data|E, data; the I2C byte time covers the E
+        # pulse width and the 37 us the LCD needs between writes.
         data = ((value & 0x0F) << 4) | self.backlight
         if mode:
             data |= LCD_RS
-        self._write_byte(data)
-        self._pulse_enable(data)
+        tx = self._tx
+        n = self._tx_len
+        tx[n] = data
+        tx[n + 1] = data | LCD_E
+        tx[n + 2] = data
+        self._tx_len = n + 3
+
+    def _pack(self, value, mode=0):
+        if self._tx_len + 6 > len(self._tx):
+            self._commit()
+        self._pack4(value >> 4, mode)
+        self._pack4(value & 0x0F, mode)
+
+    def _commit(self):
+        if self._tx_len:
+            self.i2c.writeto(self.addr, self._tx_mv[: self._tx_len])
+            self._tx_len = 0
+
+    def _write4(self, value, mode=0):
+        self._pack4(value, mode)
+        self._commit()
 
     def _send(self, value, mode=0):
-        self._write4(value >> 4, mode)
-        self._write4(value & 0x0F, mode)
+        self._pack(value, mode)
+        self._commit()
 
     def command(self, cmd):
         self._send(cmd, 0)
-        if cmd == LCD_CMD_CLEAR or cmd == LCD_CMD_HOME:
+        if self.busy_poll:
+            self._wait_ready()
+        elif cmd == LCD_CMD_CLEAR or cmd == LCD_CMD_HOME:
             utime.sleep_ms(2)
 
+    def _read_busy(self):
+        # One 4-bit status read with RW high. Data lines are written high
+        # so the LCD can pull them low; BF is bit 7 of the first nibble,
+        # and the second nibble is clocked out to stay in step.
+        self._commit()
+        data = 0xF0 | self.backlight | LCD_RW
+        tx = self._tx
+        tx[0] = data
+        tx[1] = data | LCD_E
+        self.i2c.writeto(self.addr, self._tx_mv[:2])
+        self.i2c.readfrom_into(self.addr, self._bf_rx)
+        tx[1] = data
+        tx[2] = data | LCD_E
+        tx[3] = data
+        self.i2c.writeto(self.addr, self._tx_mv[1:4])
+        return self._bf_rx[0] & 0x80
+
+    def _wait_ready(self):
+        start = utime.ticks_us()
+        try:
+            while self._read_busy():
+                if utime.ticks_diff(utime.ticks_us(), start) > LCD_BUSY_TIMEOUT_US:
+                    raise OSError("LCD busy flag stuck")
+        except OSError:
+            self.busy_poll = False
+            utime.sleep_ms(2)
+            return
+        self.busy_waits += 1
+        self.busy_wait_us += utime.ticks_diff(utime.ticks_us(), start)
+
+    def command_latency_us(self):
+        # Average measured command time in busy-flag mode, or None.
+        if not self.busy_waits:
+            return None
+        return self.busy_wait_us // self.busy_waits
+
+    # putchar/putstr/move_to talk to the LCD directly and bypass the
+    # shadow; drawing code should use set_cell() and flush().
     def putchar(self, ch):
         self._send(ord(ch), 1)
+        self._addr = -1
 
     def putstr(self, s):
         for ch in s:
-            self.putchar(ch)
+            self._pack(ord(ch), 1)
+        self._commit()
+        self._addr = -1
 
     def move_to(self, col, row):
-        row_offsets = [0x00, 0x40, 0x14, 0x54]
-        self.command(LCD_CMD_SET_DDRAM | (col + row_offsets[row]))
+        self.command(LCD_CMD_SET_DDRAM | (col + LCD_ROW_OFFSETS[row]))
+        self._addr = -1
 
     def clear(self):
         self.command(LCD_CMD_CLEAR)
+        for i in range(len(self._shadow)):
+            self._shadow[i] = 0x20
+            self._frame[i] = 0x20
+        self._addr = 0
+
+    def set_cell(self, col, row, ch):
+        self._frame[row * self.cols + col] = ord(ch)
+
+    def set_code(self, col, row, code):
+        self._frame[row * self.cols + col] = code
+
+    def define_glyph(self, slot, rows):
+        # Uploads 8 dot rows for custom character `slot` (0-7). Cells
+        # already showing that code change with it.
+        self._pack(LCD_CMD_SET_CGRAM | (slot << 3), 0)
+        for r in rows:
+            self._pack(r, 1)
+        self._commit()
+        self._addr = -1
+
+    def flush(self):
+        # Writes each run of adjacent changed cells as one cursor move
+        # followed by its characters, skipping the move when the LCD's
+        # address counter is already there.
+        cols = self.cols
+        shadow = self._shadow
+        frame = self._frame
+        for row in range(self.rows):
+            base = row * cols
+            col = 0
+            while col < cols:
+                i = base + col
+                if frame[i] == shadow[i]:
+                    col += 1
+                    continue
+                addr = LCD_ROW_OFFSETS[row] + col
+                if addr != self._addr:
+                    self._pack(LCD_CMD_SET_DDRAM | addr, 0)
+                while col < cols and frame[base + col] != shadow[base + col]:
+                    v = frame[base + col]
+                    self._pack(v, 1)
+                    shadow[base + col] = v
+                    col += 1
+                    addr += 1
+                self._addr = addr
+        self._commit()
 
     def write_row(self, row, text):
-        self.move_to(0, row)
         s = str(text)
-        if len(s) < self.cols:
-            s = s + (" " * (self.cols - len(s)))
-        self.putstr(s[: self.cols])
+        for col in range(self.cols):
+            self.set_cell(col, row, s[col] if col < len(s) else " ")
+        self.flush()
 
     def _init_lcd(self):
         utime.sleep_ms(50)
@@ -96,6 +239,11 @@ I2C_CANDIDATES = [
 
 LCD_COLS = 16
 LCD_ROWS = 2
+# Bitmap mode draws on the 5x8 dots of every cell (80x16) through custom
+# CGRAM glyphs; otherwise each character cell is one pixel (16x2).
+LCD_BITMAP_MODE = True
+# Poll the HD44780 busy flag instead of waiting fixed worst-case delays.
+LCD_BUSY_POLL = True
 
 # Encoder 1 controls X (direction already swapped to your preference)
 E1_CLK_PIN = 2
@@ -132,7 +280,7 @@ def find_working_lcd():
 
         for addr in preferred:
             try:
-                lcd = LCD1602_I2C(bus, addr, LCD_COLS, LCD_ROWS)
+                lcd = LCD1602_I2C(bus, addr, LCD_COLS, LCD_ROWS, LCD_BUSY_POLL)
                 lcd.write_row(0, "LCD1602 READY")
                 lcd.write_row(1, "Addr {}".format(hex(addr)))
                 utime.sleep_ms(500)
@@ -166,69 +314,185 @@ def queue_move(dx, dy):
     pending_dy += dy
 
 
+def plot(px, py, on):
+    if LCD_BITMAP_MODE:
+        # Cell-major bitmap: 8 row bytes per cell, leftmost dot in bit 4.
+        i = ((py >> 3) * LCD_COLS + px // 5) * 8 + (py & 7)
+        bit = 0x10 >> (px % 5)
+        if on:
+            canvas[i] |= bit
+        else:
+            canvas[i] &= ~bit
+    else:
+        canvas[py][px] = "#" if on else " "
+
+
+def plot_span(sx, sy, n):
+    for px in range(sx, sx + n):
+        plot(px, sy, True)
+
+
 def rebuild_canvas_from_points():
+    # Full redraw from the coverage grid, which holds the live history as
+    # well as points already evicted from the journal. Only covered runs
+    # are visited; the blank canvas covers the rest.
     global canvas
-    canvas = [[" " for _ in range(DRAW_W)] for _ in range(DRAW_H)]
-    for px, py in points:
-        canvas[py][px] = "#"
+    if LCD_BITMAP_MODE:
+        canvas = bytearray(LCD_COLS * LCD_ROWS * 8)
+    else:
+        canvas = [[" "] * DRAW_W for _ in range(DRAW_H)]
+    coverage.spans(plot_span)
     render()
 
 
-def render():
-    row0 = canvas[0][:]
-    row1 = canvas[1][:]
+def render_bitmap():
+    # Patterns already in CGRAM are pinned first, so a new pattern can only
+    # evict a glyph that is no longer on screen.
+    glyphs.begin()
+    for c in range(LCD_COLS * LCD_ROWS):
+        i = c * 8
+        a = (canvas[i] << 15) | (canvas[i + 1] << 10) | (canvas[i + 2] << 5)
+        a |= canvas[i + 3]
+        b = (canvas[i + 4] << 15) | (canvas[i + 5] << 10) | (canvas[i + 6] << 5)
+        b |= canvas[i + 7]
+        cell_a[c] = a
+        cell_b[c] = b
+        cell_code[c] = glyphs.find(a, b)
+    for c in range(LCD_COLS * LCD_ROWS):
+        code = cell_code[c]
+        if code < 0:
+            code = glyphs.assign(cell_a[c], cell_b[c])
+        lcd.set_code(c % LCD_COLS, c // LCD_COLS, code)
+    lcd.flush()
+    # The blinking hardware cursor marks the cell under the drawing cursor.
+    lcd.move_to(x // 5, y >> 3)
 
-    if y == 0:
-        row0[x] = "@"
-    else:
-        row1[x] = "@"
 
-    lcd.write_row(0, "".join(row0))
-    lcd.write_row(1, "".join(row1))
+def render():
+    # Loads the frame into the LCD shadow; flush() only sends changed cells.
+    if LCD_BITMAP_MODE:
+        render_bitmap()
+        return
+    for yy in range(DRAW_H):
+        row = canvas[yy]
+        for xx in range(DRAW_W):
+            lcd.set_cell(xx, yy, row[xx])
+    lcd.set_cell(x, y, "@")
+    lcd.flush()
 
 
-def step_cursor(dx, dy):
-    global x, y, redo_stack
+def step_cursor(dx, dy, n=1):
+    # Moves n unit steps along one axis and renders once for the whole run.
+    global x, y
 
-    nx = clamp(x + dx, 0, DRAW_W - 1)
-    ny = clamp(y + dy, 0, DRAW_H - 1)
+    nx = clamp(x + dx * n, 0, DRAW_W - 1)
+    ny = clamp(y + dy * n, 0, DRAW_H - 1)
     if nx != x or ny != y:
-        x = nx
-        y = ny
-        canvas[y][x] = "#"
-        points.append((x, y))
-        redo_stack = []
+        while x != nx or y != ny:
+            x += dx
+            y += dy
+            plot(x, y, True)
+            points.append(x, y)
+            coverage.add(x, y)
+            journal.point(x, y)
         render()
 
 
 def undo_step():
-    global x, y, points
-    if len(points) <= 1:
-        return
+    if undo_to(len(points) - 1):
+        journal.truncate(len(points))
+        render()
+
+
+def redo_step():
+    if redo_to(len(points) + 1):
+        journal.restore(len(points))
+        render()
 
-    removed = points.pop()
-    redo_stack.append([removed])
+
+def undo_to(cut):
+    # Cuts the history back to cut points; returns False if nothing changed.
+    # The caller renders.
+    global x, y
+    if cut <= points.base:
+        cut = points.base + 1
+    end = len(points)
+    if cut >= end:
+        return False
+
+    for px, py in points.iter(cut, end):
+        if coverage.remove(px, py):
+            plot(px, py, False)
+    points.truncate(cut)
     x, y = points[-1]
-    rebuild_canvas_from_points()
+    return True
 
 
-def redo_step():
-    global x, y, points
-    if not redo_stack:
-        return
+def redo_to(end):
+    global x, y
+    start = len(points)
+    if end > points.redo_end:
+        end = points.redo_end
+    if start >= end:
+        return False
 
-    restored = redo_stack.pop()
-    points.extend(restored)
+    for px, py in points.iter(start, end):
+        if coverage.add(px, py):
+            plot(px, py, True)
+    points.restore(end)
     x, y = points[-1]
-    rebuild_canvas_from_points()
+    return True
+
+
+def restore_checkpoint(px, py):
+    # The journal has loaded the saved picture into the coverage grid; the
+    # history restarts from its cursor.
+    global x, y
+    x = px
+    y = py
+    points.clear()
+    points.append(x, y)
+
+
+def restore_point(px, py, t):
+    # This history keeps no timestamps.
+    global x, y
+    del t
+    x = px
+    y = py
+    points.append(x, y)
+    coverage.add(x, y)
 
 
 lcd, i2c_id, scl_pin, sda_pin, addrs, addr = find_working_lcd()
 
-DRAW_W = LCD_COLS
-DRAW_H = LCD_ROWS
+# Count the LCD's I2C traffic (see bus_trace.py); print it from the REPL
+# with bus_trace.report(). _commit is one expander burst of E pulses.
+BUS_TRACE = False
+if BUS_TRACE:
+    import bus_trace
+
+    bus_trace.attach(lcd, "LCD1602_I2C", ("_commit", "_wait_ready", "flush"))
+
+if LCD_BITMAP_MODE:
+    DRAW_W = LCD_COLS * 5
+    DRAW_H = LCD_ROWS * 8
+    canvas = bytearray(LCD_COLS * LCD_ROWS * 8)
+    glyphs = GlyphCache(lcd.define_glyph)
+    # Per-cell pattern halves and codes for render_bitmap().
+    cell_a = array("I", (0 for _ in range(LCD_COLS * LCD_ROWS)))
+    cell_b = array("I", (0 for _ in range(LCD_COLS * LCD_ROWS)))
+    cell_code = array("h", (0 for _ in range(LCD_COLS * LCD_ROWS)))
+else:
+    DRAW_W = LCD_COLS
+    DRAW_H = LCD_ROWS
+    canvas = [[" " for _ in range(DRAW_W)] for _ in range(DRAW_H)]
+
+# Undo journal size; older points are folded into the coverage grid.
+HISTORY_BUDGET_BYTES = 16 * 1024
 
-canvas = [[" " for _ in range(DRAW_W)] for _ in range(DRAW_H)]
+# Drawing saved on flash; see journal.py.
+JOURNAL_PATH = "sketch.jnl"
 
 # Strong visual check on boot.
 lcd.write_row(0, "SKETCH READY")
@@ -238,22 +502,30 @@ utime.sleep_ms(400)
 
 x = DRAW_W // 2
 y = DRAW_H // 2
-canvas[y][x] = "#"
-points = [(x, y)]
-redo_stack = []
-
-render()
-
-e1_clk = Pin(E1_CLK_PIN, Pin.IN, Pin.PULL_UP)
-e1_dt = Pin(E1_DT_PIN, Pin.IN, Pin.PULL_UP)
-e1_sw = Pin(E1_SW_PIN, Pin.IN, Pin.PULL_UP)
-
-e2_clk = Pin(E2_CLK_PIN, Pin.IN, Pin.PULL_UP)
-e2_dt = Pin(E2_DT_PIN, Pin.IN, Pin.PULL_UP)
-e2_sw = Pin(E2_SW_PIN, Pin.IN, Pin.PULL_UP)
-
-last_clk1 = e1_clk.value()
-last_clk2 = e2_clk.value()
+plot(x, y, True)
+points = History(HISTORY_BUDGET_BYTES, timestamps=False)
+points.append(x, y)
+coverage = CoverageGrid(DRAW_W, DRAW_H)
+coverage.add(x, y)
+journal = Journal(JOURNAL_PATH, coverage, points)
+
+# Bring back the drawing saved before power-off, then start a fresh
+# journal from it.
+if journal.recover(restore_checkpoint, restore_point, undo_to, redo_to):
+    rebuild_canvas_from_points()
+else:
+    render()
+journal.start(x, y, len(points))
+
+# Knob steps and button edges arrive from IRQs through an event ring
+# (see input_events.py); rotation itself is decoded by PIO state machines.
+ENC1 = 0
+ENC2 = 1
+events = EventRing(64)
+knob1 = attach_knob(events, ENC1, 4, E1_CLK_PIN, E1_DT_PIN)
+knob2 = attach_knob(events, ENC2, 5, E2_CLK_PIN, E2_DT_PIN)
+button1 = attach_button(events, ENC1, E1_SW_PIN)
+button2 = attach_button(events, ENC2, E2_SW_PIN)
 
 pending_dx = 0
 pending_dy = 0
@@ -272,50 +544,53 @@ print("LCD1602 sketch ready")
 print("I2C bus:", i2c_id, "SCL=GP" + str(scl_pin), "SDA=GP" + str(sda_pin))
 print("I2C addresses found:", addrs)
 print("Using LCD address:", hex(addr))
+if lcd.busy_poll:
+    print("LCD command latency:", lcd.command_latency_us(), "us")
+
+# Pass and phase times, lost knob edges and dropped events, printed every
+# LOOP_REPORT_MS (0: never); see loop_profile.py.
+LOOP_REPORT_MS = 0
+profile = LoopProfiler((knob1, knob2), events, LOOP_REPORT_MS)
 
 while True:
-    current_clk1 = e1_clk.value()
-    if last_clk1 == 1 and current_clk1 == 0:
-        # Swapped direction for encoder 1.
-        if e1_dt.value() == 1:
-            queue_move(1, 0)
+    profile.begin()
+    # Drain everything queued since the last pass as one batch.
+    queued = len(events)
+    for _ in range(queued):
+        code = events.pop()
+        enc = event_source(code)
+        kind = event_kind(code)
+        if kind == PRESS:
+            t = events.time
+            if enc == ENC1:
+                pending_undo = True
+                undo_hold_active = True
+                next_undo_repeat_ms = utime.ticks_add(t, UNDO_HOLD_DELAY_MS)
+            else:
+                pending_redo = True
+                redo_hold_active = True
+                next_redo_repeat_ms = utime.ticks_add(t, REDO_HOLD_DELAY_MS)
+        elif kind == RELEASE:
+            if enc == ENC1:
+                undo_hold_active = False
+            else:
+                redo_hold_active = False
         else:
-            queue_move(-1, 0)
-    last_clk1 = current_clk1
+            step = 1 if kind == STEP_UP else -1
+            if enc == ENC1:
+                queue_move(step, 0)
+            else:
+                queue_move(0, step)
 
-    current_clk2 = e2_clk.value()
-    if last_clk2 == 1 and current_clk2 == 0:
-        if e2_dt.value() == 1:
-            queue_move(0, 1)
-        else:
-            queue_move(0, -1)
-    last_clk2 = current_clk2
+    profile.mark(PH_INPUT)
 
     now = utime.ticks_ms()
-
-    current_sw1 = e1_sw.value()
-    if current_sw1 == 0:
-        if not undo_hold_active:
-            pending_undo = True
-            undo_hold_active = True
-            next_undo_repeat_ms = utime.ticks_add(now, UNDO_HOLD_DELAY_MS)
-        elif utime.ticks_diff(now, next_undo_repeat_ms) >= 0:
-            pending_undo = True
-            next_undo_repeat_ms = utime.ticks_add(now, HOLD_REPEAT_MS)
-    else:
-        undo_hold_active = False
-
-    current_sw2 = e2_sw.value()
-    if current_sw2 == 0:
-        if not redo_hold_active:
-            pending_redo = True
-            redo_hold_active = True
-            next_redo_repeat_ms = utime.ticks_add(now, REDO_HOLD_DELAY_MS)
-        elif utime.ticks_diff(now, next_redo_repeat_ms) >= 0:
-            pending_redo = True
-            next_redo_repeat_ms = utime.ticks_add(now, HOLD_REPEAT_MS)
-    else:
-        redo_hold_active = False
+    if undo_hold_active and utime.ticks_diff(now, next_undo_repeat_ms) >= 0:
+        pending_undo = True
+        next_undo_repeat_ms = utime.ticks_add(now, HOLD_REPEAT_MS)
+    if redo_hold_active and utime.ticks_diff(now, next_redo_repeat_ms) >= 0:
+        pending_redo = True
+        next_redo_repeat_ms = utime.ticks_add(now, HOLD_REPEAT_MS)
 
     if pending_undo:
         pending_undo = False
@@ -325,25 +600,24 @@ while True:
         pending_redo = False
         redo_step()
 
-    moved = False
-    while pending_dx != 0:
-        moved = True
-        if pending_dx > 0:
-            pending_dx -= 1
-            step_cursor(1, 0)
-        else:
-            pending_dx += 1
-            step_cursor(-1, 0)
+    profile.mark(PH_UNDO)
 
-    while pending_dy != 0:
+    moved = False
+    if pending_dx != 0 or pending_dy != 0:
         moved = True
-        if pending_dy > 0:
-            pending_dy -= 1
-            step_cursor(0, 1)
-        else:
-            pending_dy += 1
-            step_cursor(0, -1)
-
+        move_dx = pending_dx
+        move_dy = pending_dy
+        pending_dx = 0
+        pending_dy = 0
+        for sx, sy, n in line_runs(move_dx, move_dy):
+            step_cursor(sx, sy, n)
+
+    profile.mark(PH_MOVE)
+
+    if journal.checkpoint_due:
+        journal.checkpoint(x, y, len(points))
+    journal.service(not queued and not moved)
     if not moved:
         utime.sleep_ms(1)
+    profile.mark(PH_SLEEP)
 
@@ -3,6 +3,24 @@ import utime
 import framebuf
 from micropython import const
 
+from coverage import CoverageGrid
+from gallery import Gallery, GalleryView
+from history import History
+from input_events import (
+    PRESS,
+    RELEASE,
+    STEP_UP,
+    EventRing,
+    attach_button,
+    attach_knob,
+    event_kind,
+    event_source,
+)
+from journal import Journal
+from loop_profile import PH_DRAW, PH_INPUT, PH_MOVE, PH_SLEEP, PH_UNDO, LoopProfiler
+from raster import line_runs
+from render_scheduler import RenderScheduler
+
 SET_CONTRAST = const(0x81)
 SET_ENTIRE_ON = const(0xA4)
 SET_NORM_INV = const(0xA6)
@@ -21,6 +39,15 @@ SET_PRECHARGE = const(0xD9)
 SET_VCOM_DESEL = const(0xDB)
 SET_CHARGE_PUMP = const(0x8D)
 
+# Bytes per I2C data transfer; 0 sends each window in one transfer.
+I2C_CHUNK_BYTES = 16
+
+# Rough bus cost, in bytes, of opening an address window (six commands) and
+# of each data transfer. show() uses them to merge dirty pages into windows
+# and to fall back to a full-frame write when that is cheaper.
+WINDOW_COST = const(18)
+TRANSFER_COST = const(2)
+
 
 class SSD1306:
     def __init__(self, width, height, external_vcc):
@@ -29,9 +56,16 @@ class SSD1306:
         self.external_vcc = external_vcc
         self.pages = self.height // 8
         self.buffer = bytearray(self.pages * self.width)
+        self._buffer_mv = memoryview(self.buffer)
+        # Dirty column range [x0, x1) per page; empty when x0 >= x1.
+        self._dirty_x0 = bytearray(self.pages)
+        self._dirty_x1 = bytearray(self.pages)
+        # Windows picked by show(): (page0, page1, col0, col1) per entry.
+        self._windows = bytearray(4 * self.pages)
         self.framebuf = framebuf.FrameBuffer(
             self.buffer, self.width, self.height, framebuf.MONO_VLSB
         )
+        self.invalidate()
         self.init_display()
 
     def init_display(self):
@@ -66,35 +100,154 @@ class SSD1306:
         self.fill(0)
         self.show()
 
+    # Drawing calls mark what they touch so show() can send only the
+    # changed page/column windows. Call invalidate() after writing to
+    # self.buffer directly.
+    def invalidate(self):
+        for p in range(self.pages):
+            self._dirty_x0[p] = 0
+            self._dirty_x1[p] = self.width
+
+    def _clear_dirty(self):
+        for p in range(self.pages):
+            self._dirty_x0[p] = self.width
+            self._dirty_x1[p] = 0
+
+    def _mark(self, x, y, w, h):
+        if x < 0:
+            w += x
+            x = 0
+        if y < 0:
+            h += y
+            y = 0
+        if x + w > self.width:
+            w = self.width - x
+        if y + h > self.height:
+            h = self.height - y
+        if w <= 0 or h <= 0:
+            return
+        x0 = self._dirty_x0
+        x1 = self._dirty_x1
+        xe = x + w
+        for p in range(y >> 3, ((y + h - 1) >> 3) + 1):
+            if x < x0[p]:
+                x0[p] = x
+            if xe > x1[p]:
+                x1[p] = xe
+
     def fill(self, color):
         self.framebuf.fill(color)
+        self.invalidate()
 
     def pixel(self, x, y, color):
         self.framebuf.pixel(x, y, color)
+        if 0 <= x < self.width and 0 <= y < self.height:
+            p = y >> 3
+            if x < self._dirty_x0[p]:
+                self._dirty_x0[p] = x
+            if x >= self._dirty_x1[p]:
+                self._dirty_x1[p] = x + 1
+
+    def fill_rect(self, x, y, w, h, color):
+        self.framebuf.fill_rect(x, y, w, h, color)
+        self._mark(x, y, w, h)
 
     def text(self, s, x, y, color=1):
         self.framebuf.text(s, x, y, color)
-
-    def show(self):
-        x0 = 0
-        x1 = self.width - 1
-        if self.width == 64:
-            x0 += 32
-            x1 += 32
+        self._mark(x, y, 8 * len(s), 8)
+
+    def blit(self, fbuf, x, y):
+        self.framebuf.blit(fbuf, x, y)
+        self.invalidate()
+
+    def _plan_windows(self):
+        # Greedily merges each dirty page into the window above it when one
+        # taller window costs less than opening a new one. Returns the
+        # window count and the estimated bus cost.
+        x0 = self._dirty_x0
+        x1 = self._dirty_x1
+        win = self._windows
+        n = 0
+        cost = 0
+        for p in range(self.pages):
+            c0 = x0[p]
+            c1 = x1[p]
+            if c0 >= c1:
+                continue
+            alone = WINDOW_COST + TRANSFER_COST + c1 - c0
+            if n:
+                i = 4 * (n - 1)
+                if win[i + 1] == p - 1:
+                    m0 = min(c0, win[i + 2])
+                    m1 = max(c1, win[i + 3])
+                    rows = p - win[i] + 1
+                    before = WINDOW_COST + (rows - 1) * (
+                        TRANSFER_COST + win[i + 3] - win[i + 2]
+                    )
+                    merged = WINDOW_COST + rows * (TRANSFER_COST + m1 - m0)
+                    if merged <= before + alone:
+                        win[i + 1] = p
+                        win[i + 2] = m0
+                        win[i + 3] = m1
+                        cost += merged - before
+                        continue
+            i = 4 * n
+            win[i] = p
+            win[i + 1] = p
+            win[i + 2] = c0
+            win[i + 3] = c1
+            n += 1
+            cost += alone
+        return n, cost
+
+    def _send_window(self, p0, p1, c0, c1):
+        offset = 32 if self.width == 64 else 0
         self.write_cmd(SET_COL_ADDR)
-        self.write_cmd(x0)
-        self.write_cmd(x1)
+        self.write_cmd(c0 + offset)
+        self.write_cmd(c1 - 1 + offset)
         self.write_cmd(SET_PAGE_ADDR)
-        self.write_cmd(0)
-        self.write_cmd(self.pages - 1)
-        self.write_data(self.buffer)
+        self.write_cmd(p0)
+        self.write_cmd(p1)
+
+    def show(self):
+        n, cost = self._plan_windows()
+        if not n:
+            return
+        if cost >= WINDOW_COST + TRANSFER_COST + len(self.buffer):
+            self._send_window(0, self.pages - 1, 0, self.width)
+            self.write_data(self.buffer)
+        else:
+            win = self._windows
+            mv = self._buffer_mv
+            width = self.width
+            for i in range(0, 4 * n, 4):
+                p0 = win[i]
+                p1 = win[i + 1]
+                c0 = win[i + 2]
+                c1 = win[i + 3]
+                self._send_window(p0, p1, c0, c1)
+                if c0 == 0 and c1 == width:
+                    self.write_data(mv[p0 * width : (p1 + 1) * width])
+                    continue
+                # The controller wraps to the next page at c1, so each page
+                # slice follows the previous one.
+                for p in range(p0, p1 + 1):
+                    row = p * width
+                    self.write_data(mv[row + c0 : row + c1])
+        self._clear_dirty()
 
 
 class SSD1306_I2C(SSD1306):
-    def __init__(self, width, height, i2c, addr=0x3C, external_vcc=False):
+    def __init__(
+        self, width, height, i2c, addr=0x3C, external_vcc=False, chunk=I2C_CHUNK_BYTES
+    ):
         self.i2c = i2c
         self.addr = addr
+        self.chunk = chunk
         self.temp = bytearray(2)
+        # The data control byte is shared by every chunk; writevto sends it
+        # and a memoryview slice of the frame without copying either.
+        self.write_list = [b"\x40", None]
         super().__init__(width, height, external_vcc)
 
     def write_cmd(self, cmd):
@@ -104,9 +257,25 @@ class SSD1306_I2C(SSD1306):
 
     def write_data(self, buf):
         # Chunk writes to reduce bus timeout risk on some boards/firmwares.
-        step = 16
-        for i in range(0, len(buf), step):
-            self.i2c.writeto(self.addr, b"\x40" + buf[i : i + step])
+        # Returns the number of bytes the display acknowledged.
+        mv = memoryview(buf)
+        n = len(mv)
+        step = self.chunk if self.chunk > 0 else n
+        write_list = self.write_list
+        acks = 0
+        for i in range(0, n, step):
+            write_list[1] = mv[i : i + step]
+            acks += self.i2c.writevto(self.addr, write_list)
+        write_list[1] = None
+        return acks
+
+    def verify_frame(self):
+        # Writes the whole frame and checks that every byte, control bytes
+        # included, was acknowledged.
+        n = len(self.buffer)
+        step = self.chunk if self.chunk > 0 else n
+        self._send_window(0, self.pages - 1, 0, self.width)
+        return self.write_data(self.buffer) == n + (n + step - 1) // step
 
 
 I2C_CANDIDATES = [
@@ -121,6 +290,11 @@ I2C_CANDIDATES = [
 OLED_WIDTH = 128
 OLED_HEIGHT = 32
 
+# Bus clocks tried at startup, fastest first. The SSD1306 is rated for
+# 400 kHz Fast-mode, and the probe only sees ACKs (pixels cannot be read
+# back), so nothing beyond the rated clock is tried.
+I2C_SPEEDS = (400_000, 100_000)
+
 E1_CLK_PIN = 2
 E1_DT_PIN = 3
 E1_SW_PIN = 4
@@ -140,6 +314,24 @@ def try_init_display(bus, addr):
     return disp
 
 
+def negotiate_bus_speed(display, i2c_id, scl_pin, sda_pin):
+    # Keeps the fastest clock at which verify_frame() gets a full test
+    # frame acknowledged. An ACK only shows the bytes arrived, not that
+    # they were latched intact, which is why I2C_SPEEDS stops at 400 kHz.
+    for freq in I2C_SPEEDS:
+        try:
+            bus = I2C(i2c_id, scl=Pin(scl_pin), sda=Pin(sda_pin), freq=freq)
+            if display.addr not in bus.scan():
+                continue
+            display.i2c = bus
+            if display.verify_frame():
+                return freq
+        except OSError:
+            pass
+    display.i2c = I2C(i2c_id, scl=Pin(scl_pin), sda=Pin(sda_pin), freq=100000)
+    return 100000
+
+
 def find_working_display():
     errors = []
     for i2c_id, scl_pin, sda_pin in I2C_CANDIDATES:
@@ -165,7 +357,8 @@ def find_working_display():
         for addr in preferred:
             try:
                 display = try_init_display(bus, addr)
-                return display, i2c_id, scl_pin, sda_pin, addrs, addr
+                freq = negotiate_bus_speed(display, i2c_id, scl_pin, sda_pin)
+                return display, i2c_id, scl_pin, sda_pin, addrs, addr, freq
             except OSError as e:
                 errors.append(
                     "bus {} GP{}/GP{} addr {} write: {}".format(
@@ -195,6 +388,30 @@ def draw_brush(px, py):
         display.pixel(px, py, 0)
 
 
+def draw_brush_run(x0, y0, x1, y1):
+    # A straight run of brush stamps is one filled 3-pixel-wide band; only
+    # the final stamp keeps its black center.
+    display.fill_rect(
+        min(x0, x1) - 1, min(y0, y1) - 1, abs(x1 - x0) + 3, abs(y1 - y0) + 3, 1
+    )
+    display.pixel(x1, y1, 0)
+
+
+def cover_brush(px, py):
+    # Counts one brush stamp in the coverage grid (drawing is separate).
+    for yy in range(max(py - 1, 0), min(py + 2, DRAW_H)):
+        for xx in range(max(px - 1, 0), min(px + 2, DRAW_W)):
+            coverage.add(xx, yy)
+
+
+def uncover_brush(px, py):
+    # Removes one brush stamp and erases the pixels nothing else covers.
+    for yy in range(max(py - 1, 0), min(py + 2, DRAW_H)):
+        for xx in range(max(px - 1, 0), min(px + 2, DRAW_W)):
+            if coverage.remove(xx, yy):
+                display.pixel(xx, yy, 0)
+
+
 def draw_startup_test():
     display.fill(1)
     display.show()
@@ -220,35 +437,80 @@ def draw_startup_test():
     utime.sleep_ms(400)
 
 
-display, i2c_id, scl_pin, sda_pin, addrs, addr = find_working_display()
+display, i2c_id, scl_pin, sda_pin, addrs, addr, i2c_freq = find_working_display()
 DRAW_W = OLED_WIDTH
 DRAW_H = OLED_HEIGHT
 
+# Count the display's I2C traffic (see bus_trace.py); print it from the
+# REPL with bus_trace.report().
+BUS_TRACE = False
+if BUS_TRACE:
+    import bus_trace
+
+    bus_trace.attach(display, "SSD1306_I2C", ("write_cmd", "write_data", "show"))
+
 draw_startup_test()
 display.fill(0)
 
-e1_clk = Pin(E1_CLK_PIN, Pin.IN, Pin.PULL_UP)
-e1_dt = Pin(E1_DT_PIN, Pin.IN, Pin.PULL_UP)
-e1_sw = Pin(E1_SW_PIN, Pin.IN, Pin.PULL_UP)
-
-e2_clk = Pin(E2_CLK_PIN, Pin.IN, Pin.PULL_UP)
-e2_dt = Pin(E2_DT_PIN, Pin.IN, Pin.PULL_UP)
-e2_sw = Pin(E2_SW_PIN, Pin.IN, Pin.PULL_UP)
+# Knob steps and button edges arrive from IRQs through an event ring
+# (see input_events.py); rotation itself is decoded by PIO state machines.
+ENC1 = 0
+ENC2 = 1
+events = EventRing(64)
+knob1 = attach_knob(events, ENC1, 4, E1_CLK_PIN, E1_DT_PIN)
+knob2 = attach_knob(events, ENC2, 5, E2_CLK_PIN, E2_DT_PIN)
+button1 = attach_button(events, ENC1, E1_SW_PIN)
+button2 = attach_button(events, ENC2, E2_SW_PIN)
+
+# Drawing marks the frame dirty; the scheduler paces the I2C transfers.
+FRAME_INTERVAL_MS = 40
+INPUT_IDLE_MS = 10
+render = RenderScheduler(display.show, FRAME_INTERVAL_MS, INPUT_IDLE_MS)
 
 x = DRAW_W // 2
 y = DRAW_H // 2
 draw_brush(x, y)
-display.show()
-
-points = [(x, y, 0)]
-redo_stack = []
+render.flush()
+
+# Undo journal size; older points are folded into the coverage grid.
+HISTORY_BUDGET_BYTES = 32 * 1024
+
+# Drawing saved on flash; see journal.py.
+JOURNAL_PATH = "sketch.jnl"
+
+# Holding both buttons for SAVE_HOLD_MS saves the drawing and opens the
+# gallery; the knobs scroll it and a button press goes back to drawing.
+GALLERY_PATH = "gallery_oled.idx"
+SAVE_HOLD_MS = 1000
+GALLERY_CELL_W = 64
+GALLERY_CELL_H = 16
+
+points = History(HISTORY_BUDGET_BYTES)
+points.append(x, y, 0)
+coverage = CoverageGrid(DRAW_W, DRAW_H)
+cover_brush(x, y)
+journal = Journal(JOURNAL_PATH, coverage, points)
+gallery = Gallery(
+    GALLERY_PATH,
+    GALLERY_CELL_W - 8,
+    GALLERY_CELL_H - 2,
+    framebuf.MONO_VLSB,
+)
+view = GalleryView(
+    gallery,
+    display,
+    DRAW_W // GALLERY_CELL_W,
+    DRAW_H // GALLERY_CELL_H,
+    GALLERY_CELL_W,
+    GALLERY_CELL_H,
+    1,
+    0,
+)
 
 draw_time_ms = 0
 last_move_real_ms = None
 MAX_MOVE_GAP_MS = 150
 
-last_clk1 = e1_clk.value()
-last_clk2 = e2_clk.value()
 pending_dx = 0
 pending_dy = 0
 pending_undo = False
@@ -261,6 +523,14 @@ undo_hold_active = False
 redo_hold_active = False
 next_undo_repeat_ms = 0
 next_redo_repeat_ms = 0
+btn1_down = False
+btn2_down = False
+both_down_ms = 0
+browsing = False
+pending_close = False
+pending_browse = 0
+pending_revert = False
+chord_base = 0
 
 
 def clamp(value, low, high):
@@ -277,15 +547,23 @@ def queue_move(dx, dy):
     pending_dy += dy
 
 
+def paint_span(sx, sy, n):
+    display.fill_rect(sx, sy, n, 1, 1)
+
+
 def rebuild_canvas_from_points():
+    # Full redraw from the coverage grid, which holds the live history as
+    # well as points already evicted from the journal. Covered pixels come
+    # back as horizontal runs, one fill_rect each.
     display.fill(0)
-    for px, py, _ in points:
-        draw_brush(px, py)
-    display.show()
+    coverage.spans(paint_span)
+    display.pixel(x, y, 0)
+    render.mark()
 
 
-def step_cursor(dx, dy):
-    global x, y, redo_stack, draw_time_ms, last_move_real_ms
+def step_cursor(dx, dy, n=1):
+    # Moves n unit steps along one axis and draws the run in one pass.
+    global x, y, draw_time_ms, last_move_real_ms
     now = utime.ticks_ms()
     if last_move_real_ms is not None:
         dt = utime.ticks_diff(now, last_move_real_ms)
@@ -294,86 +572,211 @@ def step_cursor(dx, dy):
         draw_time_ms += dt if dt < MAX_MOVE_GAP_MS else MAX_MOVE_GAP_MS
     last_move_real_ms = now
 
-    nx = clamp(x + dx, 0, DRAW_W - 1)
-    ny = clamp(y + dy, 0, DRAW_H - 1)
+    nx = clamp(x + dx * n, 0, DRAW_W - 1)
+    ny = clamp(y + dy * n, 0, DRAW_H - 1)
     if nx != x or ny != y:
-        x = nx
-        y = ny
-        draw_brush(x, y)
-        display.show()
-        points.append((x, y, draw_time_ms))
-        redo_stack = []
+        draw_brush_run(x + dx, y + dy, nx, ny)
+        render.mark()
+        while x != nx or y != ny:
+            x += dx
+            y += dy
+            points.append(x, y, draw_time_ms)
+            cover_brush(x, y)
+            journal.point(x, y, draw_time_ms)
 
 
 def undo_last_two_seconds():
-    global x, y, points
-    if len(points) <= 1:
-        return
+    if undo_to(len(points) - 1):
+        journal.truncate(len(points))
 
-    removed = points.pop()
-    redo_stack.append([removed])
+
+def redo_last_undo():
+    if redo_to(len(points) + 1):
+        journal.restore(len(points))
+
+
+def undo_to(cut):
+    # Cuts the history back to cut points; returns False if nothing changed.
+    global x, y
+    if cut <= points.base:
+        cut = points.base + 1
+    end = len(points)
+    if cut >= end:
+        return False
+
+    rx, ry, _ = points[-1]
+    for px, py, _ in points.iter(cut, end):
+        uncover_brush(px, py)
+    points.truncate(cut)
+    # The old cursor center was drawn black; restore it if still covered.
+    display.pixel(rx, ry, 1 if coverage.covered(rx, ry) else 0)
     x, y, _ = points[-1]
-    rebuild_canvas_from_points()
+    display.pixel(x, y, 0)
+    render.mark()
+    return True
 
 
-def redo_last_undo():
-    global x, y, points
-    if not redo_stack:
-        return
+def redo_to(end):
+    global x, y
+    start = len(points)
+    if end > points.redo_end:
+        end = points.redo_end
+    if start >= end:
+        return False
 
-    restored = redo_stack.pop()
-    points.extend(restored)
+    for px, py, _ in points.iter(start, end):
+        cover_brush(px, py)
+        draw_brush(px, py)
+    points.restore(end)
     x, y, _ = points[-1]
+    render.mark()
+    return True
+
+
+def restore_checkpoint(px, py):
+    # The journal has loaded the saved picture into the coverage grid; the
+    # history restarts from its cursor.
+    global x, y
+    x = px
+    y = py
+    points.clear()
+    points.append(x, y, 0)
+
+
+def restore_point(px, py, t):
+    global x, y, draw_time_ms
+    x = px
+    y = py
+    draw_time_ms = t
+    points.append(x, y, t)
+    cover_brush(x, y)
+
+
+def revert_to(n):
+    # Puts the history back to n points.
+    if n < len(points):
+        if undo_to(n):
+            journal.truncate(len(points))
+    elif redo_to(n):
+        journal.restore(len(points))
+
+
+def save_and_browse():
+    global browsing
+    gallery.save(coverage, len(points), draw_time_ms)
+    browsing = True
+    view.open()
+    render.mark()
+
+
+def close_gallery():
+    global browsing
+    browsing = False
     rebuild_canvas_from_points()
 
 
+# Bring back the drawing saved before power-off, then start a fresh
+# journal from it.
+if journal.recover(restore_checkpoint, restore_point, undo_to, redo_to):
+    rebuild_canvas_from_points()
+journal.start(x, y, len(points))
+
+
 print("Mini OLED drawing screen ready")
 print("I2C bus:", i2c_id, "SCL=GP" + str(scl_pin), "SDA=GP" + str(sda_pin))
 print("I2C addresses found:", addrs)
 print("Using OLED address:", hex(addr))
+print("I2C clock:", i2c_freq, "Hz")
+
+# Pass and phase times, lost knob edges and dropped events, printed every
+# LOOP_REPORT_MS (0: never); see loop_profile.py.
+LOOP_REPORT_MS = 0
+profile = LoopProfiler((knob1, knob2), events, LOOP_REPORT_MS)
 
 while True:
-    current_clk1 = e1_clk.value()
-    if last_clk1 == 1 and current_clk1 == 0:
-        if e1_dt.value() == 1:
-            queue_move(0, 1)
+    profile.begin()
+    # Drain everything queued since the last pass as one batch.
+    queued = len(events)
+    if queued:
+        render.touch()
+    for _ in range(queued):
+        code = events.pop()
+        enc = event_source(code)
+        kind = event_kind(code)
+        if kind == PRESS:
+            t = events.time
+            chord = btn2_down if enc == ENC1 else btn1_down
+            if enc == ENC1:
+                btn1_down = True
+            else:
+                btn2_down = True
+            if browsing:
+                pending_close = True
+            elif chord:
+                # Second button of the save chord: stop the hold repeat and
+                # take back whatever the first button undid or redid.
+                both_down_ms = t
+                pending_undo = False
+                pending_redo = False
+                undo_hold_active = False
+                redo_hold_active = False
+                pending_revert = True
+            elif enc == ENC1:
+                chord_base = len(points)
+                pending_undo = True
+                undo_hold_active = True
+                next_undo_repeat_ms = utime.ticks_add(t, UNDO_HOLD_DELAY_MS)
+            else:
+                chord_base = len(points)
+                pending_redo = True
+                redo_hold_active = True
+                next_redo_repeat_ms = utime.ticks_add(t, REDO_HOLD_DELAY_MS)
+        elif kind == RELEASE:
+            if enc == ENC1:
+                btn1_down = False
+                undo_hold_active = False
+            else:
+                btn2_down = False
+                redo_hold_active = False
         else:
-            queue_move(0, -1)
-    last_clk1 = current_clk1
+            step = 1 if kind == STEP_UP else -1
+            if browsing:
+                pending_browse += step * view.cols if enc == ENC1 else step
+            elif enc == ENC1:
+                queue_move(0, step)
+            else:
+                queue_move(step, 0)
 
-    current_clk2 = e2_clk.value()
-    if last_clk2 == 1 and current_clk2 == 0:
-        if e2_dt.value() == 1:
-            queue_move(1, 0)
-        else:
-            queue_move(-1, 0)
-    last_clk2 = current_clk2
+    profile.mark(PH_INPUT)
 
     now = utime.ticks_ms()
-
-    current_sw1 = e1_sw.value()
-    if current_sw1 == 0:
-        if not undo_hold_active:
-            pending_undo = True
-            undo_hold_active = True
-            next_undo_repeat_ms = utime.ticks_add(now, UNDO_HOLD_DELAY_MS)
-        elif utime.ticks_diff(now, next_undo_repeat_ms) >= 0:
-            pending_undo = True
-            next_undo_repeat_ms = utime.ticks_add(now, HOLD_REPEAT_MS)
-    else:
-        undo_hold_active = False
-
-    current_sw2 = e2_sw.value()
-    if current_sw2 == 0:
-        if not redo_hold_active:
-            pending_redo = True
-            redo_hold_active = True
-            next_redo_repeat_ms = utime.ticks_add(now, REDO_HOLD_DELAY_MS)
-        elif utime.ticks_diff(now, next_redo_repeat_ms) >= 0:
-            pending_redo = True
-            next_redo_repeat_ms = utime.ticks_add(now, HOLD_REPEAT_MS)
-    else:
-        redo_hold_active = False
+    if undo_hold_active and utime.ticks_diff(now, next_undo_repeat_ms) >= 0:
+        pending_undo = True
+        next_undo_repeat_ms = utime.ticks_add(now, HOLD_REPEAT_MS)
+    if redo_hold_active and utime.ticks_diff(now, next_redo_repeat_ms) >= 0:
+        pending_redo = True
+        next_redo_repeat_ms = utime.ticks_add(now, HOLD_REPEAT_MS)
+
+    if pending_close:
+        pending_close = False
+        close_gallery()
+
+    if pending_browse:
+        view.move(pending_browse)
+        pending_browse = 0
+        render.mark()
+
+    if pending_revert:
+        pending_revert = False
+        revert_to(chord_base)
+
+    if (
+        btn1_down
+        and btn2_down
+        and not browsing
+        and utime.ticks_diff(now, both_down_ms) >= SAVE_HOLD_MS
+    ):
+        save_and_browse()
 
     if pending_undo:
         pending_undo = False
@@ -383,27 +786,29 @@ while True:
         pending_redo = False
         redo_last_undo()
 
+    profile.mark(PH_UNDO)
+
     moved = False
-    while pending_dx != 0:
+    if pending_dx != 0 or pending_dy != 0:
         moved = True
-        if pending_dx > 0:
-            pending_dx -= 1
-            step_cursor(1, 0)
-        else:
-            pending_dx += 1
-            step_cursor(-1, 0)
+        move_dx = pending_dx
+        move_dy = pending_dy
+        pending_dx = 0
+        pending_dy = 0
+        for sx, sy, n in line_runs(move_dx, move_dy):
+            step_cursor(sx, sy, n)
 
-    while pending_dy != 0:
-        moved = True
-        if pending_dy > 0:
-            pending_dy -= 1
-            step_cursor(0, 1)
-        else:
-            pending_dy += 1
-            step_cursor(0, -1)
+    profile.mark(PH_MOVE)
+
+    render.poll()
+    profile.mark(PH_DRAW)
 
+    if journal.checkpoint_due:
+        journal.checkpoint(x, y, len(points))
+    journal.service(not queued and not moved)
     if not moved:
         utime.sleep_ms(1)
+    profile.mark(PH_SLEEP)
 
 
 
@@ -0,0 +1,50 @@
+# Turns a queued (dx, dy) knob delta into unit-step runs along a straight line
+
+
+def line_runs(dx, dy):
+    # Yields (sx, sy, n): n unit steps along one axis. Steps interleave the
+    # two axes Bresenham-style so the path stays 4-connected and close to the
+    # line from (0, 0) to (dx, dy) instead of an L shape.
+    sx = 1 if dx > 0 else -1
+    sy = 1 if dy > 0 else -1
+    ax = dx * sx
+    ay = dy * sy
+    if ax == 0 and ay == 0:
+        return
+
+    # err is the signed cross product x * ay - y * ax of the current point;
+    # each step picks the axis that keeps it closest to zero.
+    err = 0
+    ix = 0
+    iy = 0
+    run_x = True
+    run = 0
+    while ix < ax or iy < ay:
+        if iy >= ay:
+            step_x = True
+        elif ix >= ax:
+            step_x = False
+        else:
+            ex = err + ay
+            ey = err - ax
+            step_x = (ex if ex >= 0 else -ex) <= (ey if ey >= 0 else -ey)
+
+        if run and step_x != run_x:
+            if run_x:
+                yield sx, 0, run
+            else:
+                yield 0, sy, run
+            run = 0
+        run_x = step_x
+        run += 1
+        if step_x:
+            ix += 1
+            err += ay
+        else:
+            iy += 1
+            err -= ax
+
+    if run_x:
+        yield sx, 0, run
+    else:
+        yield 0, sy, run
@@ -0,0 +1,45 @@
+# Frame pacing for displays whose show() is a slow full-frame transfer
+import utime
+
+
+class RenderScheduler:
+    # Drawing code calls mark() instead of show(). poll() flushes a dirty
+    # frame at most once per frame_ms while input keeps arriving, and as
+    # soon as input has been quiet for idle_ms, so a burst of steps shares
+    # one bus transfer and a frame is never older than frame_ms.
+    def __init__(self, show, frame_ms=40, idle_ms=10):
+        self._show = show
+        self.frame_ms = frame_ms
+        self.idle_ms = idle_ms
+        now = utime.ticks_ms()
+        self._last_flush_ms = now
+        self._last_input_ms = now
+        self.dirty = False
+        self.frames = 0
+
+    def mark(self):
+        self.dirty = True
+
+    def touch(self, now=None):
+        # Records input activity, which holds the flush back until idle.
+        self._last_input_ms = utime.ticks_ms() if now is None else now
+
+    def poll(self, now=None):
+        if not self.dirty:
+            return False
+        if now is None:
+            now = utime.ticks_ms()
+        if (
+            utime.ticks_diff(now, self._last_flush_ms) < self.frame_ms
+            and utime.ticks_diff(now, self._last_input_ms) < self.idle_ms
+        ):
+            return False
+        self.flush()
+        return True
+
+    def flush(self):
+        self._show()
+        self.dirty = False
+        self.frames += 1
+        # Time the frame from the end of the transfer, not its start.
+        self._last_flush_ms = utime.ticks_ms()
@@ -0,0 +1,18 @@
+# Host-side simulation of the sketches' board
+#
+# Stand-ins for machine, utime, framebuf and micropython run on a virtual
+# clock, and display models decode the SPI/I2C traffic into pixel state,
+# so any sketch here runs under CPython faster than real time and the same
+# way every time:
+#
+#   from sim import Simulator, boards
+#
+#   sim = Simulator()
+#   board = boards.tft(sim)
+#   board.e2.turn(20, at_ms=1500)
+#   sim.run("main.py", stop_ms=3000)
+#   print("\n".join(board.display.ascii()))
+#
+# or from the shell: python -m sim main.py --turn e2:20@1500
+from sim.clock import Clock, SimStop
+from sim.runner import Simulator, forget_modules
@@ -0,0 +1,81 @@
+# Command line: run a sketch on the simulated board and show the result
+#
+#   python -m sim main.py --ms 4000 --turn e2:40@1500 --turn e1:-10
+#   python -m sim pocket_sketch_lcd1602_i2c.py --press sw1@3000
+#
+# --turn KNOB:DETENTS[@MS] turns encoder e1 or e2; --press BUTTON[@MS]
+# presses sw1 (undo) or sw2 (redo). Without @MS a gesture follows the
+# previous one on the same input. The sketch runs in a scratch directory,
+# so journal and gallery files from earlier runs cannot change the result.
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+from sim import boards
+from sim.runner import Simulator
+
+
+def _gesture(spec):
+    name, _, at = spec.partition("@")
+    return name, float(at) if at else None
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(
+        prog="python -m sim", description="Run a sketch on the simulated board."
+    )
+    p.add_argument("sketch", help="sketch to run, e.g. main.py")
+    p.add_argument("--board", choices=sorted(boards.BOARDS), help="wiring to use")
+    p.add_argument("--ms", type=float, default=3000, help="virtual run time")
+    p.add_argument("--turn", action="append", default=[], metavar="KNOB:N[@MS]")
+    p.add_argument("--press", action="append", default=[], metavar="BUTTON[@MS]")
+    p.add_argument("--period", type=float, default=4, help="ms per detent")
+    p.add_argument("--workdir", help="directory to run in (default: a scratch one)")
+    p.add_argument("--step", type=int, default=4, help="TFT pixels per character")
+    p.add_argument("--quiet", action="store_true", help="no display dump")
+    args = p.parse_args(argv)
+
+    board_name = args.board or boards.SKETCHES.get(os.path.basename(args.sketch))
+    if board_name is None:
+        p.error("no known wiring for %s; pass --board" % args.sketch)
+    sim = Simulator()
+    board = boards.BOARDS[board_name](sim)
+    for spec in args.turn:
+        knob, at = _gesture(spec)
+        name, _, n = knob.partition(":")
+        if name not in ("e1", "e2") or not n:
+            p.error("bad --turn %r" % spec)
+        getattr(board, name).turn(int(n), at_ms=at, period_ms=args.period)
+    for spec in args.press:
+        name, at = _gesture(spec)
+        if name not in ("sw1", "sw2"):
+            p.error("bad --press %r" % spec)
+        getattr(board, name).press(at_ms=at)
+
+    sketch = os.path.abspath(args.sketch)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="sim-")
+    try:
+        sim.run(sketch, stop_ms=args.ms, cwd=workdir)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    d = board.display
+    print(
+        "%.0f ms simulated in %.2f s (%.1fx real time)"
+        % (sim.clock.now_ns / 1e6, sim.host_s, sim.speedup())
+    )
+    print("%s: %d bytes in %d transfers" % (type(d).__name__, d.bytes, d.transfers))
+    if not args.quiet:
+        if board_name == "tft":
+            lines = d.ascii(args.step)
+        else:
+            lines = d.ascii()
+        print("\n".join(lines))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
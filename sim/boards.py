@@ -0,0 +1,46 @@
+# Wiring of the three sketches, as in their diagram.json setups
+#
+# Each function attaches the display and both knobs to a Simulator and
+# returns a Board naming them after the sketch's pin constants: e1 and e2
+# are encoders 1 and 2 (which axis each drives is up to the sketch), sw1
+# and sw2 their push buttons (undo and redo).
+from sim.devices import LCD1602Backpack, MipiPanel, SSD1306Panel
+
+
+class Board:
+    def __init__(self, sim, display, e1_pins, e2_pins):
+        self.sim = sim
+        self.display = display
+        self.e1 = sim.encoder(e1_pins[0], e1_pins[1])
+        self.e2 = sim.encoder(e2_pins[0], e2_pins[1])
+        self.sw1 = sim.button(e1_pins[2])
+        self.sw2 = sim.button(e2_pins[2])
+
+
+def tft(sim):
+    # main.py: ILI9341 on SPI0 with CS on GP17 and D/C on GP20.
+    panel = sim.attach_spi(MipiPanel(240, 320, dc=20, cs=17), bus=0)
+    return Board(sim, panel, (2, 3, 4), (5, 6, 7))
+
+
+def oled(sim):
+    # pocket_sketch_oled_i2c.py: 128x32 SSD1306 at 0x3C. The sketch probes
+    # several buses, so the panel answers on all of them.
+    panel = sim.attach_i2c(SSD1306Panel(128, 32), 0x3C)
+    return Board(sim, panel, (2, 3, 4), (12, 13, 14))
+
+
+def lcd(sim):
+    # pocket_sketch_lcd1602_i2c.py: 16x2 LCD on a PCF8574 backpack at 0x27.
+    panel = sim.attach_i2c(LCD1602Backpack(16, 2), 0x27)
+    return Board(sim, panel, (2, 3, 4), (12, 13, 14))
+
+
+BOARDS = {"tft": tft, "oled": oled, "lcd": lcd}
+
+# Board for each sketch file in the repository.
+SKETCHES = {
+    "main.py": "tft",
+    "pocket_sketch_oled_i2c.py": "oled",
+    "pocket_sketch_lcd1602_i2c.py": "lcd",
+}
@@ -0,0 +1,101 @@
+# Virtual time for the simulator
+#
+# Time only moves when the sketch sleeps or a bus transfer takes time, so
+# a run is exactly repeatable and as fast as the host allows. Scripted
+# input (knob edges, button presses) is a queue of events due at given
+# times; advancing the clock fires every event it passes, in time order,
+# and then runs any IRQ handlers those events raised.
+import heapq
+
+
+class SimStop(BaseException):
+    # Raised out of the sketch when the clock reaches its stop time. Not an
+    # Exception, so a sketch's own error handling cannot swallow it.
+    pass
+
+
+class Clock:
+    def __init__(self):
+        self.now_ns = 0
+        self.stop_ns = None
+        self._events = []
+        self._seq = 0
+        self._irqs = []
+        self._in_irq = False
+
+    @property
+    def now_us(self):
+        return self.now_ns // 1000
+
+    @property
+    def now_ms(self):
+        return self.now_ns // 1_000_000
+
+    def stop_at(self, ms):
+        # Ends the run with SimStop once virtual time reaches ms; None runs
+        # for ever.
+        self.stop_ns = None if ms is None else int(ms * 1_000_000)
+
+    def at_ns(self, t_ns, fn, *args):
+        # Calls fn(*args) when the clock reaches t_ns. Events due at the
+        # same time fire in the order they were scheduled.
+        if t_ns < self.now_ns:
+            t_ns = self.now_ns
+        heapq.heappush(self._events, (t_ns, self._seq, fn, args))
+        self._seq += 1
+
+    def at(self, ms, fn, *args):
+        self.at_ns(int(ms * 1_000_000), fn, *args)
+
+    def pending(self):
+        # Number of scripted events still to fire.
+        return len(self._events)
+
+    def next_event_ns(self):
+        return self._events[0][0] if self._events else None
+
+    def raise_irq(self, fn, arg):
+        # Queues an IRQ handler; it runs before the clock moves on.
+        self._irqs.append((fn, arg))
+
+    def run_irqs(self):
+        # Handlers never preempt each other, like MicroPython's scheduled
+        # (soft) IRQs.
+        if self._in_irq:
+            return
+        self._in_irq = True
+        try:
+            irqs = self._irqs
+            while irqs:
+                fn, arg = irqs.pop(0)
+                fn(arg)
+        finally:
+            self._in_irq = False
+
+    def advance_ns(self, ns):
+        target = self.now_ns + max(0, int(ns))
+        stop = self.stop_ns
+        hit_stop = stop is not None and target >= stop
+        if hit_stop:
+            target = stop
+        events = self._events
+        while events and events[0][0] <= target:
+            t, _, fn, args = heapq.heappop(events)
+            if t > self.now_ns:
+                self.now_ns = t
+            fn(*args)
+            self.run_irqs()
+        self.now_ns = target
+        self.run_irqs()
+        if hit_stop:
+            raise SimStop()
+
+    def advance_us(self, us):
+        self.advance_ns(us * 1000)
+
+    def advance_ms(self, ms):
+        self.advance_ns(ms * 1_000_000)
+
+
+# The clock the stand-in modules read; Simulator swaps in a fresh one.
+current = Clock()
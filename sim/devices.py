@@ -0,0 +1,550 @@
+# Display models that decode bus traffic into pixel state
+#
+# Each model is attached to a simulated bus (machine.attach_spi() or
+# machine.attach_i2c()) and keeps what the real controller would hold in
+# its RAM, plus counters of the traffic it saw: bytes, transfers and the
+# panel pixels those transfers wrote. Frames are kept in the coordinates
+# the host addresses: orientation and mirroring registers are recorded but
+# not applied, so a model is sized as the sketch sees its panel.
+from sim import machine as _machine
+
+# HD44780 execution times at the nominal 270 kHz oscillator, in ns.
+HD44780_CLEAR_NS = 1_520_000
+HD44780_EXEC_NS = 37_000
+HD44780_DATA_NS = 41_000
+
+
+class MipiPanel:
+    # ILI9341 / ST7789 style SPI panel: CASET and RASET set the address
+    # window, RAMWR streams 16-bit pixels into it row by row. D/C low means
+    # command bytes, high means parameters or pixel data.
+    def __init__(self, width=240, height=320, dc=20, cs=17, name="ILI9341"):
+        self.width = width
+        self.height = height
+        self.dc = dc
+        self.cs = cs
+        self.name = name
+        self.ram = bytearray(width * height * 2)
+        self.bytes = 0
+        self.transfers = 0
+        self.commands = 0
+        self.pixels = 0
+        self.overflow = 0
+        self._reset()
+
+    def _reset(self):
+        self.madctl = 0
+        self.colmod = 0x66
+        self.sleeping = True
+        self.display_on = False
+        self.inverted = False
+        self._cmd = -1
+        self._params = bytearray()
+        self._win = (0, 0, self.width - 1, self.height - 1)
+        self._x = 0
+        self._y = 0
+        self._half = -1
+
+    def spi_write(self, data):
+        self.bytes += len(data)
+        self.transfers += 1
+        if _machine.level(self.dc):
+            if self._cmd == 0x2C or self._cmd == 0x3C:
+                self._pixels(data)
+            elif self._cmd >= 0:
+                self._params += data
+                self._apply()
+        else:
+            for c in bytes(data):
+                self._command(c)
+
+    def spi_read(self, n):
+        return bytes(n)
+
+    def _command(self, c):
+        self.commands += 1
+        self._cmd = c
+        self._params = bytearray()
+        if c == 0x01:
+            self._reset()
+        elif c == 0x10:
+            self.sleeping = True
+        elif c == 0x11:
+            self.sleeping = False
+        elif c == 0x20 or c == 0x21:
+            self.inverted = c == 0x21
+        elif c == 0x28 or c == 0x29:
+            self.display_on = c == 0x29
+        elif c == 0x2C:
+            self._x = self._win[0]
+            self._y = self._win[1]
+            self._half = -1
+
+    def _apply(self):
+        p = self._params
+        c = self._cmd
+        if (c == 0x2A or c == 0x2B) and len(p) >= 4:
+            a = (p[0] << 8) | p[1]
+            b = (p[2] << 8) | p[3]
+            x0, y0, x1, y1 = self._win
+            if c == 0x2A:
+                self._win = (a, y0, min(b, self.width - 1), y1)
+            else:
+                self._win = (x0, a, x1, min(b, self.height - 1))
+            self._cmd = -1
+        elif c == 0x36 and p:
+            self.madctl = p[0]
+            self._cmd = -1
+        elif c == 0x3A and p:
+            self.colmod = p[0]
+            self._cmd = -1
+
+    def _pixels(self, data):
+        x0, y0, x1, y1 = self._win
+        if x0 > x1 or y0 > y1:
+            self.overflow += len(data)
+            return
+        ram = self.ram
+        w = self.width
+        n = len(data)
+        i = 0
+        if self._half >= 0 and n:
+            data = bytes((self._half,)) + bytes(data)
+            n += 1
+            self._half = -1
+        while n - i >= 2:
+            run = min(x1 - self._x + 1, (n - i) >> 1)
+            at = (self._y * w + self._x) << 1
+            ram[at : at + 2 * run] = data[i : i + 2 * run]
+            i += 2 * run
+            self.pixels += run
+            self._x += run
+            if self._x > x1:
+                self._x = x0
+                self._y += 1
+                if self._y > y1:
+                    # Past the end of the window the counter starts over.
+                    self._y = y0
+        if i < n:
+            self._half = data[i]
+
+    def pixel(self, x, y):
+        # RGB565 value at (x, y) as sent (big-endian on the wire).
+        at = (y * self.width + x) << 1
+        return (self.ram[at] << 8) | self.ram[at + 1]
+
+    def ascii(self, step=4, paper=0):
+        # One character per step x step block: '#' when any pixel in it
+        # differs from paper.
+        lines = []
+        for by in range(0, self.height, step):
+            row = []
+            for bx in range(0, self.width, step):
+                lit = False
+                for y in range(by, min(by + step, self.height)):
+                    at = (y * self.width + bx) << 1
+                    end = (y * self.width + min(bx + step, self.width)) << 1
+                    for k in range(at, end, 2):
+                        if (self.ram[k] << 8) | self.ram[k + 1] != paper:
+                            lit = True
+                            break
+                    if lit:
+                        break
+                row.append("#" if lit else ".")
+            lines.append("".join(row))
+        return lines
+
+
+# Argument bytes taken by SSD1306 commands that have any.
+_SSD1306_ARGS = {
+    0x20: 1,
+    0x21: 2,
+    0x22: 2,
+    0x26: 6,
+    0x27: 6,
+    0x29: 5,
+    0x2A: 5,
+    0x81: 1,
+    0x8D: 1,
+    0xA3: 2,
+    0xA8: 1,
+    0xD3: 1,
+    0xD5: 1,
+    0xD9: 1,
+    0xDA: 1,
+    0xDB: 1,
+}
+
+
+class SSD1306Panel:
+    # SSD1306 controller with its 128 x 64 GDDRAM. Over I2C each transfer
+    # starts with control bytes (Co and D/C bits); over SPI the dc pin
+    # tells commands from data. Narrow panels show the middle columns.
+    def __init__(self, width=128, height=32, dc=None, cs=None, max_freq=1_000_000):
+        self.width = width
+        self.height = height
+        self.dc = dc
+        self.cs = cs
+        self.max_freq = max_freq
+        self.col_offset = (128 - width) // 2
+        self.gddram = bytearray(128 * 8)
+        self.bytes = 0
+        self.transfers = 0
+        self.commands = 0
+        self.data_bytes = 0
+        self.pixels = 0
+        self.display_on = False
+        self.inverted = False
+        self.contrast = 0x7F
+        self.mode = 2
+        self._cmd = bytearray()
+        self._c0 = 0
+        self._c1 = 127
+        self._p0 = 0
+        self._p1 = 7
+        self._col = 0
+        self._page = 0
+        self._page_col = 0
+
+    def i2c_write(self, data, t_ns, byte_ns):
+        self.bytes += len(data)
+        self.transfers += 1
+        data = bytes(data)
+        n = len(data)
+        i = 0
+        while i < n:
+            ctrl = data[i]
+            i += 1
+            if ctrl & 0x80:
+                # Co set: one byte, then another control byte.
+                if i < n:
+                    if ctrl & 0x40:
+                        self._data(data[i : i + 1])
+                    else:
+                        self._command(data[i])
+                    i += 1
+            else:
+                if ctrl & 0x40:
+                    self._data(data[i:])
+                else:
+                    for c in data[i:]:
+                        self._command(c)
+                break
+
+    def i2c_read(self, n, t_ns):
+        # Status byte: bit 6 set while the display is off.
+        return bytes((0 if self.display_on else 0x40,)) * n
+
+    def spi_write(self, data):
+        self.bytes += len(data)
+        self.transfers += 1
+        if _machine.level(self.dc):
+            self._data(bytes(data))
+        else:
+            for c in bytes(data):
+                self._command(c)
+
+    def _command(self, c):
+        cmd = self._cmd
+        if cmd:
+            cmd.append(c)
+            if len(cmd) <= _SSD1306_ARGS[cmd[0]]:
+                return
+            self._apply(cmd)
+            self._cmd = bytearray()
+            return
+        self.commands += 1
+        if c in _SSD1306_ARGS:
+            cmd.append(c)
+        elif c == 0xAE or c == 0xAF:
+            self.display_on = c == 0xAF
+        elif c == 0xA6 or c == 0xA7:
+            self.inverted = c == 0xA7
+        elif 0xB0 <= c <= 0xB7:
+            self._page = c & 7
+        elif c < 0x10:
+            self._page_col = (self._page_col & 0xF0) | c
+            self._col = self._page_col
+        elif c < 0x20:
+            self._page_col = (self._page_col & 0x0F) | ((c & 0x0F) << 4)
+            self._col = self._page_col
+
+    def _apply(self, cmd):
+        c = cmd[0]
+        if c == 0x20:
+            self.mode = cmd[1] & 3
+        elif c == 0x21:
+            self._c0 = cmd[1] & 0x7F
+            self._c1 = cmd[2] & 0x7F
+            self._col = self._c0
+        elif c == 0x22:
+            self._p0 = cmd[1] & 7
+            self._p1 = cmd[2] & 7
+            self._page = self._p0
+        elif c == 0x81:
+            self.contrast = cmd[1]
+
+    def _data(self, data):
+        self.data_bytes += len(data)
+        self.pixels += 8 * len(data)
+        ram = self.gddram
+        i = 0
+        n = len(data)
+        while i < n:
+            if self.mode == 0:
+                # Horizontal: a whole page slice at once.
+                run = min(self._c1 - self._col + 1, n - i)
+                if run <= 0:
+                    run = 1
+                at = self._page * 128 + self._col
+                ram[at : at + run] = data[i : i + run]
+                i += run
+                self._col += run
+                if self._col > self._c1:
+                    self._col = self._c0
+                    self._page += 1
+                    if self._page > self._p1:
+                        self._page = self._p0
+                continue
+            ram[self._page * 128 + (self._col & 0x7F)] = data[i]
+            i += 1
+            if self.mode == 1:
+                self._page += 1
+                if self._page > self._p1:
+                    self._page = self._p0
+                    self._col += 1
+                    if self._col > self._c1:
+                        self._col = self._c0
+            else:
+                self._col += 1
+                if self._col > 127:
+                    self._col = self._page_col
+
+    def pixel(self, x, y):
+        col = x + self.col_offset
+        return (self.gddram[(y >> 3) * 128 + col] >> (y & 7)) & 1
+
+    def frame(self):
+        # The visible area as a MONO_VLSB buffer, width x height.
+        out = bytearray()
+        for page in range((self.height + 7) // 8):
+            at = page * 128 + self.col_offset
+            out += self.gddram[at : at + self.width]
+        return out
+
+    def ascii(self, step=1):
+        lines = []
+        for y in range(0, self.height, step):
+            lines.append(
+                "".join(
+                    "#" if self.pixel(x, y) else "."
+                    for x in range(0, self.width, step)
+                )
+            )
+        return lines
+
+
+class LCD1602Backpack:
+    # HD44780 character LCD behind a PCF8574 I2C expander, wired as the
+    # common backpacks are: P0 RS, P1 RW, P2 E, P3 backlight, P4-P7 D4-D7.
+    # Instructions latch on the falling edge of E, each byte at the time it
+    # finishes on the bus, and keep the controller busy for its execution
+    # time. Writes that land while it is busy are applied anyway but
+    # counted in overruns, since a real LCD would drop or garble them.
+    # Reads with RW high return the busy flag and address counter (RS low)
+    # or display data (RS high) on D4-D7, high nibble first.
+    def __init__(self, cols=16, rows=2, max_freq=1_000_000):
+        self.cols = cols
+        self.rows = rows
+        self.max_freq = max_freq
+        self.ddram = bytearray(b" " * 0x80)
+        self.cgram = bytearray(64)
+        self.port = 0xFF
+        self.bytes = 0
+        self.transfers = 0
+        self.reads = 0
+        self.instructions = 0
+        self.data_writes = 0
+        self.pixels = 0
+        self.overruns = 0
+        self.busy_until_ns = 0
+        self.eight_bit = True
+        self.two_line = False
+        self.display_on = False
+        self.cursor_on = False
+        self.blink_on = False
+        self.increment = True
+        self.shift = 0
+        self._ac = 0
+        self._cg = False
+        self._high = -1
+        self._read_low = False
+
+    @property
+    def backlight(self):
+        return bool(self.port & 0x08)
+
+    def i2c_write(self, data, t_ns, byte_ns):
+        self.bytes += len(data)
+        self.transfers += 1
+        t = t_ns
+        for b in bytes(data):
+            t += byte_ns
+            old = self.port
+            self.port = b
+            if old & 0x04 and not b & 0x04:
+                if old & 0x02:
+                    self._end_read(old & 0x01)
+                else:
+                    self._nibble(old >> 4, old & 0x01, t)
+
+    def i2c_read(self, n, t_ns):
+        self.reads += 1
+        v = self.port
+        if v & 0x06 == 0x06:
+            # E high with RW high: the LCD drives D4-D7 and can only pull
+            # the expander's weak highs low.
+            v &= 0x0F | (self._read_nibble(v & 0x01, t_ns) << 4)
+        return bytes((v,)) * n
+
+    def _read_nibble(self, rs, t_ns):
+        if rs:
+            v = self.cgram[self._ac & 0x3F] if self._cg else self.ddram[self._ac]
+        else:
+            v = self._ac
+            if t_ns < self.busy_until_ns:
+                v |= 0x80
+        if self._read_low and not self.eight_bit:
+            return v & 0x0F
+        return v >> 4
+
+    def _end_read(self, rs):
+        if self.eight_bit or self._read_low:
+            self._read_low = False
+            if rs:
+                self._step_ac(1 if self.increment else -1)
+        else:
+            self._read_low = True
+
+    def _nibble(self, d, rs, t_ns):
+        if self.eight_bit:
+            self._execute(d << 4, rs, t_ns)
+            return
+        if self._high < 0:
+            self._high = d
+            return
+        v = (self._high << 4) | d
+        self._high = -1
+        self._execute(v, rs, t_ns)
+
+    def _step_ac(self, step):
+        if self._cg:
+            self._ac = (self._ac + step) & 0x3F
+            return
+        ac = self._ac + step
+        if self.two_line:
+            if ac == 0x28:
+                ac = 0x40
+            elif ac == 0x68:
+                ac = 0x00
+            elif ac == 0x3F:
+                ac = 0x27
+            elif ac < 0:
+                ac = 0x67
+        else:
+            ac %= 0x50
+        self._ac = ac
+
+    def _execute(self, v, rs, t_ns):
+        if t_ns < self.busy_until_ns:
+            self.overruns += 1
+        exec_ns = HD44780_EXEC_NS
+        if rs:
+            self.data_writes += 1
+            # A glyph row is 5 dots, a character cell 5 x 8.
+            if self._cg:
+                self.cgram[self._ac & 0x3F] = v
+                self.pixels += 5
+            elif self._ac < len(self.ddram):
+                self.ddram[self._ac] = v
+                self.pixels += 40
+            self._step_ac(1 if self.increment else -1)
+            exec_ns = HD44780_DATA_NS
+        else:
+            self.instructions += 1
+            if v & 0x80:
+                self._ac = v & 0x7F
+                self._cg = False
+            elif v & 0x40:
+                self._ac = v & 0x3F
+                self._cg = True
+            elif v & 0x20:
+                self.eight_bit = bool(v & 0x10)
+                self.two_line = bool(v & 0x08)
+                self._high = -1
+            elif v & 0x10:
+                step = 1 if v & 0x04 else -1
+                if v & 0x08:
+                    self.shift += step
+                else:
+                    self._step_ac(step)
+            elif v & 0x08:
+                self.display_on = bool(v & 0x04)
+                self.cursor_on = bool(v & 0x02)
+                self.blink_on = bool(v & 0x01)
+            elif v & 0x04:
+                self.increment = bool(v & 0x02)
+            elif v & 0x02:
+                self._ac = 0
+                self._cg = False
+                self.shift = 0
+                exec_ns = HD44780_CLEAR_NS
+            elif v & 0x01:
+                self.ddram[:] = b" " * len(self.ddram)
+                self._ac = 0
+                self._cg = False
+                self.shift = 0
+                self.increment = True
+                exec_ns = HD44780_CLEAR_NS
+        self.busy_until_ns = t_ns + exec_ns
+
+    def _row_base(self, row):
+        return (0x00, 0x40, 0x14, 0x54)[row]
+
+    def codes(self, row):
+        # Character codes visible on a row.
+        base = self._row_base(row)
+        return bytes(
+            self.ddram[base + (c + self.shift) % 40] for c in range(self.cols)
+        )
+
+    def text(self, row):
+        # A row as a string; custom characters (codes 0-15) show as '~'.
+        return "".join(
+            chr(c) if 0x20 <= c < 0x7F else "~" for c in self.codes(row)
+        )
+
+    def dot(self, x, y):
+        # Dot (x, y) of the 5x8-per-cell matrix for custom characters, 0
+        # for spaces and None for cells showing a ROM character.
+        code = self.codes(y >> 3)[x // 5]
+        if code < 16:
+            return (self.cgram[((code & 7) << 3) | (y & 7)] >> (4 - x % 5)) & 1
+        if code == 0x20:
+            return 0
+        return None
+
+    def ascii(self):
+        # Text rows, then the dot matrix with a gap between cells.
+        lines = [self.text(r) for r in range(self.rows)]
+        for y in range(self.rows * 8):
+            row = []
+            for x in range(self.cols * 5):
+                d = self.dot(x, y)
+                row.append("?" if d is None else "#" if d else ".")
+                if x % 5 == 4:
+                    row.append(" ")
+            lines.append("".join(row))
+            if y % 8 == 7:
+                lines.append("")
+        return lines
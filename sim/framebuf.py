@@ -0,0 +1,371 @@
+# Pure-Python stand-in for MicroPython's framebuf
+#
+# Pixel layouts, stride rounding and blit() palette/key rules follow the
+# C module, so a buffer drawn here can be sent to a simulated display (or
+# compared byte for byte) exactly like one drawn on the device. No font is
+# bundled: text() lays out 8x8 cells as the device does but marks each
+# non-space character with a solid 6x6 block.
+MONO_VLSB = 0
+MVLSB = MONO_VLSB
+RGB565 = 1
+GS4_HMSB = 2
+MONO_HLSB = 3
+MONO_HMSB = 4
+GS2_HMSB = 5
+GS8 = 6
+
+
+def _get_vlsb(fb, x, y):
+    return (fb._fb_buf[(y >> 3) * fb._fb_stride + x] >> (y & 7)) & 1
+
+
+def _set_vlsb(fb, x, y, c):
+    i = (y >> 3) * fb._fb_stride + x
+    m = 1 << (y & 7)
+    fb._fb_buf[i] = (fb._fb_buf[i] | m) if c & 1 else (fb._fb_buf[i] & ~m)
+
+
+def _get_hlsb(fb, x, y):
+    i = x + y * fb._fb_stride
+    return (fb._fb_buf[i >> 3] >> (7 - (i & 7))) & 1
+
+
+def _set_hlsb(fb, x, y, c):
+    i = x + y * fb._fb_stride
+    m = 0x80 >> (i & 7)
+    i >>= 3
+    fb._fb_buf[i] = (fb._fb_buf[i] | m) if c & 1 else (fb._fb_buf[i] & ~m)
+
+
+def _get_hmsb(fb, x, y):
+    i = x + y * fb._fb_stride
+    return (fb._fb_buf[i >> 3] >> (i & 7)) & 1
+
+
+def _set_hmsb(fb, x, y, c):
+    i = x + y * fb._fb_stride
+    m = 1 << (i & 7)
+    i >>= 3
+    fb._fb_buf[i] = (fb._fb_buf[i] | m) if c & 1 else (fb._fb_buf[i] & ~m)
+
+
+def _get_rgb565(fb, x, y):
+    i = (x + y * fb._fb_stride) << 1
+    return fb._fb_buf[i] | (fb._fb_buf[i + 1] << 8)
+
+
+def _set_rgb565(fb, x, y, c):
+    i = (x + y * fb._fb_stride) << 1
+    fb._fb_buf[i] = c & 0xFF
+    fb._fb_buf[i + 1] = (c >> 8) & 0xFF
+
+
+def _get_gs2(fb, x, y):
+    i = x + y * fb._fb_stride
+    return (fb._fb_buf[i >> 2] >> ((i & 3) << 1)) & 3
+
+
+def _set_gs2(fb, x, y, c):
+    i = x + y * fb._fb_stride
+    s = (i & 3) << 1
+    i >>= 2
+    fb._fb_buf[i] = (fb._fb_buf[i] & ~(3 << s)) | ((c & 3) << s)
+
+
+def _get_gs4(fb, x, y):
+    i = x + y * fb._fb_stride
+    if x & 1:
+        return fb._fb_buf[i >> 1] & 0x0F
+    return fb._fb_buf[i >> 1] >> 4
+
+
+def _set_gs4(fb, x, y, c):
+    i = (x + y * fb._fb_stride) >> 1
+    if x & 1:
+        fb._fb_buf[i] = (fb._fb_buf[i] & 0xF0) | (c & 0x0F)
+    else:
+        fb._fb_buf[i] = (fb._fb_buf[i] & 0x0F) | ((c & 0x0F) << 4)
+
+
+def _get_gs8(fb, x, y):
+    return fb._fb_buf[x + y * fb._fb_stride]
+
+
+def _set_gs8(fb, x, y, c):
+    fb._fb_buf[x + y * fb._fb_stride] = c & 0xFF
+
+
+_ACCESS = {
+    MONO_VLSB: (_get_vlsb, _set_vlsb, 0),
+    MONO_HLSB: (_get_hlsb, _set_hlsb, 7),
+    MONO_HMSB: (_get_hmsb, _set_hmsb, 7),
+    RGB565: (_get_rgb565, _set_rgb565, 0),
+    GS2_HMSB: (_get_gs2, _set_gs2, 3),
+    GS4_HMSB: (_get_gs4, _set_gs4, 1),
+    GS8: (_get_gs8, _set_gs8, 0),
+}
+
+# Byte -> its 8 pixels as 0/1, MSB first (HLSB) and LSB first (HMSB).
+_BITS_MSB = [tuple((b >> (7 - i)) & 1 for i in range(8)) for b in range(256)]
+_BITS_LSB = [tuple((b >> i) & 1 for i in range(8)) for b in range(256)]
+
+
+# Drawing primitives work on the _fb_* fields and call each other directly,
+# never through methods, so a subclass overriding pixel() or fill_rect()
+# (as ssd1306.py does to track damage) sees only its callers' calls, as
+# with the C module.
+
+
+def _pixel(fb, x, y, c):
+    if 0 <= x < fb._fb_w and 0 <= y < fb._fb_h:
+        fb._fb_set(fb, x, y, c)
+
+
+def _fill_rect(fb, x, y, w, h, c):
+    x0 = max(x, 0)
+    y0 = max(y, 0)
+    x1 = min(x + w, fb._fb_w)
+    y1 = min(y + h, fb._fb_h)
+    if x0 >= x1 or y0 >= y1:
+        return
+    buf = fb._fb_buf
+    fmt = fb._fb_format
+    stride = fb._fb_stride
+    if fmt == RGB565:
+        run = bytes((c & 0xFF, (c >> 8) & 0xFF)) * (x1 - x0)
+        for yy in range(y0, y1):
+            i = (yy * stride + x0) << 1
+            buf[i : i + len(run)] = run
+        return
+    if fmt == GS8:
+        run = bytes((c & 0xFF,)) * (x1 - x0)
+        for yy in range(y0, y1):
+            i = yy * stride + x0
+            buf[i : i + len(run)] = run
+        return
+    if fmt == MONO_VLSB:
+        for page in range(y0 >> 3, ((y1 - 1) >> 3) + 1):
+            lo = max(y0 - (page << 3), 0)
+            hi = min(y1 - (page << 3), 8)
+            m = ((1 << hi) - 1) & ~((1 << lo) - 1)
+            i = page * stride
+            for j in range(i + x0, i + x1):
+                buf[j] = (buf[j] | m) if c & 1 else (buf[j] & ~m)
+        return
+    s = fb._fb_set
+    for yy in range(y0, y1):
+        for xx in range(x0, x1):
+            s(fb, xx, yy, c)
+
+
+def _line(fb, x0, y0, x1, y1, c):
+    dx = abs(x1 - x0)
+    dy = -abs(y1 - y0)
+    sx = 1 if x0 < x1 else -1
+    sy = 1 if y0 < y1 else -1
+    err = dx + dy
+    while True:
+        _pixel(fb, x0, y0, c)
+        if x0 == x1 and y0 == y1:
+            return
+        e2 = 2 * err
+        if e2 >= dy:
+            err += dy
+            x0 += sx
+        if e2 <= dx:
+            err += dx
+            y0 += sy
+
+
+def _span(r, other, d):
+    # Half-width of an ellipse row d away from the centre.
+    if not other:
+        return r
+    return int(round(r * max(0.0, 1 - (d / other) ** 2) ** 0.5))
+
+
+# Quadrant bits of ellipse(): 1 upper right, 2 upper left, 4 lower left,
+# 8 lower right, with the x and y sign of each.
+_QUADS = ((1, 1, -1), (2, -1, -1), (4, -1, 1), (8, 1, 1))
+
+
+class FrameBuffer:
+    def __init__(self, buffer, width, height, format, stride=None):
+        if format not in _ACCESS:
+            raise ValueError("invalid format")
+        get, set_, align = _ACCESS[format]
+        if stride is None:
+            stride = width
+        self._fb_buf = buffer
+        self._fb_w = width
+        self._fb_h = height
+        self._fb_format = format
+        self._fb_stride = (stride + align) & ~align
+        self._fb_get = get
+        self._fb_set = set_
+
+    def pixel(self, x, y, c=None):
+        if 0 <= x < self._fb_w and 0 <= y < self._fb_h:
+            if c is None:
+                return self._fb_get(self, x, y)
+            self._fb_set(self, x, y, c)
+        return None
+
+    def fill(self, c):
+        fmt = self._fb_format
+        if fmt in (MONO_VLSB, MONO_HLSB, MONO_HMSB):
+            v = 0xFF if c & 1 else 0
+        elif fmt == GS2_HMSB:
+            v = (c & 3) * 0x55
+        elif fmt == GS4_HMSB:
+            v = (c & 0x0F) * 0x11
+        elif fmt == GS8:
+            v = c & 0xFF
+        else:
+            _fill_rect(self, 0, 0, self._fb_w, self._fb_h, c)
+            return
+        buf = self._fb_buf
+        buf[: len(buf)] = bytes((v,)) * len(buf)
+
+    def fill_rect(self, x, y, w, h, c):
+        _fill_rect(self, x, y, w, h, c)
+
+    def hline(self, x, y, w, c):
+        _fill_rect(self, x, y, w, 1, c)
+
+    def vline(self, x, y, h, c):
+        _fill_rect(self, x, y, 1, h, c)
+
+    def rect(self, x, y, w, h, c, f=False):
+        if f:
+            _fill_rect(self, x, y, w, h, c)
+            return
+        _fill_rect(self, x, y, w, 1, c)
+        _fill_rect(self, x, y + h - 1, w, 1, c)
+        _fill_rect(self, x, y, 1, h, c)
+        _fill_rect(self, x + w - 1, y, 1, h, c)
+
+    def line(self, x0, y0, x1, y1, c):
+        _line(self, x0, y0, x1, y1, c)
+
+    def ellipse(self, x, y, xr, yr, c, f=False, m=0x0F):
+        # Rows come from the exact curve rounded to pixels, which can differ
+        # from the device's midpoint walk by a pixel at the extremes.
+        for dy in range(yr + 1):
+            span = _span(xr, yr, dy)
+            for bit, qx, qy in _QUADS:
+                if not m & bit:
+                    continue
+                if f:
+                    x0 = x if qx > 0 else x - span
+                    _fill_rect(self, x0, y + qy * dy, span + 1, 1, c)
+                else:
+                    _pixel(self, x + qx * span, y + qy * dy, c)
+        if f:
+            return
+        # A second pass along x keeps the steep parts of the outline joined.
+        for dx in range(xr + 1):
+            span = _span(yr, xr, dx)
+            for bit, qx, qy in _QUADS:
+                if m & bit:
+                    _pixel(self, x + qx * dx, y + qy * span, c)
+
+    def poly(self, x, y, coords, c, f=False):
+        n = len(coords) // 2
+        if not n:
+            return
+        pts = [(x + coords[2 * i], y + coords[2 * i + 1]) for i in range(n)]
+        if f:
+            top = min(p[1] for p in pts)
+            bottom = max(p[1] for p in pts)
+            for yy in range(top, bottom + 1):
+                # Even-odd crossings of this row.
+                xs = []
+                for i in range(n):
+                    x0, y0 = pts[i]
+                    x1, y1 = pts[(i + 1) % n]
+                    if y0 <= yy < y1 or y1 <= yy < y0:
+                        xs.append(x0 + (yy - y0) * (x1 - x0) / (y1 - y0))
+                xs.sort()
+                for i in range(0, len(xs) - 1, 2):
+                    a = int(round(xs[i]))
+                    b = int(round(xs[i + 1]))
+                    _fill_rect(self, a, yy, b - a + 1, 1, c)
+        for i in range(n):
+            x0, y0 = pts[i]
+            x1, y1 = pts[(i + 1) % n]
+            _line(self, x0, y0, x1, y1, c)
+
+    def text(self, s, x, y, c=1):
+        for ch in str(s):
+            if ch != " ":
+                _fill_rect(self, x + 1, y + 1, 6, 6, c)
+            x += 8
+
+    def scroll(self, xstep, ystep):
+        w = self._fb_w
+        h = self._fb_h
+        get = self._fb_get
+        set_ = self._fb_set
+        xs = range(w - 1, -1, -1) if xstep > 0 else range(w)
+        ys = range(h - 1, -1, -1) if ystep > 0 else range(h)
+        for yy in ys:
+            sy = yy - ystep
+            if 0 <= sy < h:
+                for xx in xs:
+                    sx = xx - xstep
+                    if 0 <= sx < w:
+                        set_(self, xx, yy, get(self, sx, sy))
+
+    def blit(self, fbuf, x, y, key=-1, palette=None):
+        if isinstance(fbuf, tuple):
+            fbuf = FrameBuffer(*fbuf)
+        x0 = max(x, 0)
+        y0 = max(y, 0)
+        x1 = min(x + fbuf._fb_w, self._fb_w)
+        y1 = min(y + fbuf._fb_h, self._fb_h)
+        if x0 >= x1 or y0 >= y1:
+            return
+        if (
+            palette is not None
+            and key == -1
+            and self._fb_format == RGB565
+            and fbuf._fb_format in (MONO_HLSB, MONO_HMSB)
+        ):
+            _blit_mono(self, fbuf, x, y, x0, y0, x1, y1, palette)
+            return
+        get = fbuf._fb_get
+        set_ = self._fb_set
+        pget = palette._fb_get if palette is not None else None
+        for yy in range(y0, y1):
+            sy = yy - y
+            for xx in range(x0, x1):
+                col = get(fbuf, xx - x, sy)
+                if pget is not None:
+                    col = pget(palette, col, 0)
+                if col != key:
+                    set_(self, xx, yy, col)
+
+
+def _blit_mono(dst, src, x, y, x0, y0, x1, y1, palette):
+    # 1bpp through a 2-entry palette into RGB565 a row at a time; this is
+    # how the TFT sketch pushes its shadow canvas, so it is kept quick.
+    cols = []
+    for i in (0, 1):
+        c = palette._fb_get(palette, i, 0)
+        cols.append(bytes((c & 0xFF, (c >> 8) & 0xFF)))
+    bits = _BITS_MSB if src._fb_format == MONO_HLSB else _BITS_LSB
+    sbuf = src._fb_buf
+    dbuf = dst._fb_buf
+    w = x1 - x0
+    for yy in range(y0, y1):
+        i = (yy - y) * src._fb_stride + (x0 - x)
+        px = []
+        for b in sbuf[i >> 3 : ((i + w - 1) >> 3) + 1]:
+            px.extend(bits[b])
+        px = px[i & 7 : (i & 7) + w]
+        at = (yy * dst._fb_stride + x0) << 1
+        dbuf[at : at + 2 * w] = b"".join([cols[p] for p in px])
+
+
+FrameBuffer1 = FrameBuffer
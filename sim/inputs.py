@@ -0,0 +1,104 @@
+# Scripted knob and button input
+#
+# Both are contacts to ground on pulled-up pins, as on the KY-040 boards:
+# a closed contact drives the pin low and an open one releases it to its
+# pull-up. Every call schedules its edges on the clock and returns the
+# virtual time (ms) when the gesture is over; calls on the same input
+# queue up one after another.
+from sim import machine as _machine
+
+# Contact bounce: time between the extra edges around a clean one.
+BOUNCE_NS = 50_000
+
+
+def _set(pin, closed):
+    _machine.drive(pin, 0 if closed else None)
+
+
+class _Input:
+    def __init__(self, clock):
+        self.clock = clock
+        self._free_ns = 0
+
+    def _start(self, at_ms):
+        t = self.clock.now_ns if at_ms is None else int(at_ms * 1_000_000)
+        return max(t, self._free_ns, self.clock.now_ns)
+
+    def _edge(self, t_ns, pin, closed, bounce):
+        # Schedules one edge, preceded by `bounce` brief false starts.
+        for k in range(bounce):
+            t0 = t_ns - (2 * (bounce - k)) * BOUNCE_NS
+            self.clock.at_ns(t0, _set, pin, closed)
+            self.clock.at_ns(t0 + BOUNCE_NS, _set, pin, not closed)
+        self.clock.at_ns(t_ns, _set, pin, closed)
+
+    def wait(self, ms):
+        # Leaves the input idle for ms before its next gesture.
+        self._free_ns = self._start(None) + int(ms * 1_000_000)
+        return self._free_ns / 1_000_000
+
+
+class Encoder(_Input):
+    # A quadrature knob: one detent is a full CLK/DT cycle of four edges.
+    # Positive detents are the +1 direction of encoder.py (CLK falls while
+    # DT is high).
+    def __init__(self, clock, clk, dt):
+        super().__init__(clock)
+        self.clk = clk
+        self.dt = dt
+
+    def turn(self, detents, at_ms=None, period_ms=4, bounce=0):
+        # Turns the knob by detents, one detent every period_ms, starting
+        # at at_ms (or as soon as the previous gesture is over).
+        t = self._start(at_ms)
+        quarter = int(period_ms * 1_000_000) // 4
+        if detents >= 0:
+            first, second = self.clk, self.dt
+        else:
+            first, second = self.dt, self.clk
+        for _ in range(abs(detents)):
+            for pin, closed in ((first, 1), (second, 1), (first, 0), (second, 0)):
+                t += quarter
+                self._edge(t, pin, closed, bounce)
+        self._free_ns = t
+        return t / 1_000_000
+
+    def glitch(self, at_ms=None):
+        # Flips both lines in the same instant and back: transitions the
+        # decoder can only count as errors.
+        t = self._start(at_ms)
+        self.clock.at_ns(t, self._both, 1)
+        self.clock.at_ns(t + 2 * BOUNCE_NS, self._both, 0)
+        self._free_ns = t + 2 * BOUNCE_NS
+        return self._free_ns / 1_000_000
+
+    def _both(self, closed):
+        _set(self.clk, closed)
+        _set(self.dt, closed)
+
+
+class Button(_Input):
+    def __init__(self, clock, pin):
+        super().__init__(clock)
+        self.pin = pin
+
+    def press(self, at_ms=None, hold_ms=80, bounce=0):
+        # Presses for hold_ms and lets go.
+        t = self._start(at_ms)
+        self._edge(t, self.pin, 1, bounce)
+        t += int(hold_ms * 1_000_000)
+        self._edge(t, self.pin, 0, bounce)
+        self._free_ns = t
+        return t / 1_000_000
+
+    def down(self, at_ms=None):
+        t = self._start(at_ms)
+        self._edge(t, self.pin, 1, 0)
+        self._free_ns = t
+        return t / 1_000_000
+
+    def up(self, at_ms=None):
+        t = self._start(at_ms)
+        self._edge(t, self.pin, 0, 0)
+        self._free_ns = t
+        return t / 1_000_000
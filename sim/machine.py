@@ -0,0 +1,385 @@
+# Stand-in for MicroPython's machine module
+#
+# Pins share one level table keyed by pin id, as the GPIO block does: two
+# Pin objects for the same id see the same level. An input reads its
+# external drive (set by sim.inputs or drive()) or else its pull. Level
+# changes call the pin's IRQ handler through the clock and notify any
+# device watching that pin.
+#
+# SPI and I2C deliver traffic to device models attached with attach_spi()
+# and attach_i2c() (see sim/devices.py) and advance the clock by the time
+# the transfer takes on the wire.
+from sim import clock as _clock
+
+_pins = {}
+_spi_devices = {}
+_i2c_devices = []
+_adc_values = {}
+# Time spent on the wire by every bus, ns.
+_bus_ns = [0]
+
+
+def reset_board():
+    # Forgets every pin, device and ADC level.
+    _pins.clear()
+    _spi_devices.clear()
+    del _i2c_devices[:]
+    _adc_values.clear()
+    _bus_ns[0] = 0
+
+
+def bus_time_ns():
+    # Total time SPI and I2C transfers have taken since the board reset.
+    return _bus_ns[0]
+
+
+def _on_wire(ns):
+    _bus_ns[0] += ns
+    _clock.current.advance_ns(ns)
+
+
+class _PinState:
+    def __init__(self):
+        self.mode = Pin.IN
+        self.pull = None
+        self.out = 0
+        self.ext = None
+        self.level = 0
+        self.handler = None
+        self.trigger = 0
+        self.hard = False
+        self.owner = None
+        self.watchers = []
+
+
+def _state(pin_id):
+    s = _pins.get(pin_id)
+    if s is None:
+        s = _pins[pin_id] = _PinState()
+    return s
+
+
+def _update(pin_id, s):
+    if s.mode == Pin.OUT:
+        level = s.out
+    elif s.mode == Pin.OPEN_DRAIN and not s.out:
+        level = 0
+    elif s.ext is not None:
+        level = s.ext
+    else:
+        level = 1 if s.pull == Pin.PULL_UP else 0
+    if level == s.level:
+        return
+    s.level = level
+    for fn in s.watchers:
+        fn(pin_id, level)
+    edge = Pin.IRQ_RISING if level else Pin.IRQ_FALLING
+    if s.handler is not None and s.trigger & edge:
+        if s.hard:
+            s.handler(s.owner)
+        else:
+            _clock.current.raise_irq(s.handler, s.owner)
+
+
+def drive(pin_id, level):
+    # Drives a pin from outside the chip, as a switch or another device
+    # would; None releases it to its pull.
+    s = _state(pin_id)
+    s.ext = level
+    _update(pin_id, s)
+
+
+def level(pin_id):
+    return _state(pin_id).level
+
+
+def watch(pin_id, fn):
+    # Calls fn(pin_id, level) on every level change of the pin.
+    _state(pin_id).watchers.append(fn)
+
+
+def set_adc(pin_id, value):
+    # Sets what ADC.read_u16() returns for the channel on pin_id.
+    _adc_values[pin_id] = value
+
+
+def attach_spi(device, bus=0):
+    _spi_devices.setdefault(bus, []).append(device)
+
+
+def attach_i2c(device, addr, bus=None, scl=None, sda=None):
+    # Puts device at addr on I2C bus `bus`, or on every bus when None. scl
+    # and sda, when given, restrict it to buses created on those pins.
+    _i2c_devices.append((device, addr, bus, scl, sda))
+
+
+def _pin_id(pin):
+    return pin.id if isinstance(pin, Pin) else pin
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    ALT = 3
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, id, mode=-1, pull=-1, value=None, **kwargs):
+        self.id = _pin_id(id)
+        self._s = _state(self.id)
+        self.init(mode, pull, value)
+
+    def init(self, mode=-1, pull=-1, value=None, **kwargs):
+        s = self._s
+        if value is not None:
+            s.out = 1 if value else 0
+        if mode != -1:
+            s.mode = mode
+        if pull != -1:
+            s.pull = pull
+        _update(self.id, s)
+
+    def value(self, v=None):
+        if v is None:
+            return self._s.level
+        self._s.out = 1 if v else 0
+        _update(self.id, self._s)
+
+    def __call__(self, v=None):
+        return self.value(v)
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    high = on
+    low = off
+
+    def toggle(self):
+        self.value(not self._s.out)
+
+    def mode(self, mode=None):
+        if mode is None:
+            return self._s.mode
+        self.init(mode)
+
+    def pull(self, pull=None):
+        if pull is None:
+            return self._s.pull
+        self.init(pull=pull)
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False):
+        s = self._s
+        s.handler = handler
+        s.trigger = trigger
+        s.hard = hard
+        s.owner = self
+        return self
+
+    def __repr__(self):
+        return "Pin(%r)" % (self.id,)
+
+
+class SPI:
+    MSB = 0
+    LSB = 1
+
+    def __init__(self, id=0, baudrate=1_000_000, **kwargs):
+        self.id = id
+        self.baudrate = baudrate
+        self.init(**kwargs)
+
+    def init(self, baudrate=None, **kwargs):
+        if baudrate is not None:
+            self.baudrate = baudrate
+
+    def deinit(self):
+        pass
+
+    def _selected(self):
+        for dev in _spi_devices.get(self.id, ()):
+            if dev.cs is None or level(dev.cs) == 0:
+                yield dev
+
+    def _clock_out(self, n):
+        _on_wire(n * 8_000_000_000 // self.baudrate)
+
+    def write(self, buf):
+        for dev in self._selected():
+            dev.spi_write(buf)
+        self._clock_out(len(buf))
+
+    def readinto(self, buf, write=0x00):
+        data = b""
+        for dev in self._selected():
+            data = dev.spi_read(len(buf))
+        for i in range(len(buf)):
+            buf[i] = data[i] if i < len(data) else 0
+        self._clock_out(len(buf))
+
+    def read(self, nbytes, write=0x00):
+        buf = bytearray(nbytes)
+        self.readinto(buf, write)
+        return bytes(buf)
+
+    def write_readinto(self, write_buf, read_buf):
+        data = b""
+        for dev in self._selected():
+            dev.spi_write(write_buf)
+            data = dev.spi_read(len(read_buf))
+        for i in range(len(read_buf)):
+            read_buf[i] = data[i] if i < len(data) else 0
+        self._clock_out(len(write_buf))
+
+
+SoftSPI = SPI
+
+
+class I2C:
+    def __init__(self, id=0, scl=None, sda=None, freq=400_000, timeout=50_000):
+        self.id = id
+        self.scl = None if scl is None else _pin_id(scl)
+        self.sda = None if sda is None else _pin_id(sda)
+        self.freq = freq
+
+    def init(self, scl=None, sda=None, freq=None, **kwargs):
+        if scl is not None:
+            self.scl = _pin_id(scl)
+        if sda is not None:
+            self.sda = _pin_id(sda)
+        if freq is not None:
+            self.freq = freq
+
+    def deinit(self):
+        pass
+
+    def _device(self, addr):
+        for dev, a, bus, scl, sda in _i2c_devices:
+            if a != addr or (bus is not None and bus != self.id):
+                continue
+            if (scl is not None and scl != self.scl) or (
+                sda is not None and sda != self.sda
+            ):
+                continue
+            if self.freq > getattr(dev, "max_freq", self.freq):
+                # Too fast for it: the address is never acknowledged.
+                continue
+            return dev
+        return None
+
+    def _byte_ns(self):
+        return 9_000_000_000 // self.freq
+
+    def scan(self):
+        found = []
+        for addr in range(0x08, 0x78):
+            if self._device(addr) is not None:
+                found.append(addr)
+        _on_wire(0x70 * self._byte_ns())
+        return found
+
+    def writeto(self, addr, buf, stop=True):
+        dev = self._device(addr)
+        byte_ns = self._byte_ns()
+        clk = _clock.current
+        if dev is None:
+            _on_wire(byte_ns)
+            raise OSError(5)
+        acks = dev.i2c_write(buf, clk.now_ns + byte_ns, byte_ns)
+        if acks is None:
+            acks = len(buf)
+        _on_wire((1 + len(buf)) * byte_ns)
+        return acks
+
+    def writevto(self, addr, vector, stop=True):
+        return self.writeto(addr, b"".join(bytes(b) for b in vector), stop)
+
+    def readfrom_into(self, addr, buf, stop=True):
+        dev = self._device(addr)
+        byte_ns = self._byte_ns()
+        clk = _clock.current
+        if dev is None:
+            _on_wire(byte_ns)
+            raise OSError(5)
+        data = dev.i2c_read(len(buf), clk.now_ns + byte_ns)
+        for i in range(len(buf)):
+            buf[i] = data[i] if i < len(data) else 0xFF
+        _on_wire((1 + len(buf)) * byte_ns)
+
+    def readfrom(self, addr, nbytes, stop=True):
+        buf = bytearray(nbytes)
+        self.readfrom_into(addr, buf, stop)
+        return bytes(buf)
+
+    def writeto_mem(self, addr, memaddr, buf, addrsize=8):
+        self.writeto(addr, bytes((memaddr,)) + bytes(buf))
+
+    def readfrom_mem_into(self, addr, memaddr, buf, addrsize=8):
+        self.writeto(addr, bytes((memaddr,)), False)
+        self.readfrom_into(addr, buf)
+
+    def readfrom_mem(self, addr, memaddr, nbytes, addrsize=8):
+        buf = bytearray(nbytes)
+        self.readfrom_mem_into(addr, memaddr, buf, addrsize)
+        return bytes(buf)
+
+
+SoftI2C = I2C
+
+
+class ADC:
+    # Channels 0-3 are GPIO 26-29, as on the RP2040. Reads mid-scale unless
+    # set_adc() says otherwise.
+    CORE_TEMP = 4
+
+    def __init__(self, pin):
+        pin = _pin_id(pin)
+        if isinstance(pin, int) and pin < 4:
+            pin += 26
+        self.pin = pin
+
+    def read_u16(self):
+        return _adc_values.get(self.pin, 0x8000)
+
+
+def freq(hz=None):
+    if hz is None:
+        return 125_000_000
+
+
+def idle():
+    # Sleeps until the next scripted event, or 1 ms when there is none.
+    clk = _clock.current
+    t = clk.next_event_ns()
+    clk.advance_ns(1_000_000 if t is None else t - clk.now_ns)
+
+
+def lightsleep(ms=None):
+    if ms is None:
+        idle()
+    else:
+        _clock.current.advance_ns(ms * 1_000_000)
+
+
+deepsleep = lightsleep
+
+
+def disable_irq():
+    return 0
+
+
+def enable_irq(state=0):
+    pass
+
+
+def unique_id():
+    return b"SIM\0\0\0\0\1"
+
+
+def reset():
+    raise _clock.SimStop()
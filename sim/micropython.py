@@ -0,0 +1,40 @@
+# Stand-in for the micropython module
+#
+# Code emitters are no-ops on the host and schedule() runs its callback
+# before the clock next moves, like a soft IRQ.
+from sim import clock as _clock
+
+
+def const(x):
+    return x
+
+
+def native(f):
+    return f
+
+
+viper = native
+
+
+def schedule(fn, arg):
+    _clock.current.raise_irq(fn, arg)
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+def opt_level(level=None):
+    return 0 if level is None else None
+
+
+def mem_info(verbose=None):
+    pass
+
+
+def heap_lock():
+    return 0
+
+
+def heap_unlock():
+    return 0
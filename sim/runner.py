@@ -0,0 +1,128 @@
+# Runs a sketch under CPython on the simulated board
+#
+# Simulator owns the clock and the board: attach display models and
+# scripted input to it, then run() the sketch. While it runs, the
+# stand-ins are installed as machine, utime, time, framebuf and
+# micropython; the host's modules come back afterwards. The sketch runs
+# as __main__ until its clock reaches the stop time.
+import os
+import sys
+import time
+
+from sim import clock as _clock
+from sim import framebuf as _framebuf
+from sim import machine as _machine
+from sim import micropython as _micropython
+from sim import utime as _utime
+from sim.clock import Clock, SimStop
+from sim.inputs import Button, Encoder
+
+_MODULES = {
+    "machine": _machine,
+    "utime": _utime,
+    "time": _utime,
+    "framebuf": _framebuf,
+    "micropython": _micropython,
+}
+
+
+def forget_modules(directory):
+    # Drops modules imported from directory, so the next run imports them
+    # fresh against the current board.
+    directory = os.path.abspath(directory)
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, "__file__", None)
+        if path and os.path.dirname(os.path.abspath(path)) == directory:
+            del sys.modules[name]
+
+
+class Simulator:
+    # Creating a Simulator resets the board: pins, buses and the clock the
+    # stand-in modules read are all its own.
+    def __init__(self):
+        self.clock = Clock()
+        _clock.current = self.clock
+        _machine.reset_board()
+        self.devices = []
+        self.namespace = None
+        self.stopped = False
+        self.host_s = 0.0
+        self._saved = None
+        self._sketch_dir = None
+
+    def attach_spi(self, device, bus=0):
+        _machine.attach_spi(device, bus)
+        self.devices.append(device)
+        return device
+
+    def attach_i2c(self, device, addr, bus=None, scl=None, sda=None):
+        _machine.attach_i2c(device, addr, bus, scl, sda)
+        self.devices.append(device)
+        return device
+
+    def encoder(self, clk, dt):
+        return Encoder(self.clock, clk, dt)
+
+    def button(self, pin):
+        return Button(self.clock, pin)
+
+    def at(self, ms, fn, *args):
+        # Calls fn(*args) from inside the sketch's sleep at virtual time ms.
+        self.clock.at(ms, fn, *args)
+
+    def install(self):
+        _clock.current = self.clock
+        self._saved = {name: sys.modules.get(name) for name in _MODULES}
+        sys.modules.update(_MODULES)
+
+    def uninstall(self):
+        for name, module in self._saved.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
+        self._saved = None
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, *exc):
+        self.uninstall()
+        return False
+
+    def run(self, path, stop_ms=None, cwd=None):
+        # Runs the sketch at path and returns its globals, as they stood
+        # when the clock stopped. cwd is where the sketch's files (journal,
+        # gallery) live; give a fresh directory for a repeatable run.
+        if stop_ms is not None:
+            self.clock.stop_at(stop_ms)
+        path = os.path.abspath(path)
+        sketch_dir = os.path.dirname(path)
+        with open(path) as f:
+            code = compile(f.read(), path, "exec")
+        self.namespace = {"__name__": "__main__", "__file__": path}
+        forget_modules(sketch_dir)
+        sys.path.insert(0, sketch_dir)
+        old_cwd = os.getcwd()
+        if cwd is not None:
+            os.chdir(cwd)
+        start = time.perf_counter()
+        try:
+            with self:
+                try:
+                    exec(code, self.namespace)
+                except SimStop:
+                    self.stopped = True
+        finally:
+            self.host_s = time.perf_counter() - start
+            os.chdir(old_cwd)
+            sys.path.remove(sketch_dir)
+            forget_modules(sketch_dir)
+        return self.namespace
+
+    def speedup(self):
+        # Virtual time simulated per second of host time.
+        if not self.host_s:
+            return 0.0
+        return self.clock.now_ns / 1e9 / self.host_s
@@ -0,0 +1,71 @@
+# Stand-in for MicroPython's utime (and time) on the virtual clock
+#
+# Ticks wrap at 2**30 like on the RP2040, so ticks_diff()/ticks_add()
+# arithmetic in the sketches is exercised as on the device. Anything not
+# defined here falls through to the host's time module.
+import calendar as _calendar
+import time as _host
+
+from sim import clock as _clock
+
+_TICKS_PERIOD = 1 << 30
+_TICKS_MAX = _TICKS_PERIOD - 1
+_TICKS_HALF = _TICKS_PERIOD >> 1
+
+# Wall-clock time at virtual time zero, seconds since the epoch.
+EPOCH_S = 1_700_000_000
+
+
+def ticks_ms():
+    return _clock.current.now_ns // 1_000_000 & _TICKS_MAX
+
+
+def ticks_us():
+    return _clock.current.now_ns // 1000 & _TICKS_MAX
+
+
+def ticks_cpu():
+    return ticks_us()
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & _TICKS_MAX
+
+
+def ticks_diff(a, b):
+    return ((a - b + _TICKS_HALF) & _TICKS_MAX) - _TICKS_HALF
+
+
+def sleep(s):
+    _clock.current.advance_ns(s * 1_000_000_000)
+
+
+def sleep_ms(ms):
+    _clock.current.advance_ns(ms * 1_000_000)
+
+
+def sleep_us(us):
+    _clock.current.advance_ns(us * 1000)
+
+
+def time():
+    return EPOCH_S + _clock.current.now_ns // 1_000_000_000
+
+
+def time_ns():
+    return EPOCH_S * 1_000_000_000 + _clock.current.now_ns
+
+
+def localtime(secs=None):
+    return _host.gmtime(time() if secs is None else secs)[:8]
+
+
+gmtime = localtime
+
+
+def mktime(t):
+    return _calendar.timegm(tuple(t[:6]))
+
+
+def __getattr__(name):
+    return getattr(_host, name)
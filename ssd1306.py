@@ -20,6 +20,12 @@ SET_PRECHARGE = const(0xD9)
 SET_VCOM_DESEL = const(0xDB)
 SET_CHARGE_PUMP = const(0x8D)
 
+# Rough bus cost, in bytes, of opening an address window (six commands) and
+# of each data transfer. show() uses them to merge dirty pages into windows
+# and to fall back to a full-frame write when that is cheaper.
+WINDOW_COST = const(18)
+TRANSFER_COST = const(2)
+
 
 class SSD1306(framebuf.FrameBuffer):
     def __init__(self, width, height, external_vcc):
@@ -28,7 +34,14 @@ class SSD1306(framebuf.FrameBuffer):
         self.external_vcc = external_vcc
         self.pages = self.height // 8
         self.buffer = bytearray(self.pages * self.width)
+        self._buffer_mv = memoryview(self.buffer)
+        # Dirty column range [x0, x1) per page; empty when x0 >= x1.
+        self._dirty_x0 = bytearray(self.pages)
+        self._dirty_x1 = bytearray(self.pages)
+        # Windows picked by show(): (page0, page1, col0, col1) per entry.
+        self._windows = bytearray(4 * self.pages)
         super().__init__(self.buffer, self.width, self.height, framebuf.MONO_VLSB)
+        self.invalidate()
         self.init_display()
 
     def init_display(self):
@@ -76,19 +89,177 @@ class SSD1306(framebuf.FrameBuffer):
     def invert(self, invert):
         self.write_cmd(SET_NORM_INV | (invert & 1))
 
-    def show(self):
-        x0 = 0
-        x1 = self.width - 1
-        if self.width == 64:
-            x0 += 32
-            x1 += 32
+    # Drawing calls mark what they touch so show() can send only the
+    # changed page/column windows. Call invalidate() after writing to
+    # self.buffer directly.
+    def invalidate(self):
+        for p in range(self.pages):
+            self._dirty_x0[p] = 0
+            self._dirty_x1[p] = self.width
+
+    def _clear_dirty(self):
+        for p in range(self.pages):
+            self._dirty_x0[p] = self.width
+            self._dirty_x1[p] = 0
+
+    def _mark(self, x, y, w, h):
+        if x < 0:
+            w += x
+            x = 0
+        if y < 0:
+            h += y
+            y = 0
+        if x + w > self.width:
+            w = self.width - x
+        if y + h > self.height:
+            h = self.height - y
+        if w <= 0 or h <= 0:
+            return
+        x0 = self._dirty_x0
+        x1 = self._dirty_x1
+        xe = x + w
+        for p in range(y >> 3, ((y + h - 1) >> 3) + 1):
+            if x < x0[p]:
+                x0[p] = x
+            if xe > x1[p]:
+                x1[p] = xe
+
+    def fill(self, c):
+        super().fill(c)
+        self.invalidate()
+
+    def pixel(self, x, y, c=None):
+        if c is None:
+            return super().pixel(x, y)
+        super().pixel(x, y, c)
+        if 0 <= x < self.width and 0 <= y < self.height:
+            p = y >> 3
+            if x < self._dirty_x0[p]:
+                self._dirty_x0[p] = x
+            if x >= self._dirty_x1[p]:
+                self._dirty_x1[p] = x + 1
+
+    def fill_rect(self, x, y, w, h, c):
+        super().fill_rect(x, y, w, h, c)
+        self._mark(x, y, w, h)
+
+    def rect(self, x, y, w, h, c, f=False):
+        super().rect(x, y, w, h, c, f)
+        self._mark(x, y, w, h)
+
+    def hline(self, x, y, w, c):
+        super().hline(x, y, w, c)
+        self._mark(x, y, w, 1)
+
+    def vline(self, x, y, h, c):
+        super().vline(x, y, h, c)
+        self._mark(x, y, 1, h)
+
+    def line(self, x1, y1, x2, y2, c):
+        super().line(x1, y1, x2, y2, c)
+        self._mark(min(x1, x2), min(y1, y2), abs(x2 - x1) + 1, abs(y2 - y1) + 1)
+
+    def ellipse(self, x, y, xr, yr, c, f=False, m=0x0F):
+        super().ellipse(x, y, xr, yr, c, f, m)
+        self._mark(x - xr, y - yr, 2 * xr + 1, 2 * yr + 1)
+
+    def poly(self, x, y, coords, c, f=False):
+        super().poly(x, y, coords, c, f)
+        if not len(coords):
+            return
+        xs = coords[0::2]
+        ys = coords[1::2]
+        x0 = min(xs)
+        y0 = min(ys)
+        self._mark(x + x0, y + y0, max(xs) - x0 + 1, max(ys) - y0 + 1)
+
+    def text(self, s, x, y, c=1):
+        super().text(s, x, y, c)
+        self._mark(x, y, 8 * len(s), 8)
+
+    def scroll(self, xstep, ystep):
+        super().scroll(xstep, ystep)
+        self.invalidate()
+
+    def blit(self, fbuf, x, y, *args):
+        super().blit(fbuf, x, y, *args)
+        self.invalidate()
+
+    def _plan_windows(self):
+        # Greedily merges each dirty page into the window above it when one
+        # taller window costs less than opening a new one. Returns the
+        # window count and the estimated bus cost.
+        x0 = self._dirty_x0
+        x1 = self._dirty_x1
+        win = self._windows
+        n = 0
+        cost = 0
+        for p in range(self.pages):
+            c0 = x0[p]
+            c1 = x1[p]
+            if c0 >= c1:
+                continue
+            alone = WINDOW_COST + TRANSFER_COST + c1 - c0
+            if n:
+                i = 4 * (n - 1)
+                if win[i + 1] == p - 1:
+                    m0 = min(c0, win[i + 2])
+                    m1 = max(c1, win[i + 3])
+                    rows = p - win[i] + 1
+                    before = WINDOW_COST + (rows - 1) * (
+                        TRANSFER_COST + win[i + 3] - win[i + 2]
+                    )
+                    merged = WINDOW_COST + rows * (TRANSFER_COST + m1 - m0)
+                    if merged <= before + alone:
+                        win[i + 1] = p
+                        win[i + 2] = m0
+                        win[i + 3] = m1
+                        cost += merged - before
+                        continue
+            i = 4 * n
+            win[i] = p
+            win[i + 1] = p
+            win[i + 2] = c0
+            win[i + 3] = c1
+            n += 1
+            cost += alone
+        return n, cost
+
+    def _send_window(self, p0, p1, c0, c1):
+        offset = 32 if self.width == 64 else 0
         self.write_cmd(SET_COL_ADDR)
-        self.write_cmd(x0)
-        self.write_cmd(x1)
+        self.write_cmd(c0 + offset)
+        self.write_cmd(c1 - 1 + offset)
         self.write_cmd(SET_PAGE_ADDR)
-        self.write_cmd(0)
-        self.write_cmd(self.pages - 1)
-        self.write_data(self.buffer)
+        self.write_cmd(p0)
+        self.write_cmd(p1)
+
+    def show(self):
+        n, cost = self._plan_windows()
+        if not n:
+            return
+        if cost >= WINDOW_COST + TRANSFER_COST + len(self.buffer):
+            self._send_window(0, self.pages - 1, 0, self.width)
+            self.write_data(self.buffer)
+        else:
+            win = self._windows
+            mv = self._buffer_mv
+            width = self.width
+            for i in range(0, 4 * n, 4):
+                p0 = win[i]
+                p1 = win[i + 1]
+                c0 = win[i + 2]
+                c1 = win[i + 3]
+                self._send_window(p0, p1, c0, c1)
+                if c0 == 0 and c1 == width:
+                    self.write_data(mv[p0 * width : (p1 + 1) * width])
+                    continue
+                # The controller wraps to the next page at c1, so each page
+                # slice follows the previous one.
+                for p in range(p0, p1 + 1):
+                    row = p * width
+                    self.write_data(mv[row + c0 : row + c1])
+        self._clear_dirty()
 
 
 class SSD1306_I2C(SSD1306):
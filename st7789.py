@@ -45,6 +45,10 @@ class ST7789(framebuf.FrameBuffer):
         if self.bl is not None:
             self.bl.init(self.bl.OUT, value=1)
 
+        # Scratch buffers reused by every transaction.
+        self._cmd_buf = bytearray(1)
+        self._win_buf = bytearray(4)
+
         self.buffer = bytearray(self.width * self.height * 2)
         super().__init__(self.buffer, self.width, self.height, framebuf.RGB565)
 
@@ -53,20 +57,14 @@ class ST7789(framebuf.FrameBuffer):
         self.show()
 
     def _write_cmd(self, cmd):
-        if self.cs is not None:
-            self.cs(0)
-        self.dc(0)
-        self.spi.write(bytearray([cmd]))
-        if self.cs is not None:
-            self.cs(1)
+        self._begin()
+        self._tx_cmd(cmd)
+        self._end()
 
     def _write_data(self, data):
-        if self.cs is not None:
-            self.cs(0)
-        self.dc(1)
-        self.spi.write(data)
-        if self.cs is not None:
-            self.cs(1)
+        self._begin()
+        self._tx_data(data)
+        self._end()
 
     def _hard_reset(self):
         self.reset(1)
@@ -76,19 +74,47 @@ class ST7789(framebuf.FrameBuffer):
         self.reset(1)
         time.sleep_ms(120)
 
-    def _set_window(self, x0, y0, x1, y1):
+    # Transactions: CS stays low from _begin() to _end(), so any number of
+    # _tx_cmd/_tx_data/_tx_window calls can be chained in between.
+    def _begin(self):
+        if self.cs is not None:
+            self.cs(0)
+
+    def _end(self):
+        if self.cs is not None:
+            self.cs(1)
+
+    def _tx_cmd(self, cmd):
+        self._cmd_buf[0] = cmd
+        self.dc(0)
+        self.spi.write(self._cmd_buf)
+
+    def _tx_data(self, data):
+        self.dc(1)
+        self.spi.write(data)
+
+    def _tx_window(self, x0, y0, x1, y1):
         x0 += self.xstart
         x1 += self.xstart
         y0 += self.ystart
         y1 += self.ystart
 
-        self._write_cmd(ST7789_CASET)
-        self._write_data(bytearray([x0 >> 8, x0 & 0xFF, x1 >> 8, x1 & 0xFF]))
+        buf = self._win_buf
+        self._tx_cmd(ST7789_CASET)
+        buf[0] = x0 >> 8
+        buf[1] = x0 & 0xFF
+        buf[2] = x1 >> 8
+        buf[3] = x1 & 0xFF
+        self._tx_data(buf)
 
-        self._write_cmd(ST7789_RASET)
-        self._write_data(bytearray([y0 >> 8, y0 & 0xFF, y1 >> 8, y1 & 0xFF]))
+        self._tx_cmd(ST7789_RASET)
+        buf[0] = y0 >> 8
+        buf[1] = y0 & 0xFF
+        buf[2] = y1 >> 8
+        buf[3] = y1 & 0xFF
+        self._tx_data(buf)
 
-        self._write_cmd(ST7789_RAMWR)
+        self._tx_cmd(ST7789_RAMWR)
 
     def _init_display(self):
         self._hard_reset()
@@ -110,5 +136,7 @@ class ST7789(framebuf.FrameBuffer):
         time.sleep_ms(120)
 
     def show(self):
-        self._set_window(0, 0, self.width - 1, self.height - 1)
-        self._write_data(self.buffer)
+        self._begin()
+        self._tx_window(0, 0, self.width - 1, self.height - 1)
+        self._tx_data(self.buffer)
+        self._end()
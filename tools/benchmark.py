@@ -0,0 +1,803 @@
+# Benchmark the sketches and display drivers on the simulated board
+#
+# Runs on the host under CPython:
+#
+#   python tools/benchmark.py                      # every target and workload
+#   python tools/benchmark.py -t ili9341 -w spiral --quick
+#   python tools/benchmark.py -o new.json --baseline old.json
+#
+# Each workload is a synthetic knob trace (strokes, spirals, zig-zags, undo
+# storms, a long random session) scaled to the canvas and replayed through
+# a target: one of the three sketches with its display, or a bare driver
+# (ST7789, SSD1306_I2C, SSD1306_SPI) drawing a 3x3 brush per step.
+#
+# Host timings (pixels/s, loop latency, per-function cost) are CPython
+# time spent inside the simulator, so they only compare runs on the same
+# machine; bus bytes, transactions and virtual bus time are exact. A bare
+# driver's host time is little more than copying its frame, so drivers get
+# no pixels/s; their bus figures are the ones to compare. Peak heap is the
+# host's tracemalloc peak over a second, unprobed run.
+# Latencies are kept in power-of-two microsecond buckets, so the p50 and
+# p99 figures are bucket upper bounds.
+import argparse
+import contextlib
+import datetime
+import importlib
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from sim import boards  # noqa: E402
+from sim import machine as sim_machine  # noqa: E402
+from sim.devices import MipiPanel, SSD1306Panel  # noqa: E402
+from sim import Simulator, forget_modules  # noqa: E402
+
+SCHEMA = 1
+# Every sketch is in its main loop by then (the LCD one, slowest to boot,
+# after about 1 s).
+START_MS = 1500
+# Time left after the last gesture for the sketch to catch up and flush.
+SETTLE_MS = 500
+# Same-button presses closer than 200 ms are ignored by main.py.
+PRESS_GAP_MS = 250
+BUCKETS = 32
+# Reported change beyond which a baseline comparison counts as a
+# regression.
+THRESHOLD = 0.10
+# Drawing area of each board's sketch (the LCD one draws in 16 x 5 x 8 dots).
+CANVAS = {"tft": (240, 320), "oled": (128, 32), "lcd": (80, 16)}
+
+
+# Workloads
+
+
+class Trace:
+    # A knob trace: cursor moves and button gestures in order, kept inside
+    # a w x h canvas starting from its centre like the sketches.
+    def __init__(self, name, w, h):
+        self.name = name
+        self.w = w
+        self.h = h
+        self.x = w // 2
+        self.y = h // 2
+        self.gestures = []
+        self.steps = 0
+
+    def move(self, axis, n, period_ms=2):
+        # Moves up to n steps along axis ("x" or "y"), stopping at the edge.
+        if axis == "x":
+            n = max(-self.x, min(self.w - 1 - self.x, n))
+            self.x += n
+        else:
+            n = max(-self.y, min(self.h - 1 - self.y, n))
+            self.y += n
+        if n:
+            self.gestures.append(("move", axis, n, period_ms))
+            self.steps += abs(n)
+        return n
+
+    def undo(self, hold_ms=80):
+        self.gestures.append(("undo", hold_ms))
+
+    def redo(self, hold_ms=80):
+        self.gestures.append(("redo", hold_ms))
+
+    def wait(self, ms):
+        self.gestures.append(("wait", ms))
+
+
+def straight(w, h, steps):
+    # Long straight strokes: laps around the canvas just inside its edge.
+    t = Trace("straight", w, h)
+    t.move("x", -w)
+    t.move("y", -h)
+    t.move("x", 2)
+    t.move("y", 2)
+    legs = (("x", w - 5), ("y", h - 5), ("x", -(w - 5)), ("y", -(h - 5)))
+    while t.steps < steps:
+        for axis, n in legs:
+            t.move(axis, n)
+            if t.steps >= steps:
+                break
+    return t
+
+
+def spiral(w, h, steps):
+    # Square spirals out from the centre and back in, legs two apart. A
+    # spiral stops growing at the canvas edge, or before winding out and
+    # back would take more than the whole workload.
+    t = Trace("spiral", w, h)
+    legs = []
+    n = 2
+    while n < min(w, h) - 4 and 2 * n * len(legs) < steps:
+        legs.append(n)
+        legs.append(n)
+        n += 2
+    while t.steps < steps:
+        for i, n in enumerate(legs):
+            sign = 1 if i % 4 < 2 else -1
+            t.move("x" if i % 2 == 0 else "y", sign * n)
+        for i in range(len(legs) - 1, -1, -1):
+            sign = 1 if i % 4 < 2 else -1
+            t.move("x" if i % 2 == 0 else "y", -sign * legs[i])
+    return t
+
+
+def zigzag(w, h, steps):
+    # Rapid short zig-zags, one detent per ms, sweeping down and back up.
+    t = Trace("zigzag", w, h)
+    width = min(16, w // 2 - 2)
+    down = 1
+    while t.steps < steps:
+        t.move("x", width, 1)
+        if not t.move("y", down, 1):
+            down = -down
+        t.move("x", -width, 1)
+        if not t.move("y", down, 1):
+            down = -down
+    return t
+
+
+def undo_storm(w, h, steps):
+    # Bursts of undo and redo presses at growing history lengths, drawn as
+    # a snake over the canvas in between.
+    t = Trace("undo_storm", w, h)
+    marks = [steps // 8, steps // 4, steps // 2, steps]
+    row = 1
+    for mark in marks:
+        while t.steps < mark:
+            if not t.move("x", row * w):
+                row = -row
+            t.move("y", 2)
+            if t.y >= h - 1:
+                t.move("y", -h)
+        for _ in range(4):
+            t.undo()
+        for _ in range(4):
+            t.redo()
+        t.undo(1000)
+        t.redo(1000)
+    return t
+
+
+def session(w, h, steps):
+    # A long sitting: a seeded random walk of strokes with the odd undo
+    # and redo.
+    t = Trace("session", w, h)
+    rnd = random.Random(2024)
+    next_undo = 3000
+    while t.steps < steps:
+        t.move(rnd.choice("xy"), rnd.randint(-24, 24), rnd.choice((1, 2, 4)))
+        if t.steps >= next_undo:
+            t.undo()
+            if rnd.random() < 0.5:
+                t.redo()
+            next_undo += rnd.randint(2000, 5000)
+    return t
+
+
+WORKLOADS = {
+    "straight": (straight, 4000),
+    "spiral": (spiral, 4000),
+    "zigzag": (zigzag, 4000),
+    "undo_storm": (undo_storm, 4000),
+    "session": (session, 100_000),
+}
+
+
+# Measurements
+
+
+class Histogram:
+    # Latencies in power-of-two microsecond buckets: bucket k holds
+    # [2**(k-1), 2**k) us, bucket 0 anything under 1 us.
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.n = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, us):
+        self.counts[min(int(us).bit_length(), BUCKETS - 1)] += 1
+        self.n += 1
+        self.total += us
+        if us > self.max:
+            self.max = us
+
+    def percentile(self, p):
+        want = self.n * p
+        seen = 0
+        for k, c in enumerate(self.counts):
+            seen += c
+            if c and seen >= want:
+                return 1 << k
+        return 0
+
+    def summary(self):
+        return {
+            "n": self.n,
+            "mean": round(self.total / self.n, 1) if self.n else 0,
+            "p50": self.percentile(0.5),
+            "p99": self.percentile(0.99),
+            "max": round(self.max, 1),
+        }
+
+
+class Probe:
+    # Timing gathered from inside a run: wrapped functions, passes of the
+    # main loop and undo/redo latency against history length.
+    def __init__(self, clock):
+        self.clock = clock
+        self.calls = {}
+        self.loop_host = Histogram()
+        self.loop_virtual = Histogram()
+        self.undo = []
+        self._last = None
+        self.base = None
+        self.end = None
+
+    def mark_start(self, device):
+        self.base = (
+            device.bytes,
+            device.transfers,
+            device.pixels,
+            sim_machine.bus_time_ns(),
+            self.clock.now_ns,
+            time.perf_counter(),
+        )
+        self._last = None
+        self.end = None
+
+    def mark_end(self):
+        self.end = time.perf_counter()
+
+    def loop_start(self):
+        self._last = (time.perf_counter(), self.clock.now_ns)
+
+    def loop_pass(self):
+        now = (time.perf_counter(), self.clock.now_ns)
+        if self._last is not None:
+            self.loop_host.add((now[0] - self._last[0]) * 1e6)
+            self.loop_virtual.add((now[1] - self._last[1]) / 1000)
+        self._last = now
+
+    def wrap(self, name, fn, history=None):
+        # fn with its calls counted and timed; history() gives the history
+        # length to file undo/redo latencies under.
+        stats = self.calls.setdefault(name, [0, 0.0, 0.0, 0])
+        clock = self.clock
+        perf_counter = time.perf_counter
+
+        def timed(*args, **kwargs):
+            before = history() if history else 0
+            t0 = perf_counter()
+            v0 = clock.now_ns
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                dt = (perf_counter() - t0) * 1e6
+                dv = (clock.now_ns - v0) // 1000
+                stats[0] += 1
+                stats[1] += dt
+                stats[3] += dv
+                if dt > stats[2]:
+                    stats[2] = dt
+                if history:
+                    self.undo.append((name, before, history() - before, dt, dv))
+
+        return timed
+
+    def ring_class(self, base):
+        # The sketches start every main-loop pass with len(events).
+        probe = self
+
+        class TimedRing(base):
+            def __len__(self):
+                probe.loop_pass()
+                return base.__len__(self)
+
+        return TimedRing
+
+
+def _git_revision():
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip() or None
+
+
+# Targets
+
+
+class Sketch:
+    # One of the sketches on its board. axes maps "x"/"y" to the knob and
+    # direction that moves the cursor that way.
+    kind = "sketch"
+
+    def __init__(self, name, path, driver, axes, show):
+        self.name = name
+        self.path = path
+        self.driver = driver
+        self.board = boards.SKETCHES[path]
+        self.axes = axes
+        self.show = show
+
+    def canvas(self):
+        return CANVAS[self.board]
+
+    def run(self, trace, probe_on=True):
+        sim = Simulator()
+        board = boards.BOARDS[self.board](sim)
+        end_ms = _schedule(board, self.axes, trace, START_MS)
+        probe = Probe(sim.clock) if probe_on else None
+        if probe:
+            sim.at(START_MS - 1, self._instrument, sim, board, probe)
+        else:
+            tracemalloc.start()
+        workdir = tempfile.mkdtemp(prefix="bench-")
+        try:
+            sim.run(os.path.join(ROOT, self.path), end_ms + SETTLE_MS, workdir)
+            if not probe:
+                return tracemalloc.get_traced_memory()[1]
+            probe.mark_end()
+        finally:
+            if not probe:
+                tracemalloc.stop()
+            shutil.rmtree(workdir, ignore_errors=True)
+        return sim, board.display, probe
+
+    def _instrument(self, sim, board, probe):
+        g = sim.namespace
+        points = g["points"]
+        for name in ("step_cursor", "rebuild_canvas_from_points", "render"):
+            # The OLED sketch's render is its frame scheduler, not a function.
+            if callable(g.get(name)):
+                g[name] = probe.wrap(name, g[name])
+        for name in ("undo_to", "redo_to"):
+            g[name] = probe.wrap(name, g[name], lambda: len(points))
+        obj, attr = self.show(g)
+        setattr(obj, attr, probe.wrap("show", getattr(obj, attr)))
+        ring = g["events"]
+        ring.__class__ = probe.ring_class(type(ring))
+        probe.mark_start(board.display)
+
+
+class Driver:
+    # A bare driver module on its own panel model, drawing a 3x3 brush for
+    # each step of the trace and calling show() once per pass, as fast as
+    # the bus allows. Undo and redo gestures do not apply.
+    kind = "driver"
+
+    def __init__(self, name, module, driver, size, wire, ink):
+        self.name = name
+        self.path = module + ".py"
+        self.module = module
+        self.driver = driver
+        self.size = size
+        self.wire = wire
+        self.ink = ink
+
+    def canvas(self):
+        return self.size
+
+    def run(self, trace, probe_on=True):
+        sim = Simulator()
+        panel, make = self.wire(sim)
+        steps = _timeline(trace, START_MS)
+        probe = Probe(sim.clock)
+        with sim:
+            forget_modules(ROOT)
+            if not probe_on:
+                tracemalloc.start()
+            sys.path.insert(0, ROOT)
+            try:
+                module = importlib.import_module(self.module)
+                display = make(module)
+                if probe_on:
+                    display.show = probe.wrap("show", display.show)
+                self._loop(sim.clock, display, panel, steps, probe_on and probe)
+                probe.mark_end()
+                if not probe_on:
+                    return tracemalloc.get_traced_memory()[1]
+            finally:
+                if not probe_on:
+                    tracemalloc.stop()
+                sys.path.remove(ROOT)
+                forget_modules(ROOT)
+        return sim, panel, probe
+
+    def _loop(self, clock, display, panel, steps, probe):
+        w, h = self.size
+        x, y = w // 2, h // 2
+        clock.advance_ns(START_MS * 1_000_000 - clock.now_ns)
+        if probe:
+            probe.mark_start(panel)
+        step = next(steps, None)
+        while step is not None:
+            if step[0] > clock.now_ns:
+                clock.advance_ns(step[0] - clock.now_ns)
+            if probe:
+                # A pass is timed from the end of its wait for input.
+                probe.loop_start()
+            while step is not None and step[0] <= clock.now_ns:
+                x = max(0, min(w - 1, x + step[1]))
+                y = max(0, min(h - 1, y + step[2]))
+                display.fill_rect(x - 1, y - 1, 3, 3, self.ink)
+                step = next(steps, None)
+            display.show()
+            if probe:
+                probe.loop_pass()
+
+
+def _wire_st7789(sim):
+    panel = sim.attach_spi(MipiPanel(240, 240, dc=8, cs=9, name="ST7789"), bus=1)
+
+    def make(module):
+        from machine import SPI, Pin
+
+        spi = SPI(1, baudrate=40_000_000, sck=Pin(10), mosi=Pin(11))
+        dc = Pin(8, Pin.OUT)
+        return module.ST7789(240, 240, spi, dc, Pin(12, Pin.OUT), Pin(9, Pin.OUT))
+
+    return panel, make
+
+
+def _wire_ssd1306_i2c(sim):
+    panel = sim.attach_i2c(SSD1306Panel(128, 32), 0x3C, bus=0)
+
+    def make(module):
+        from machine import I2C, Pin
+
+        i2c = I2C(0, scl=Pin(1), sda=Pin(0), freq=400_000)
+        return module.SSD1306_I2C(128, 32, i2c)
+
+    return panel, make
+
+
+def _wire_ssd1306_spi(sim):
+    panel = sim.attach_spi(SSD1306Panel(128, 32, dc=20, cs=17), bus=0)
+
+    def make(module):
+        from machine import SPI, Pin
+
+        spi = SPI(0, baudrate=10_000_000, sck=Pin(18), mosi=Pin(19))
+        return module.SSD1306_SPI(
+            128, 32, spi, dc=Pin(20, Pin.OUT), res=Pin(21, Pin.OUT), cs=Pin(17, Pin.OUT)
+        )
+
+    return panel, make
+
+
+TARGETS = {
+    t.name: t
+    for t in (
+        # main.py: ENC1 moves up the screen, ENC2 right.
+        Sketch(
+            "ili9341",
+            "main.py",
+            "ILI9341",
+            {"x": ("e2", 1), "y": ("e1", -1)},
+            lambda g: (g["display"], "show"),
+        ),
+        # The OLED sketch hands display.show to its frame scheduler.
+        Sketch(
+            "oled",
+            "pocket_sketch_oled_i2c.py",
+            "SSD1306_I2C",
+            {"x": ("e2", 1), "y": ("e1", 1)},
+            lambda g: (g["render"], "_show"),
+        ),
+        Sketch(
+            "lcd1602",
+            "pocket_sketch_lcd1602_i2c.py",
+            "LCD1602_I2C",
+            {"x": ("e1", 1), "y": ("e2", 1)},
+            lambda g: (g["lcd"], "flush"),
+        ),
+        Driver("st7789", "st7789", "ST7789", (240, 240), _wire_st7789, 0xFFFF),
+        Driver(
+            "ssd1306_i2c", "ssd1306", "SSD1306_I2C", (128, 32), _wire_ssd1306_i2c, 1
+        ),
+        Driver(
+            "ssd1306_spi", "ssd1306", "SSD1306_SPI", (128, 32), _wire_ssd1306_spi, 1
+        ),
+    )
+}
+
+
+def _schedule(board, axes, trace, t0):
+    # Puts the trace on the board's knobs and buttons from t0 on; returns
+    # when the last gesture ends.
+    t = t0
+    for g in trace.gestures:
+        if g[0] == "move":
+            knob, sign = axes[g[1]]
+            t = getattr(board, knob).turn(sign * g[2], at_ms=t, period_ms=g[3])
+        elif g[0] == "wait":
+            t += g[1]
+        else:
+            button = board.sw1 if g[0] == "undo" else board.sw2
+            end = button.press(at_ms=t, hold_ms=g[1])
+            t = max(end, t + PRESS_GAP_MS)
+    return t
+
+
+def _timeline(trace, t0):
+    # The trace's steps as (time_ns, dx, dy), one per detent, with button
+    # gestures taking their time but doing nothing.
+    t = t0 * 1_000_000
+    for g in trace.gestures:
+        if g[0] == "move":
+            period = int(g[3] * 1_000_000)
+            d = 1 if g[2] > 0 else -1
+            dx, dy = (d, 0) if g[1] == "x" else (0, d)
+            for _ in range(abs(g[2])):
+                t += period
+                yield t, dx, dy
+        elif g[0] == "wait":
+            t += int(g[1] * 1_000_000)
+        else:
+            t += max(g[1], PRESS_GAP_MS) * 1_000_000
+
+
+def run_one(target, workload, scale, heap):
+    make, steps = WORKLOADS[workload]
+    w, h = target.canvas()
+    trace = make(w, h, max(100, int(steps * scale)))
+    # The sketches' own prints go to stderr with the progress lines.
+    with contextlib.redirect_stdout(sys.stderr):
+        sim, device, probe = target.run(trace)
+        heap_peak = target.run(trace, probe_on=False) if heap else None
+    host_s = probe.end - probe.base[5]
+    virtual_ms = (sim.clock.now_ns - probe.base[4]) / 1e6
+    pixels = device.pixels - probe.base[2]
+    nbytes = device.bytes - probe.base[0]
+    transfers = device.transfers - probe.base[1]
+    bus_ms = (sim_machine.bus_time_ns() - probe.base[3]) / 1e6
+    n = trace.steps
+    result = {
+        "target": target.name,
+        "kind": target.kind,
+        "front_end": target.path,
+        "driver": target.driver,
+        "workload": workload,
+        "canvas": [w, h],
+        "steps": n,
+        "virtual_ms": round(virtual_ms, 1),
+        "host_s": round(host_s, 3),
+        "pixels": pixels,
+        "pixels_per_s": None,
+        "steps_per_s": round(n / host_s) if host_s else 0,
+        "bus": {
+            "bytes": nbytes,
+            "transactions": transfers,
+            "bytes_per_step": round(nbytes / n, 2),
+            "transactions_per_step": round(transfers / n, 3),
+            "busy_ms": round(bus_ms, 1),
+            "busy_fraction": round(bus_ms / virtual_ms, 3) if virtual_ms else 0,
+        },
+        "loop": {
+            "host_us": probe.loop_host.summary(),
+            "virtual_us": probe.loop_virtual.summary(),
+        },
+        "calls": {
+            name: {
+                "calls": s[0],
+                "host_us_total": round(s[1]),
+                "host_us_mean": round(s[1] / s[0], 1) if s[0] else 0,
+                "host_us_max": round(s[2], 1),
+                "virtual_us_total": s[3],
+            }
+            for name, s in sorted(probe.calls.items())
+        },
+        "undo_latency": None,
+        "peak_heap_bytes": heap_peak,
+    }
+    if target.kind == "sketch":
+        result["pixels_per_s"] = round(pixels / host_s) if host_s else 0
+        result["undo_latency"] = [
+            {
+                "op": name,
+                "history": length,
+                "moved": moved,
+                "host_us": round(dt, 1),
+                "virtual_us": dv,
+            }
+            for name, length, moved, dt, dv in probe.undo
+        ]
+    return result
+
+
+# Reporting
+
+
+def _undo_max(r):
+    samples = r["undo_latency"]
+    if not samples:
+        return None
+    return max(s["host_us"] for s in samples)
+
+
+def _fmt(v, spec):
+    return "-" if v is None else spec % v
+
+
+def print_table(results, out=sys.stdout):
+    head = "%-12s %-10s %7s %7s %9s %8s %7s %9s %9s %9s %8s"
+    row = "%-12s %-10s %7d %7.2f %9s %8.1f %7.3f %9s %9s %9s %8s"
+    print(
+        head
+        % (
+            "target",
+            "workload",
+            "steps",
+            "host s",
+            "px/s",
+            "B/step",
+            "tx/st",
+            "loop max",
+            "loop p99",
+            "undo max",
+            "heap KB",
+        ),
+        file=out,
+    )
+    for r in results:
+        heap = r["peak_heap_bytes"]
+        print(
+            row
+            % (
+                r["target"],
+                r["workload"],
+                r["steps"],
+                r["host_s"],
+                _fmt(r["pixels_per_s"], "%d"),
+                r["bus"]["bytes_per_step"],
+                r["bus"]["transactions_per_step"],
+                "%.0fus" % r["loop"]["virtual_us"]["max"],
+                "%dus" % r["loop"]["host_us"]["p99"],
+                _fmt(_undo_max(r), "%.0fus"),
+                _fmt(heap and heap / 1024, "%.1f"),
+            ),
+            file=out,
+        )
+
+
+# Metrics compared against a baseline, and whether bigger is better.
+COMPARED = (
+    (("pixels_per_s",), True),
+    (("bus", "bytes_per_step"), False),
+    (("bus", "transactions_per_step"), False),
+    (("loop", "virtual_us", "max"), False),
+    (("peak_heap_bytes",), False),
+)
+
+
+def _metric(r, path):
+    for key in path:
+        if r is None:
+            return None
+        r = r.get(key)
+    return r
+
+
+def compare(results, baseline, threshold, out=sys.stdout):
+    # Prints metrics that moved more than threshold against the baseline
+    # and returns how many of them moved the wrong way.
+    old = {(r["target"], r["workload"]): r for r in baseline["results"]}
+    worse = 0
+    for r in results:
+        b = old.get((r["target"], r["workload"]))
+        if b is None:
+            continue
+        for path, higher_is_better in COMPARED:
+            new_v = _metric(r, path)
+            old_v = _metric(b, path)
+            if not old_v or new_v is None:
+                continue
+            change = (new_v - old_v) / old_v
+            if abs(change) <= threshold:
+                continue
+            regressed = (change < 0) == higher_is_better
+            worse += regressed
+            print(
+                "%-12s %-10s %-28s %12s -> %-12s %+6.1f%%%s"
+                % (
+                    r["target"],
+                    r["workload"],
+                    ".".join(path),
+                    old_v,
+                    new_v,
+                    change * 100,
+                    "  worse" if regressed else "",
+                ),
+                file=out,
+            )
+    return worse
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(
+        description="Replay synthetic knob traces through the sketches and "
+        "display drivers on the simulated board."
+    )
+    p.add_argument(
+        "-t",
+        "--target",
+        action="append",
+        choices=sorted(TARGETS),
+        help="target to run (repeatable; default: all)",
+    )
+    p.add_argument(
+        "-w",
+        "--workload",
+        action="append",
+        choices=sorted(WORKLOADS),
+        help="workload to run (repeatable; default: all)",
+    )
+    p.add_argument("--quick", action="store_true", help="a tenth of every workload")
+    p.add_argument("--scale", type=float, default=1.0, help="workload length factor")
+    p.add_argument("--no-heap", action="store_true", help="skip the heap pass")
+    p.add_argument("-o", "--output", default="benchmark.json", help="JSON report")
+    p.add_argument("--baseline", help="earlier JSON report to compare against")
+    p.add_argument(
+        "--threshold",
+        type=float,
+        default=THRESHOLD,
+        help="relative change reported against the baseline",
+    )
+    args = p.parse_args(argv)
+
+    scale = args.scale * (0.1 if args.quick else 1.0)
+    targets = args.target or list(TARGETS)
+    workloads = args.workload or list(WORKLOADS)
+    results = []
+    for name in targets:
+        for workload in workloads:
+            print("%s / %s ..." % (name, workload), file=sys.stderr)
+            results.append(run_one(TARGETS[name], workload, scale, not args.no_heap))
+
+    report = {
+        "schema": SCHEMA,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(
+            timespec="seconds"
+        ),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "revision": _git_revision(),
+        "scale": scale,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=1)
+        f.write("\n")
+    print_table(results)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print()
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,296 @@
+# Export saved sketches (.psk stroke files) as PBM, BMP or PNG images
+#
+# Runs on the host under CPython:
+#
+#   python tools/export_sketches.py sk0001.psk
+#   python tools/export_sketches.py -f bmp --scale 4 --crop -o out/ sketches/
+#
+# Stroke files are streamed, never loaded whole. Points are rasterised
+# into a 1bpp band of rows at the sketch's native size (its DRAW_W x
+# DRAW_H) and written out row by row, scaled up on the way. A sketch
+# taller than one band is read once per band. The --crop bounding box is
+# tracked during the first read, so each file costs a read or two plus
+# its output.
+import argparse
+import os
+import struct
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from chaincode import read_header, stroke_points  # noqa: E402
+
+FORMATS = ("png", "bmp", "pbm")
+# Largest native band kept in memory; 1 MiB is 8 Mpixels.
+MAX_BAND_BYTES = 1 << 20
+PNG_IDAT_BYTES = 1 << 16
+
+_expand_tables = {}
+
+
+def _points(path):
+    with open(path, "rb") as f:
+        read_header(f)
+        yield from stroke_points(f)
+
+
+def _expand_table(scale):
+    # Byte -> int with every bit repeated scale times, MSB first.
+    table = _expand_tables.get(scale)
+    if table is None:
+        unit = (1 << scale) - 1
+        table = []
+        for b in range(256):
+            v = 0
+            for bit in range(7, -1, -1):
+                v = (v << scale) | (unit if b >> bit & 1 else 0)
+            table.append(v)
+        _expand_tables[scale] = table
+    return table
+
+
+def _scale_row(row, x0, w, scale):
+    # Cuts w pixels from x0 out of a packed row and widens each by scale.
+    # Returns the row packed MSB first and padded to a whole byte.
+    v = int.from_bytes(row, "big")
+    v = (v >> (len(row) * 8 - x0 - w)) & ((1 << w) - 1)
+    pad = -w % 8
+    src = (v << pad).to_bytes((w + pad) // 8, "big")
+    if scale == 1:
+        return src
+    table = _expand_table(scale)
+    bits = 8 * scale
+    out = 0
+    for b in src:
+        out = (out << bits) | table[b]
+    ow = w * scale
+    out >>= pad * scale
+    opad = -ow % 8
+    return (out << opad).to_bytes((ow + opad) // 8, "big")
+
+
+def _invert(row, w):
+    # Flips the first w bits of a packed row, leaving the padding zero.
+    pad = -w % 8
+    mask = ((1 << w) - 1) << pad
+    return (int.from_bytes(row, "big") ^ mask).to_bytes(len(row), "big")
+
+
+class PBMWriter:
+    # Binary PBM; a set bit is black.
+    def __init__(self, f, negative):
+        self.f = f
+        self.negative = negative
+
+    def begin(self, w, h):
+        self.w = w
+        self.f.write(b"P4\n%d %d\n" % (w, h))
+
+    def row(self, bits):
+        self.f.write(_invert(bits, self.w) if self.negative else bits)
+
+    def end(self):
+        pass
+
+
+class BMPWriter:
+    # 1bpp BMP stored top-down (negative height) so rows go out in order.
+    def __init__(self, f, negative):
+        self.f = f
+        self.negative = negative
+
+    def begin(self, w, h):
+        self.pad = b"\0" * (-((w + 7) // 8) % 4)
+        stride = (w + 7) // 8 + len(self.pad)
+        offset = 14 + 40 + 8
+        self.f.write(struct.pack("<2sIHHI", b"BM", offset + stride * h, 0, 0, offset))
+        self.f.write(
+            struct.pack(
+                "<IiiHHIIiiII", 40, w, -h, 1, 1, 0, stride * h, 2835, 2835, 2, 0
+            )
+        )
+        # Palette: index 0 is paper, 1 is ink.
+        if self.negative:
+            self.f.write(b"\0\0\0\0\xff\xff\xff\0")
+        else:
+            self.f.write(b"\xff\xff\xff\0\0\0\0\0")
+
+    def row(self, bits):
+        self.f.write(bits)
+        self.f.write(self.pad)
+
+    def end(self):
+        pass
+
+
+class PNGWriter:
+    # 1-bit greyscale PNG, deflated as the rows arrive.
+    def __init__(self, f, negative):
+        self.f = f
+        self.negative = negative
+
+    def _chunk(self, kind, data):
+        self.f.write(struct.pack(">I", len(data)))
+        self.f.write(kind)
+        self.f.write(data)
+        self.f.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind))))
+
+    def begin(self, w, h):
+        self.w = w
+        self.z = zlib.compressobj(9)
+        self.pending = bytearray()
+        self.f.write(b"\x89PNG\r\n\x1a\n")
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 1, 0, 0, 0, 0))
+
+    def row(self, bits):
+        # Grey 0 is black, so ink bits are flipped unless drawing negative.
+        if not self.negative:
+            bits = _invert(bits, self.w)
+        self.pending += self.z.compress(b"\0" + bits)
+        if len(self.pending) >= PNG_IDAT_BYTES:
+            self._chunk(b"IDAT", bytes(self.pending))
+            self.pending = bytearray()
+
+    def end(self):
+        self.pending += self.z.flush()
+        self._chunk(b"IDAT", bytes(self.pending))
+        self._chunk(b"IEND", b"")
+
+
+WRITERS = {"png": PNGWriter, "bmp": BMPWriter, "pbm": PBMWriter}
+
+
+def _rasterise(path, band, stride, y0, rows):
+    band[:] = bytes(len(band))
+    y1 = y0 + rows
+    for x, y, _ in _points(path):
+        if y0 <= y < y1 and x < stride * 8:
+            band[(y - y0) * stride + (x >> 3)] |= 0x80 >> (x & 7)
+
+
+def export(
+    path,
+    out_path,
+    fmt="png",
+    scale=1,
+    crop=False,
+    margin=0,
+    negative=False,
+    max_band_bytes=MAX_BAND_BYTES,
+):
+    # Writes one image and returns (out_path, (x, y, w, h)) of the region
+    # exported, in native pixels.
+    with open(path, "rb") as f:
+        width, height = read_header(f)
+    stride = (width + 7) // 8
+    rows = max(1, min(height, max_band_bytes // stride))
+    band = bytearray(stride * rows)
+
+    # First read: the bounding box, rasterising the first band meanwhile.
+    x0 = width
+    y0 = height
+    x1 = -1
+    y1 = -1
+    for x, y, _ in _points(path):
+        if x >= width or y >= height:
+            continue
+        if x < x0:
+            x0 = x
+        if x > x1:
+            x1 = x
+        if y < y0:
+            y0 = y
+        if y > y1:
+            y1 = y
+        if y < rows:
+            band[y * stride + (x >> 3)] |= 0x80 >> (x & 7)
+
+    if not crop:
+        cx, cy, cw, ch = 0, 0, width, height
+    elif x1 < 0:
+        # Nothing drawn: a single pixel of paper.
+        cx, cy, cw, ch = 0, 0, 1, 1
+    else:
+        cx = max(0, x0 - margin)
+        cy = max(0, y0 - margin)
+        cw = min(width, x1 + 1 + margin) - cx
+        ch = min(height, y1 + 1 + margin) - cy
+
+    band_y = 0
+    with open(out_path, "wb") as out:
+        writer = WRITERS[fmt](out, negative)
+        writer.begin(cw * scale, ch * scale)
+        for y in range(cy, cy + ch):
+            if y >= band_y + rows:
+                band_y = y
+                _rasterise(path, band, stride, band_y, rows)
+            at = (y - band_y) * stride
+            bits = _scale_row(band[at : at + stride], cx, cw, scale)
+            for _ in range(scale):
+                writer.row(bits)
+        writer.end()
+    return out_path, (cx, cy, cw, ch)
+
+
+def _export_job(job):
+    path, out_path, options = job
+    return export(path, out_path, **options)
+
+
+def _collect(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(".psk"):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Export .psk sketches as images.")
+    p.add_argument("paths", nargs="+", help="stroke files or directories of them")
+    p.add_argument("-f", "--format", choices=FORMATS, default="png")
+    p.add_argument("-s", "--scale", type=int, default=1, help="integer upscale")
+    p.add_argument("--crop", action="store_true", help="crop to the drawing")
+    p.add_argument("--margin", type=int, default=0, help="pixels kept around a crop")
+    p.add_argument(
+        "--negative", action="store_true", help="white ink on black, as on the displays"
+    )
+    p.add_argument("-o", "--out", help="output directory (default: next to input)")
+    p.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1)
+    args = p.parse_args(argv)
+    if args.scale < 1:
+        p.error("--scale must be at least 1")
+
+    options = {
+        "fmt": args.format,
+        "scale": args.scale,
+        "crop": args.crop,
+        "margin": args.margin,
+        "negative": args.negative,
+    }
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+    jobs = []
+    for path in _collect(args.paths):
+        name = os.path.splitext(os.path.basename(path))[0] + "." + args.format
+        out_dir = args.out or os.path.dirname(path)
+        jobs.append((path, os.path.join(out_dir, name), options))
+
+    if len(jobs) > 1 and args.jobs > 1:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            results = pool.map(_export_job, jobs, chunksize=4)
+            for out_path, region in results:
+                print(out_path, "%dx%d at %d,%d" % (region[2], region[3], *region[:2]))
+    else:
+        for job in jobs:
+            out_path, region = _export_job(job)
+            print(out_path, "%dx%d at %d,%d" % (region[2], region[3], *region[:2]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())